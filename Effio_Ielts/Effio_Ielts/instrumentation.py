@@ -0,0 +1,240 @@
+"""
+Per-request latency and database instrumentation.
+
+``RequestMetricsMiddleware`` times every request and, through an execute
+wrapper installed on every database connection, counts its database queries
+and the time spent in them. The running request's ``QueryTimer`` is held in a
+context variable, so queries made from ``sync_to_async`` threads under ASGI
+are counted too. Each response carries a ``Server-Timing`` header, requests
+slower than ``SLOW_REQUEST_THRESHOLD_MS`` are logged as structured records,
+and every request is folded into an in-process rolling histogram per URL
+name, served to staff by ``request_metrics``.
+
+The bookkeeping is a few ``perf_counter`` calls per request and query plus
+one locked dict update, so the middleware is meant to stay enabled.
+"""
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+
+logger = logging.getLogger('Effio_Ielts.requests')
+
+# Upper bounds (ms) of the latency histogram buckets; slower requests land in the last one
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class RollingHistogram:
+    """
+    Latency histograms per URL name over a sliding time window.
+
+    The window is split into fixed slots; observations go into the current
+    slot and whole slots expire once they fall out of the window.
+    """
+
+    def __init__(self, window_seconds=900, slot_seconds=60):
+        self.window_seconds = window_seconds
+        self.slot_seconds = slot_seconds
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _new_stats(self):
+        return {
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'queries': 0,
+            'db_ms': 0.0,
+            'buckets': [0] * (len(BUCKETS_MS) + 1),
+        }
+
+    def observe(self, name, duration_ms, queries, db_ms):
+        slot = int(time.time() // self.slot_seconds)
+        bucket = next((i for i, bound in enumerate(BUCKETS_MS) if duration_ms <= bound), len(BUCKETS_MS))
+        with self._lock:
+            views = self._slots.get(slot)
+            if views is None:
+                views = self._slots[slot] = {}
+                oldest = slot - self.window_seconds // self.slot_seconds
+                for expired in [key for key in self._slots if key <= oldest]:
+                    del self._slots[expired]
+            stats = views.get(name)
+            if stats is None:
+                stats = views[name] = self._new_stats()
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['queries'] += queries
+            stats['db_ms'] += db_ms
+            stats['buckets'][bucket] += 1
+
+    def snapshot(self):
+        """Merged stats per URL name over the window, with bucket-estimated percentiles."""
+        oldest = int(time.time() // self.slot_seconds) - self.window_seconds // self.slot_seconds
+        merged = {}
+        with self._lock:
+            for slot, views in self._slots.items():
+                if slot <= oldest:
+                    continue
+                for name, stats in views.items():
+                    total = merged.setdefault(name, self._new_stats())
+                    total['count'] += stats['count']
+                    total['total_ms'] += stats['total_ms']
+                    total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+                    total['queries'] += stats['queries']
+                    total['db_ms'] += stats['db_ms']
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+
+        result = {}
+        for name, stats in sorted(merged.items()):
+            count = stats['count']
+            result[name] = {
+                'count': count,
+                'mean_ms': round(stats['total_ms'] / count, 2),
+                'p50_ms': self._quantile(stats, 0.5),
+                'p95_ms': self._quantile(stats, 0.95),
+                'p99_ms': self._quantile(stats, 0.99),
+                'max_ms': round(stats['max_ms'], 2),
+                'mean_queries': round(stats['queries'] / count, 2),
+                'mean_db_ms': round(stats['db_ms'] / count, 2),
+                'buckets': {
+                    f'le_{bound}' if bound is not None else 'inf': value
+                    for bound, value in zip((*BUCKETS_MS, None), stats['buckets'])
+                },
+            }
+        return result
+
+    @staticmethod
+    def _quantile(stats, fraction):
+        """Upper bound of the bucket holding the quantile (the max for the overflow bucket)."""
+        target = fraction * stats['count']
+        seen = 0
+        for bound, value in zip(BUCKETS_MS, stats['buckets']):
+            seen += value
+            if seen >= target:
+                return min(bound, round(stats['max_ms'], 2))
+        return round(stats['max_ms'], 2)
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+
+
+histogram = RollingHistogram(window_seconds=getattr(settings, 'REQUEST_METRICS_WINDOW_SECONDS', 900))
+
+
+class QueryTimer:
+    """Query count and total query duration of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+_current_timer = ContextVar('request_query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query to the running request's ``QueryTimer``, if any."""
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - started
+        timer.count += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+# Connections opened from now on, in any thread, get the wrapper on connect
+connection_created.connect(install_query_timer)
+
+
+class RequestMetricsMiddleware:
+    """Time each request and its database work; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections of this thread may predate the connection_created hook
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        timer = QueryTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.finish(request, response, timer, started)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = _current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.finish(request, response, timer, started)
+
+    def finish(self, request, response, timer, started):
+        duration_ms = (time.perf_counter() - started) * 1000
+        db_ms = timer.duration * 1000
+
+        match = request.resolver_match
+        name = match.view_name if match is not None else '<unresolved>'
+        histogram.observe(name, duration_ms, timer.count, db_ms)
+
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = (
+                f'app;dur={duration_ms:.1f}, db;dur={db_ms:.1f};desc="{timer.count} queries"'
+            )
+
+        if duration_ms >= getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500):
+            # Only read a user that authentication already loaded; never query for it here
+            user = getattr(request, '_cached_user', None) or getattr(request, '_acached_user', None)
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'view': name,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 1),
+                'queries': timer.count,
+                'db_ms': round(db_ms, 1),
+                'user_id': getattr(user, 'pk', None),
+            }))
+        return response
+
+
+# Rolling latency histograms of this worker process, for monitoring
+@staff_member_required
+def request_metrics(request):
+    return JsonResponse({
+        'window_seconds': histogram.window_seconds,
+        'buckets_ms': BUCKETS_MS,
+        'views': histogram.snapshot(),
+    })
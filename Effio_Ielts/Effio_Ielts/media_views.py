@@ -1,57 +1,218 @@
 """
 Media file serving utilities for production deployment.
+
+Files are streamed in chunks instead of being read into memory, with support
+for HTTP Range requests (so audio players can seek), ETag/Last-Modified
+conditional requests and optional X-Sendfile / X-Accel-Redirect offloading
+to the front web server.
+
+Content-addressed paths never change, so they are cached by browsers for a
+year without revalidation: ``hashed/<digest>/<name>`` aliases of uploads
+(see ``Quizzes.media_manifest``) and resized image derivatives (see
+``Quizzes.images``).
 """
 import os
-from django.http import HttpResponse, Http404
+import re
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, Http404, StreamingHttpResponse
 from django.conf import settings
+from django.utils.http import http_date, parse_http_date_safe
 from django.views.decorators.http import require_http_methods
-from django.views.decorators.cache import cache_control
 import mimetypes
 
+from Quizzes.images import DERIVATIVE_ROOT
+from Quizzes.media_manifest import HASHED_PREFIX, resolve_hashed
 
-@require_http_methods(["GET", "HEAD"])
-@cache_control(max_age=3600)  # Cache for 1 hour
-def serve_media(request, path):
-    """
-    Serve media files in production when DEBUG=False.
-    This is a simple solution for small-scale applications.
-    For larger applications, consider using a CDN or dedicated media server.
-    """
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def resolve_media_path(path):
+    """Absolute path of a media file, raising Http404 for anything outside MEDIA_ROOT."""
     # Security: Prevent directory traversal
     if '..' in path or path.startswith('/'):
         raise Http404("Invalid path")
-    
+
     # Construct full file path
     file_path = os.path.join(settings.MEDIA_ROOT, path)
-    
+
     # Check if file exists
     if not os.path.exists(file_path) or not os.path.isfile(file_path):
         raise Http404("Media file not found")
-    
+
     # Security: Ensure file is within MEDIA_ROOT
     if not os.path.abspath(file_path).startswith(os.path.abspath(settings.MEDIA_ROOT)):
         raise Http404("Access denied")
-    
+
+    return file_path
+
+
+def file_etag(stat):
+    """Strong validator built from modification time and size."""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def etag_matches(header, etag):
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
+
+
+def is_not_modified(request, etag, mtime):
+    """Evaluate If-None-Match / If-Modified-Since for a GET or HEAD request."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+
+    Returns ``(start, end)`` inclusive, None when the header should be
+    ignored (absent, malformed or multi-range) and ``False`` when the range
+    cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # Suffix range: the final N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def range_applies(request, etag, mtime):
+    """An If-Range precondition that no longer matches turns a range request into a full one."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range.strip() == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(mtime) <= if_range_date
+
+
+def iter_file_range(file_path, start, length):
+    """Yield ``length`` bytes of the file from ``start`` in CHUNK_SIZE pieces."""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def offload_response(path, file_path, content_type):
+    """Hand the file to the front server through X-Sendfile or X-Accel-Redirect, or None."""
+    mode = getattr(settings, 'MEDIA_SENDFILE_MODE', '')
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = os.path.abspath(file_path)
+        return response
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + path
+        return response
+    return None
+
+
+def cache_control_header(path, content_type):
+    if path.startswith(f'{HASHED_PREFIX}/') or path.startswith(f'{DERIVATIVE_ROOT}/'):
+        return IMMUTABLE_CACHE_CONTROL
+    if content_type.startswith('image/'):
+        return 'public, max-age=86400'  # Cache images for 24 hours
+    return 'max-age=3600'  # Cache for 1 hour
+
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """
+    Serve media files in production when DEBUG=False.
+    Bytes are streamed (or offloaded to the web server) rather than read
+    into memory, so large listening tracks are cheap to serve and seekable.
+    Hashed paths are served from the file they alias, and only while the
+    manifest holds that digest for it.
+    For larger applications, consider using a CDN or dedicated media server.
+    """
+    name = path
+    if path.startswith(f'{HASHED_PREFIX}/'):
+        name = resolve_hashed(path)
+        if name is None:
+            raise Http404("Unknown media version")
+    file_path = resolve_media_path(name)
+
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        raise Http404("Cannot read media file")
+
+    etag = file_etag(stat)
+    last_modified = http_date(stat.st_mtime)
+
     # Determine content type
     content_type, _ = mimetypes.guess_type(file_path)
     if content_type is None:
         content_type = 'application/octet-stream'
-    
-    # Read and serve file
-    try:
-        # For HEAD requests, don't read the file content
-        if request.method == 'HEAD':
-            response = HttpResponse(content_type=content_type)
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = offload_response(name, file_path, content_type)
+
+    if response is None:
+        byte_range = None
+        if range_applies(request, etag, stat.st_mtime):
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416, content_type=content_type)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            if request.method == 'HEAD':
+                response = HttpResponse(status=206, content_type=content_type)
+            else:
+                response = StreamingHttpResponse(
+                    iter_file_range(file_path, start, length),
+                    status=206,
+                    content_type=content_type
+                )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = length
         else:
-            with open(file_path, 'rb') as f:
-                response = HttpResponse(f.read(), content_type=content_type)
-            
-        # Add appropriate headers
-        response['Content-Length'] = os.path.getsize(file_path)
-        if content_type.startswith('image/'):
-            response['Cache-Control'] = 'public, max-age=86400'  # Cache images for 24 hours
-            
-        return response
-        
-    except IOError:
-        raise Http404("Cannot read media file")
\ No newline at end of file
+            # For HEAD requests, don't open the file
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=content_type)
+            else:
+                try:
+                    response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+                except IOError:
+                    raise Http404("Cannot read media file")
+            response['Content-Length'] = stat.st_size
+
+        response['Accept-Ranges'] = 'bytes'
+
+    # Add appropriate headers
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = cache_control_header(path, content_type)
+
+    return response
@@ -60,6 +60,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
+    'Effio_Ielts.instrumentation.RequestMetricsMiddleware',  # Server-Timing, slow request log, /metrics/
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -118,6 +119,52 @@ else:
     }
 
 
+# Cache
+# Set CACHE_URL to redis://host:6379/0 (requires the `redis` package),
+# db://table_name (after `python manage.py createcachetable`) or
+# file:///path/to/cache/dir (one host only) to share the cache between workers.
+# Without it each process caches in local memory, and cache invalidation only
+# reaches the process that saved the change: other workers serve stale pages
+# for up to CACHE_TIMEOUT. So with several workers (WEB_CONCURRENCY > 1, as
+# read by gunicorn) the database cache is used instead.
+CACHE_URL = config('CACHE_URL', default='')
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+if not CACHE_URL and WEB_CONCURRENCY > 1:
+    CACHE_URL = 'db://effio_cache'
+
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith('db://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': CACHE_URL[len('db://'):],
+        }
+    }
+elif CACHE_URL.startswith('file://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_URL[len('file://'):],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'effio-ielts',
+        }
+    }
+
+# Seconds cached pages and fragments live before they are rebuilt
+CACHE_TIMEOUT = config('CACHE_TIMEOUT', default=600, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -197,11 +244,62 @@ else:
     WHITENOISE_AUTOREFRESH = True
     WHITENOISE_SKIP_COMPRESS_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp', 'zip', 'gz', 'tgz', 'bz2', 'tbz', 'xz', 'br']
 
+# Media serving when DEBUG=False (Effio_Ielts.media_views.serve_media)
+# Set to 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect' (nginx) to let the
+# front web server send media bytes; nginx maps MEDIA_ACCEL_REDIRECT_PREFIX to MEDIA_ROOT
+MEDIA_SENDFILE_MODE = config('MEDIA_SENDFILE_MODE', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+
+# Resized WebP/JPEG derivatives of uploaded images (Quizzes.images), offered
+# through srcset when Cloudinary is off; widths are in pixels. They are created
+# by `python manage.py generate_image_derivatives` (--loop as a worker, and
+# --rebuild after changing the widths)
+IMAGE_DERIVATIVE_WIDTHS = config(
+    'IMAGE_DERIVATIVE_WIDTHS',
+    default='160,320,640,1024',
+    cast=lambda v: [int(s) for s in v.split(',') if s.strip()]
+)
+IMAGE_DERIVATIVE_QUALITY = config('IMAGE_DERIVATIVE_QUALITY', default=80, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Choice votes and quiz statistics are counted in this many shards per choice
+# (or quiz) and folded into Choice.votes by `python manage.py fold_choice_votes`
+# and into QuizStats by `python manage.py fold_quiz_stats`; rank histograms use
+# as many shards per score, summed when ranks are read
+VOTE_COUNTER_SHARDS = config('VOTE_COUNTER_SHARDS', default=8, cast=int)
+
+# Quiz analytics pages are served from snapshots refreshed by
+# `python manage.py refresh_analytics_snapshots`; attempts younger than this
+# are left for the next refresh
+ANALYTICS_SNAPSHOT_SETTLE_SECONDS = config('ANALYTICS_SNAPSHOT_SETTLE_SECONDS', default=5, cast=int)
+# Per-question answer time percentiles scan every timed answer of a quiz, so
+# refreshes recompute them at most this often (in seconds)
+ANALYTICS_QUESTION_TIMES_INTERVAL = config('ANALYTICS_QUESTION_TIMES_INTERVAL', default=3600, cast=int)
+
+# Keep per-user dashboard totals in UserQuizRollup rows updated on grading;
+# when disabled the dashboard aggregates the user's attempts on every visit
+USER_QUIZ_ROLLUPS = config('USER_QUIZ_ROLLUPS', default=True, cast=bool)
+
+# Quizzes opened but not seen (opened or autosaved) for this many hours are
+# abandoned: reopening one starts it over, and `python manage.py
+# sweep_in_progress_attempts` deletes them
+IN_PROGRESS_IDLE_HOURS = config('IN_PROGRESS_IDLE_HOURS', default=24, cast=float)
+
+# Grade submissions synchronously but queue their QuizAnswer rows and choice
+# votes for `python manage.py run_answer_worker`, which writes them in batches
+DEFERRED_ANSWER_WRITES = config('DEFERRED_ANSWER_WRITES', default=False, cast=bool)
+
+# Request instrumentation (Effio_Ielts.instrumentation.RequestMetricsMiddleware)
+# Requests slower than the threshold are logged to the 'Effio_Ielts.requests' logger;
+# /metrics/ shows per-view latency histograms over the last window to staff
+SLOW_REQUEST_THRESHOLD_MS = config('SLOW_REQUEST_THRESHOLD_MS', default=500, cast=int)
+REQUEST_METRICS_WINDOW_SECONDS = config('REQUEST_METRICS_WINDOW_SECONDS', default=900, cast=int)
+SERVER_TIMING_HEADER = config('SERVER_TIMING_HEADER', default=True, cast=bool)
+
 # Authentication settings
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
@@ -285,5 +383,10 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'Effio_Ielts.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
@@ -18,13 +18,19 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from . import media_views
+from . import instrumentation, media_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('Homepage.urls')),
     path('quizzes/', include('Quizzes.urls')),
     path('accounts/', include('allauth.urls')),  # Add authentication URLs
+    path('metrics/', instrumentation.request_metrics, name='request_metrics'),  # Staff only
+]
+
+# Content-hashed media aliases are always resolved by the media view
+urlpatterns += [
+    re_path(r'^media/(?P<path>hashed/.*)$', media_views.serve_media, name='hashed_media'),
 ]
 
 # Serve media files
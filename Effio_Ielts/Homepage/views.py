@@ -1,11 +1,13 @@
 from django.shortcuts import render
 from Quizzes.models import Quiz
+from Quizzes.caching import cache_anonymous_page
 
 # Create your views here.
 
+@cache_anonymous_page('home')
 def home(request):
     # Get featured quizzes for homepage (latest 3)
-    featured_quizzes = Quiz.objects.all()[:3]
+    featured_quizzes = Quiz.objects.with_card_data()[:3]
     
     context = {
         'featured_quizzes': featured_quizzes,
@@ -1,7 +1,27 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from .bundles import FORMATS, export_bundle, guess_format, import_bundle, open_text
 from .models import Quiz, Question, Choice, QuizAttempt, QuizAnswer
+from .pagination import EstimatedCountPaginator
 
 # Register your models here.
+# Computed columns come from get_queryset annotations and list_select_related,
+# so every changelist page loads in a fixed number of queries.
+
+class QuizImportForm(forms.Form):
+    bundle = forms.FileField(help_text="JSON Lines (.jsonl) or CSV (.csv) bundle, see Quizzes/bundles.py")
+    format = forms.ChoiceField(
+        choices=[('', 'From file extension')] + [(fmt, fmt.upper()) for fmt in FORMATS],
+        required=False
+    )
+    dry_run = forms.BooleanField(required=False, help_text="Only validate the bundle")
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
@@ -9,10 +29,63 @@ class QuizAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'due_date')
     search_fields = ('title', 'description')
     readonly_fields = ('created_at', 'updated_at')
+    actions = ['export_jsonl', 'export_csv']
+    change_list_template = 'admin/Quizzes/quiz/change_list.html'  # Adds the import button
+    
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='Quizzes_quiz_import'),
+        ] + super().get_urls()
+    
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:Quizzes_quiz_changelist')
+        
+        form = QuizImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['bundle']
+            fmt = form.cleaned_data['format'] or guess_format(upload.name)
+            result = import_bundle(open_text(upload.file, fmt), fmt, dry_run=form.cleaned_data['dry_run'])
+            for error in result['errors'][:20]:
+                messages.error(request, error)
+            verb = 'Validated' if form.cleaned_data['dry_run'] else 'Imported'
+            messages.success(request, f"{verb} {result['quizzes']} quizzes, {result['questions']} questions and "
+                                      f"{result['choices']} choices ({len(result['errors'])} skipped)")
+            return redirect('admin:Quizzes_quiz_changelist')
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import quizzes',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/Quizzes/quiz/import.html', context)
+    
+    def export(self, queryset, fmt):
+        response = StreamingHttpResponse(
+            export_bundle(queryset, fmt),
+            content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        )
+        filename = f"quizzes-{timezone.now():%Y%m%d-%H%M}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    @admin.action(description="Export selected quizzes (JSON Lines)")
+    def export_jsonl(self, request, queryset):
+        return self.export(queryset, 'jsonl')
+    
+    @admin.action(description="Export selected quizzes (CSV)")
+    def export_csv(self, request, queryset):
+        return self.export(queryset, 'csv')
+    
+    def get_queryset(self, request):
+        # Attempt columns read the folded stats plus unfolded shards, annotated in the same query
+        return super().get_queryset(request).with_stats()
     
     def total_attempts(self, obj):
         return obj.get_total_attempts()
     total_attempts.short_description = "Total Attempts"
+    total_attempts.admin_order_field = 'attempt_count'
     
     def avg_score(self, obj):
         return f"{obj.get_average_score():.1f}%"
@@ -23,13 +96,27 @@ class QuestionAdmin(admin.ModelAdmin):
     list_display = ('text_preview', 'quiz', 'question_type', 'created_at', 'success_rate')
     list_filter = ('quiz', 'question_type', 'created_at')
     search_fields = ('text',)
+    list_select_related = ('quiz',)
+    
+    def get_queryset(self, request):
+        # Correlated subqueries only run for the rows of the current page
+        answers = QuizAnswer.objects.filter(question=OuterRef('pk')).order_by().values('question')
+        return super().get_queryset(request).annotate(
+            answer_count=Coalesce(Subquery(answers.annotate(count=Count('pk')).values('count'), output_field=IntegerField()), 0),
+            correct_count=Coalesce(Subquery(
+                answers.filter(is_correct=True).annotate(count=Count('pk')).values('count'),
+                output_field=IntegerField()
+            ), 0)
+        )
     
     def text_preview(self, obj):
         return obj.text[:50] + "..." if len(obj.text) > 50 else obj.text
     text_preview.short_description = "Question Text"
     
     def success_rate(self, obj):
-        return f"{obj.get_success_rate():.1f}%"
+        if not obj.answer_count:
+            return "0.0%"
+        return f"{obj.correct_count / obj.answer_count * 100:.1f}%"
     success_rate.short_description = "Success Rate"
 
 @admin.register(Choice)
@@ -38,9 +125,20 @@ class ChoiceAdmin(admin.ModelAdmin):
     list_filter = ('is_correct', 'question__quiz')
     search_fields = ('text',)
     readonly_fields = ('votes',)  # Make votes read-only since it's auto-updated
+    list_select_related = ('question__quiz',)  # Question.__str__ shows the quiz title
+    
+    def get_queryset(self, request):
+        sibling_votes = Choice.objects.filter(question=OuterRef('question')).order_by().values('question').annotate(
+            total=Sum('votes')
+        ).values('total')
+        return super().get_queryset(request).annotate(
+            question_votes=Coalesce(Subquery(sibling_votes, output_field=IntegerField()), 0)
+        )
     
     def selection_percentage(self, obj):
-        return f"{obj.get_selection_percentage():.1f}%"
+        if not obj.question_votes:
+            return "0.0%"
+        return f"{obj.votes / obj.question_votes * 100:.1f}%"
     selection_percentage.short_description = "Selection %"
 
 @admin.register(QuizAttempt)
@@ -50,6 +148,9 @@ class QuizAttemptAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'quiz__title')
     readonly_fields = ('completed_at', 'performance_level_display', 'grade_letter')
     date_hierarchy = 'completed_at'
+    list_select_related = ('user', 'quiz')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skip the second COUNT(*) when filtering
     
     def performance_level_display(self, obj):
         return obj.performance_level
@@ -59,6 +160,9 @@ class QuizAnswerInline(admin.TabularInline):
     model = QuizAnswer
     extra = 0
     readonly_fields = ('question', 'selected_choice', 'is_correct')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('question', 'selected_choice__question')
 
 @admin.register(QuizAnswer)
 class QuizAnswerAdmin(admin.ModelAdmin):
@@ -66,6 +170,9 @@ class QuizAnswerAdmin(admin.ModelAdmin):
     list_filter = ('is_correct', 'attempt__quiz', 'attempt__completed_at')
     search_fields = ('attempt__user__username', 'question__text')
     readonly_fields = ('attempt', 'question', 'selected_choice', 'is_correct')
+    list_select_related = ('attempt__user', 'question', 'selected_choice__question')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skip the second COUNT(*) when filtering
     
     def attempt_user(self, obj):
         return obj.attempt.user.username
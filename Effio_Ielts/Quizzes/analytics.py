@@ -0,0 +1,318 @@
+"""
+Quiz analytics built from grouped aggregate queries.
+
+``collect_counts`` reduces a set of attempts and answers to plain, additive
+counters with a fixed number of grouped queries; ``build_analytics`` turns
+those counters into the context used by the analytics page. The query count
+does not depend on how many questions, choices or attempts a quiz has.
+
+Because the counters are additive, they are also materialized per quiz in
+``QuizAnalyticsSnapshot``: ``refresh_snapshot`` folds in only the attempts
+completed after the snapshot's watermark, so serving the page never scans
+the quiz's full answer history. Per-question answer time percentiles are not
+additive and cost a scan of every timed answer of the quiz, so the refresh
+recomputes them at most once per ``ANALYTICS_QUESTION_TIMES_INTERVAL``
+seconds, and only when attempts were folded in since the last computation.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Aggregate, Count, DurationField, F, IntegerField, Q, Sum, Value, Window
+from django.db.models.functions import Ceil, RowNumber
+from django.utils import timezone
+
+from .models import AnswerWriteJob, QuizAttempt, QuizAnswer, QuizAnalyticsSnapshot
+from .stats import PERFORMANCE_FILTERS
+
+# Width of the attempt duration histogram buckets used for median/p90 times
+TIME_BUCKET_SECONDS = 15
+# Percentiles of per-question answer times shown on the analytics page
+QUESTION_TIME_PERCENTILES = (0.5, 0.9)
+
+
+class PercentileDisc(Aggregate):
+    """PostgreSQL ``percentile_disc``: the first value whose cumulative share reaches ``fraction``."""
+    function = 'PERCENTILE_DISC'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = DurationField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def collect_counts(attempts, answers):
+    """
+    Aggregate attempts and answers into additive counters (four queries).
+
+    Returns a JSON-serializable dict with the attempt count, the score sum,
+    the attempt count per performance level, a histogram of attempt
+    durations, ``[total, correct]`` answer counts per question id and
+    selection counts per choice id. Ids are stored as strings.
+    """
+    attempts = attempts.order_by()
+    answers = answers.order_by()
+
+    summary = attempts.aggregate(
+        attempt_count=Count('id'),
+        score_sum=Sum('percentage_score'),
+        **{
+            level: Count('id', filter=condition)
+            for level, condition in PERFORMANCE_FILTERS.items()
+        }
+    )
+
+    time_histogram = Counter(
+        str(int(time_taken.total_seconds() // TIME_BUCKET_SECONDS))
+        for time_taken in attempts.filter(time_taken__isnull=False).values_list('time_taken', flat=True)
+    )
+
+    question_rows = answers.values('question_id').annotate(
+        total=Count('id'),
+        correct=Count('id', filter=Q(is_correct=True))
+    )
+    choice_rows = answers.filter(selected_choice__isnull=False).values(
+        'selected_choice_id'
+    ).annotate(selected=Count('id'))
+
+    return {
+        'attempt_count': summary.pop('attempt_count'),
+        'score_sum': float(summary.pop('score_sum') or 0),
+        'performance_distribution': summary,
+        'time_histogram': dict(time_histogram),
+        'questions': {str(row['question_id']): [row['total'], row['correct']] for row in question_rows},
+        'choices': {str(row['selected_choice_id']): row['selected'] for row in choice_rows},
+    }
+
+
+def question_time_percentiles(answers):
+    """
+    Median and 90th percentile answer time per question, computed by the database.
+
+    Uses nearest-rank percentiles in one query: ``percentile_disc`` grouped by
+    question on PostgreSQL, and on other databases a UNION of window function
+    queries, one per percentile, picking the row at rank
+    ``ceil(fraction * count)``.
+    Returns ``{question_id (str): [median_seconds, p90_seconds]}`` for the
+    questions with timed answers.
+    """
+    timed = answers.order_by().filter(time_taken__isnull=False)
+    results = {}
+
+    if connection.vendor == 'postgresql':
+        rows = timed.values('question_id').annotate(**{
+            f'p{index}': PercentileDisc('time_taken', fraction)
+            for index, fraction in enumerate(QUESTION_TIME_PERCENTILES)
+        })
+        for row in rows:
+            results[str(row['question_id'])] = [
+                row[f'p{index}'].total_seconds() for index in range(len(QUESTION_TIME_PERCENTILES))
+            ]
+        return results
+
+    ranked = timed.annotate(
+        position=Window(RowNumber(), partition_by=[F('question_id')], order_by=[F('time_taken').asc(), F('id').asc()]),
+        timed_count=Window(Count('id'), partition_by=[F('question_id')]),
+    )
+    picks = [
+        ranked.filter(position=Ceil(F('timed_count') * Value(fraction))).annotate(
+            percentile=Value(index, output_field=IntegerField())
+        ).values_list('percentile', 'question_id', 'time_taken')
+        for index, fraction in enumerate(QUESTION_TIME_PERCENTILES)
+    ]
+    for index, question_id, time_taken in picks[0].union(*picks[1:], all=True):
+        results.setdefault(str(question_id), [None] * len(QUESTION_TIME_PERCENTILES))[index] = time_taken.total_seconds()
+    return results
+
+
+def collect_quiz_counts(quiz):
+    """Counters over every attempt and answer of the quiz."""
+    return collect_counts(
+        QuizAttempt.objects.filter(quiz=quiz),
+        QuizAnswer.objects.filter(question__quiz=quiz)
+    )
+
+
+def merge_counts(base, extra):
+    """Add the counters of ``extra`` into ``base`` (both as returned by ``collect_counts``)."""
+    if not base:
+        return extra
+
+    merged = {
+        'attempt_count': base['attempt_count'] + extra['attempt_count'],
+        'score_sum': base['score_sum'] + extra['score_sum'],
+        'performance_distribution': dict(
+            Counter(base['performance_distribution']) + Counter(extra['performance_distribution'])
+        ),
+        'time_histogram': dict(Counter(base['time_histogram']) + Counter(extra['time_histogram'])),
+        'choices': dict(Counter(base['choices']) + Counter(extra['choices'])),
+        'questions': dict(base['questions']),
+    }
+    # Counter addition drops zero counts, keep every performance level present
+    for level in PERFORMANCE_FILTERS:
+        merged['performance_distribution'].setdefault(level, 0)
+    for question_id, (total, correct) in extra['questions'].items():
+        previous_total, previous_correct = merged['questions'].get(question_id, (0, 0))
+        merged['questions'][question_id] = [previous_total + total, previous_correct + correct]
+    return merged
+
+
+def histogram_quantile(histogram, fraction):
+    """Upper bound of the duration bucket holding the given quantile, or None without data."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= fraction * total:
+            return timedelta(seconds=(int(bucket) + 1) * TIME_BUCKET_SECONDS)
+
+
+def percentage(part, whole):
+    return round(part / whole * 100, 1) if whole else 0
+
+
+def build_analytics(quiz, counts, question_times=None):
+    """
+    Build the analytics page context from counters (two queries).
+
+    The quiz's questions and choices are loaded once for their texts; all
+    numbers come from ``counts`` and ``question_times`` (as returned by
+    ``question_time_percentiles``).
+    """
+    question_times = question_times or {}
+    questions_data = []
+    for question in quiz.questions.prefetch_related('choices'):
+        total_answers, correct_answers = counts['questions'].get(str(question.id), (0, 0))
+
+        # Get choice distribution
+        choices_data = []
+        for choice in question.choices.all():
+            choice_count = counts['choices'].get(str(choice.id), 0)
+            choices_data.append({
+                'text': choice.text,
+                'count': choice_count,
+                'percentage': percentage(choice_count, total_answers),
+                'is_correct': choice.is_correct
+            })
+
+        median_seconds, p90_seconds = question_times.get(str(question.id), (None, None))
+        questions_data.append({
+            'question': question,
+            'success_rate': percentage(correct_answers, total_answers),
+            'total_answers': total_answers,
+            'median_time': timedelta(seconds=median_seconds) if median_seconds is not None else None,
+            'p90_time': timedelta(seconds=p90_seconds) if p90_seconds is not None else None,
+            'choices': choices_data
+        })
+
+    total_attempts = counts['attempt_count']
+    avg_score = counts['score_sum'] / total_attempts if total_attempts else 0
+
+    return {
+        'quiz': quiz,
+        'total_attempts': total_attempts,
+        'avg_score': round(avg_score, 1),
+        'median_time': histogram_quantile(counts['time_histogram'], 0.5),
+        'p90_time': histogram_quantile(counts['time_histogram'], 0.9),
+        'questions_data': questions_data,
+        'performance_distribution': counts['performance_distribution']
+    }
+
+
+def pending_attempts(snapshot):
+    """Attempts of the snapshot's quiz completed after its watermark, oldest first."""
+    attempts = QuizAttempt.objects.filter(quiz_id=snapshot.quiz_id)
+    if snapshot.watermark_at is not None:
+        attempts = attempts.filter(
+            Q(completed_at__gt=snapshot.watermark_at) |
+            Q(completed_at=snapshot.watermark_at, id__gt=snapshot.watermark_id)
+        )
+    # Leave just-finished attempts to the next refresh, so transactions that
+    # commit slightly out of order cannot slip behind the watermark
+    settle = timedelta(seconds=getattr(settings, 'ANALYTICS_SNAPSHOT_SETTLE_SECONDS', 5))
+    attempts = attempts.filter(completed_at__lte=timezone.now() - settle)
+    # Stop before the first attempt whose answers are still queued, so the
+    # watermark never passes it (see Quizzes.answer_queue)
+    queued = AnswerWriteJob.objects.filter(attempt__quiz_id=snapshot.quiz_id).order_by(
+        'attempt__completed_at', 'attempt_id'
+    ).values_list('attempt__completed_at', 'attempt_id').first()
+    if queued is not None:
+        attempts = attempts.filter(
+            Q(completed_at__lt=queued[0]) |
+            Q(completed_at=queued[0], id__lt=queued[1])
+        )
+    return attempts.order_by('completed_at', 'id')
+
+
+def question_times_interval():
+    return timedelta(seconds=getattr(settings, 'ANALYTICS_QUESTION_TIMES_INTERVAL', 3600))
+
+
+def question_times_due(snapshot, now=None):
+    """Whether the snapshot's percentiles miss folded attempts and are old enough to recompute."""
+    if snapshot.watermark_at is None or snapshot.question_times_watermark_id == snapshot.watermark_id:
+        return False
+    if snapshot.question_times_at is None:
+        return True
+    return snapshot.question_times_at <= (now or timezone.now()) - question_times_interval()
+
+
+def refresh_snapshot(quiz, batch_size=5000):
+    """
+    Fold attempts completed since the last refresh into the quiz's snapshot.
+
+    Works in batches of ``batch_size`` attempts, each in its own transaction
+    with the snapshot row locked, then recomputes the per-question answer
+    time percentiles when ``question_times_due``. Returns the snapshot and
+    the number of attempts folded.
+    """
+    folded = 0
+    while True:
+        with transaction.atomic():
+            snapshot, _ = QuizAnalyticsSnapshot.objects.select_for_update().get_or_create(quiz=quiz)
+            batch = list(pending_attempts(snapshot).values_list('id', 'completed_at')[:batch_size])
+
+            if batch:
+                attempt_ids = [attempt_id for attempt_id, _ in batch]
+                snapshot.counts = merge_counts(snapshot.counts, collect_counts(
+                    QuizAttempt.objects.filter(id__in=attempt_ids),
+                    QuizAnswer.objects.filter(attempt_id__in=attempt_ids)
+                ))
+                snapshot.watermark_id, snapshot.watermark_at = batch[-1]
+            elif not snapshot.counts:
+                snapshot.counts = collect_counts(QuizAttempt.objects.none(), QuizAnswer.objects.none())
+
+            snapshot.refreshed_at = timezone.now()
+            snapshot.save()
+
+        folded += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    if question_times_due(snapshot):
+        # Percentiles are not additive: recompute them over every folded attempt
+        snapshot.question_times = question_time_percentiles(QuizAnswer.objects.filter(
+            question__quiz=quiz,
+            attempt__completed_at__lte=snapshot.watermark_at
+        ))
+        snapshot.question_times_at = timezone.now()
+        snapshot.question_times_watermark_id = snapshot.watermark_id
+        QuizAnalyticsSnapshot.objects.filter(pk=snapshot.pk).update(
+            question_times=snapshot.question_times,
+            question_times_at=snapshot.question_times_at,
+            question_times_watermark_id=snapshot.question_times_watermark_id
+        )
+    return snapshot, folded
+
+
+def get_snapshot(quiz):
+    """The quiz's analytics snapshot, building it on first use."""
+    try:
+        return quiz.analytics_snapshot
+    except QuizAnalyticsSnapshot.DoesNotExist:
+        snapshot, _ = refresh_snapshot(quiz)
+        return snapshot
@@ -0,0 +1,91 @@
+"""
+Deferred writing of graded answers.
+
+With ``DEFERRED_ANSWER_WRITES`` enabled, grading still scores a submission
+and saves its ``QuizAttempt`` (with stats, rankings and rollups) right away,
+but instead of inserting one ``QuizAnswer`` row per question and counting
+choice votes it stores the answers as a single ``AnswerWriteJob`` row in the
+same transaction. ``drain_answer_jobs`` (run by ``manage.py
+run_answer_worker``) later writes the answers and votes of many attempts
+with one bulk INSERT and two vote statements per batch.
+
+Nothing is lost if either side crashes: the job is committed together with
+its attempt, and deleted in the same transaction that writes its answers.
+Workers lock jobs with ``SKIP LOCKED`` where supported, so several can run.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import AnswerWriteJob, Choice, Question, QuizAnswer
+from .votes import record_votes
+
+
+def deferred_writes_enabled():
+    return getattr(settings, 'DEFERRED_ANSWER_WRITES', False)
+
+
+def enqueue_answers(attempt, answers):
+    """Queue the unsaved ``QuizAnswer`` objects of a graded attempt."""
+    AnswerWriteJob.objects.create(attempt=attempt, answers=[
+        [
+            answer.question_id,
+            answer.selected_choice_id,
+            answer.is_correct,
+            answer.time_taken.total_seconds() if answer.time_taken is not None else None,
+        ]
+        for answer in answers
+    ])
+
+
+def is_pending(attempt):
+    """Whether the attempt's answers are still waiting for the worker."""
+    return AnswerWriteJob.objects.filter(attempt_id=attempt.id).exists()
+
+
+@transaction.atomic
+def drain_answer_jobs(batch_size=500):
+    """
+    Write the answers and votes of up to ``batch_size`` queued attempts.
+
+    Answers to questions (or choices) deleted since grading are dropped
+    (or left unselected). Returns ``(attempts, answers)`` written.
+    """
+    jobs = AnswerWriteJob.objects.select_for_update(
+        skip_locked=connection.features.has_select_for_update_skip_locked
+    ).order_by('id')[:batch_size]
+    jobs = list(jobs.values_list('id', 'attempt_id', 'answers'))
+    if not jobs:
+        return 0, 0
+
+    # Jobs queued before answer times were recorded have no fourth column
+    rows = [
+        (attempt_id, question_id, choice_id, is_correct, seconds[0] if seconds else None)
+        for _, attempt_id, answers in jobs
+        for question_id, choice_id, is_correct, *seconds in answers
+    ]
+    question_ids = set(Question.objects.filter(
+        id__in={question_id for _, question_id, _, _, _ in rows}
+    ).values_list('id', flat=True))
+    choice_ids = set(Choice.objects.filter(
+        id__in={choice_id for _, _, choice_id, _, _ in rows if choice_id is not None}
+    ).values_list('id', flat=True))
+
+    answer_objs = [
+        QuizAnswer(
+            attempt_id=attempt_id,
+            question_id=question_id,
+            selected_choice_id=choice_id if choice_id in choice_ids else None,
+            is_correct=is_correct,
+            time_taken=timedelta(seconds=seconds) if seconds is not None else None
+        )
+        for attempt_id, question_id, choice_id, is_correct, seconds in rows
+        if question_id in question_ids
+    ]
+    # Conflicts are ignored so a job can never fail on answers that already exist
+    QuizAnswer.objects.bulk_create(answer_objs, batch_size=1000, ignore_conflicts=True)
+    record_votes(answer.selected_choice_id for answer in answer_objs if answer.selected_choice_id is not None)
+
+    AnswerWriteJob.objects.filter(id__in=[job_id for job_id, _, _ in jobs]).delete()
+    return len(jobs), len(answer_objs)
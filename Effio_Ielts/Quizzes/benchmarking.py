@@ -0,0 +1,189 @@
+"""
+Synthetic data and timing helpers for benchmarks.
+
+``seed_dataset`` fills the database with realistic volumes of users, quizzes,
+questions, choices, attempts and answers using bulk inserts, then rebuilds
+the derived stats, leaderboard and rollup tables. Everything it creates is tagged
+with ``BENCH_PREFIX`` so that ``clear_dataset`` can remove it again.
+"""
+import math
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import bump_catalog_version
+from .grading import calculate_percentage, load_answer_key
+from .models import Quiz, Question, Choice, QuizAttempt, QuizAnswer
+from .ranking import rebuild_rankings
+from .rollups import rebuild_user_rollups
+from .stats import rebuild_quiz_stats
+
+BENCH_PREFIX = 'bench'
+
+
+@transaction.atomic
+def seed_dataset(users=200, quizzes=20, questions=20, choices=4, attempts=100, batch_size=2000, seed=None):
+    """
+    Create a synthetic dataset and return the number of rows created per model.
+
+    Every quiz gets ``questions`` questions of ``choices`` choices each and
+    ``attempts`` graded attempts spread over the seeded users, each attempt
+    answering every question. Attempts are spaced an hour apart going back
+    from now, so completion times are distinct and history ordering is
+    meaningful.
+    """
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8]
+    password = make_password(None)
+
+    user_objs = User.objects.bulk_create([
+        User(username=f'{BENCH_PREFIX}_{run}_{number}', password=password)
+        for number in range(users)
+    ], batch_size=batch_size)
+    # Per-user probability of answering a question correctly
+    skill = {user.id: rng.uniform(0.3, 0.95) for user in user_objs}
+
+    quiz_objs = Quiz.objects.bulk_create([
+        Quiz(
+            title=f'[{BENCH_PREFIX}] Quiz {run}-{number}',
+            description='Synthetic benchmark quiz',
+            due_date=timezone.now() + timedelta(days=30)
+        )
+        for number in range(quizzes)
+    ], batch_size=batch_size)
+
+    question_objs = Question.objects.bulk_create([
+        Question(quiz=quiz, text=f'Question {number}')
+        for quiz in quiz_objs
+        for number in range(questions)
+    ], batch_size=batch_size)
+
+    choice_objs = []
+    answer_keys = {quiz.id: [] for quiz in quiz_objs}
+    for question in question_objs:
+        correct_index = rng.randrange(choices) if choices else None
+        question_choices = [
+            Choice(question=question, text=f'Choice {index}', is_correct=index == correct_index)
+            for index in range(choices)
+        ]
+        choice_objs.extend(question_choices)
+        answer_keys[question.quiz_id].append((question, question_choices))
+    Choice.objects.bulk_create(choice_objs, batch_size=batch_size)
+
+    now = timezone.now()
+    attempt_count = 0
+    answer_count = 0
+    pending = []
+
+    def flush():
+        nonlocal answer_count
+        QuizAttempt.objects.bulk_create([attempt for attempt, _ in pending], batch_size=batch_size)
+        answers = [
+            QuizAnswer(
+                attempt=attempt,
+                question=question,
+                selected_choice=choice,
+                is_correct=choice is not None and choice.is_correct
+            )
+            for attempt, selections in pending
+            for question, choice in selections
+        ]
+        QuizAnswer.objects.bulk_create(answers, batch_size=batch_size)
+        answer_count += len(answers)
+        pending.clear()
+
+    for quiz_index, quiz in enumerate(quiz_objs):
+        answer_key = answer_keys[quiz.id]
+        for number in range(attempts):
+            # Cycle through users so repeated (user, quiz) pairs are far apart
+            user = user_objs[(quiz_index + number) % len(user_objs)]
+            selections = []
+            score = 0
+            for question, question_choices in answer_key:
+                if not question_choices or rng.random() < 0.05:
+                    choice = None
+                elif rng.random() < skill[user.id]:
+                    choice = next(c for c in question_choices if c.is_correct)
+                else:
+                    choice = rng.choice(question_choices)
+                if choice is not None and choice.is_correct:
+                    score += 1
+                selections.append((question, choice))
+
+            time_taken = timedelta(seconds=rng.randint(300, 3300))
+            pending.append((QuizAttempt(
+                user=user,
+                quiz=quiz,
+                score=score,
+                total_questions=len(answer_key),
+                percentage_score=calculate_percentage(score, len(answer_key)),
+                time_taken=time_taken,
+                started_at=now - timedelta(hours=attempt_count + 1)
+            ), selections))
+            attempt_count += 1
+            if len(pending) * max(len(answer_key), 1) >= batch_size * 10:
+                flush()
+    if pending:
+        flush()
+
+    # completed_at is auto_now_add, so bulk_create stamped every row with the
+    # insertion time; derive the real completion time in one UPDATE
+    quiz_ids = [quiz.id for quiz in quiz_objs]
+    QuizAttempt.objects.filter(quiz_id__in=quiz_ids).update(completed_at=F('started_at') + F('time_taken'))
+
+    rebuild_quiz_stats(quiz_ids)
+    rebuild_rankings(quiz_ids)
+    rebuild_user_rollups([user.id for user in user_objs])
+    # Bulk inserts skip the signals that keep cached catalog pages fresh
+    transaction.on_commit(bump_catalog_version)
+
+    return {
+        'users': len(user_objs),
+        'quizzes': len(quiz_objs),
+        'questions': len(question_objs),
+        'choices': len(choice_objs),
+        'attempts': attempt_count,
+        'answers': answer_count,
+    }
+
+
+def clear_dataset():
+    """Delete every seeded quiz and user (attempts and answers cascade)."""
+    quizzes, _ = Quiz.objects.filter(title__startswith=f'[{BENCH_PREFIX}]').delete()
+    users, _ = User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').delete()
+    bump_catalog_version()
+    return quizzes + users
+
+
+def correct_submission(quiz):
+    """POST data answering every question of the quiz correctly."""
+    return {
+        f'question_{question_id}': next((cid for cid, correct in choices.items() if correct), '')
+        for question_id, choices in load_answer_key(quiz).items()
+    }
+
+
+def time_call(func, repeat=5):
+    """Run ``func`` ``repeat`` times and return each duration in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(max(math.ceil(fraction * len(ordered)) - 1, 0), len(ordered) - 1)
+    return ordered[index]
@@ -0,0 +1,408 @@
+"""
+Bulk import and export of quizzes as JSON Lines or CSV bundles.
+
+A JSON Lines bundle holds one quiz per line::
+
+    {"title": "...", "description": "...", "due_date": "2026-06-30T23:59:00+00:00",
+     "background_color": "#ffffff",
+     "questions": [{"text": "...", "question_type": "multiple_choice",
+                    "reading_passage": null,
+                    "choices": [{"text": "...", "is_correct": true}, ...]}, ...]}
+
+A CSV bundle holds one row per choice with the ``CSV_COLUMNS`` headers; quiz
+and question fields are read from the first row of each run of rows sharing
+the same quiz (and question within a quiz). The optional ``KEY_COLUMNS``,
+written by exports, number the quizzes and questions so that neighbours
+sharing a title or question text stay apart; without them rows are grouped
+by ``quiz_title`` and ``question_text`` alone.
+
+Bundles are parsed as a stream and validated quiz by quiz. Valid quizzes are
+written in chunked transactions with one ``bulk_create`` per model, and
+invalid ones (including lines that are not UTF-8 or not valid CSV) are
+reported with their line number and skipped. Images and
+audio files are not part of bundles; attach them in the admin afterwards.
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime, time
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .caching import bump_catalog_version
+from .models import Quiz, Question, Choice
+
+FORMATS = ('jsonl', 'csv')
+CSV_COLUMNS = [
+    'quiz_title', 'quiz_description', 'due_date', 'background_color',
+    'question_text', 'question_type', 'reading_passage', 'choice_text', 'is_correct',
+]
+COLOR_RE = re.compile(r'^#[0-9a-fA-F]{6}$')
+# Optional row keys, (quiz_number, question_number) within the bundle
+KEY_COLUMNS = ['quiz_number', 'question_number']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x'}
+
+
+class BundleError(ValueError):
+    """A quiz in a bundle that cannot be imported"""
+
+    def __init__(self, line, message):
+        super().__init__(f'Line {line}: {message}')
+        self.line = line
+
+
+def guess_format(filename):
+    """Bundle format from a file name, defaulting to JSON Lines."""
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+def undecodable(text):
+    """Whether text read by ``open_text`` holds bytes that were not valid UTF-8."""
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def read_jsonl(lines):
+    """Yield ``(line_number, quiz_dict)`` for each non-blank line."""
+    lines = iter(lines)
+    number = 0
+    while True:
+        try:
+            line = next(lines, None)
+        except UnicodeDecodeError as error:
+            # Only strictly decoding readers get here, and they cannot resume
+            yield number + 1, BundleError(number + 1, f'not valid UTF-8 ({error}), the rest of the bundle was skipped')
+            return
+        if line is None:
+            return
+        number += 1
+        if not line.strip():
+            continue
+        if undecodable(line):
+            yield number, BundleError(number, 'not valid UTF-8')
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as error:
+            yield number, BundleError(number, f'invalid JSON ({error})')
+
+
+def quiz_key(row):
+    return row.get('quiz_number') or '', row['quiz_title']
+
+
+def question_key(item):
+    _, row = item
+    return row.get('question_number') or '', row['question_text']
+
+
+def read_csv(lines):
+    """Yield ``(line_number, quiz_dict)`` for each run of rows of one quiz (see ``quiz_key``)."""
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames or []
+    except (UnicodeDecodeError, csv.Error) as error:
+        yield 1, BundleError(1, f'unreadable CSV header ({error})')
+        return
+    missing = set(CSV_COLUMNS) - set(fieldnames)
+    if missing:
+        yield 1, BundleError(1, f'missing CSV columns: {", ".join(sorted(missing))}')
+        return
+
+    quiz_rows = []
+    # Line of an invalid CSV row; the quizzes read on either side of it may have lost that row
+    bad_line = None
+    broken = after_bad_line = False
+    while True:
+        try:
+            row = next(reader, None)
+        except csv.Error as error:
+            # The reader resumes on the next line
+            bad_line = reader.line_num + 1
+            yield bad_line, BundleError(bad_line, f'invalid CSV ({error})')
+            broken = after_bad_line = True
+            continue
+        except UnicodeDecodeError as error:
+            line = reader.line_num + 1
+            yield line, BundleError(line, f'not valid UTF-8 ({error}), the rest of the bundle was skipped')
+            return
+
+        if quiz_rows and (row is None or quiz_key(row) != quiz_key(quiz_rows[0][1])):
+            line = quiz_rows[0][0]
+            if broken:
+                yield line, BundleError(line, f'quiz skipped because line {bad_line} is invalid CSV')
+            else:
+                yield line, csv_quiz(quiz_rows)
+            quiz_rows = []
+            broken = False
+        if row is None:
+            return
+        if not quiz_rows and after_bad_line:
+            broken = True
+        after_bad_line = False
+        quiz_rows.append((reader.line_num, row))
+
+
+def csv_quiz(quiz_rows):
+    """Quiz dict from the ``(line_number, row)`` pairs of one quiz, or a BundleError."""
+    for line, row in quiz_rows:
+        if any(isinstance(row[column], str) and undecodable(row[column]) for column in CSV_COLUMNS):
+            return BundleError(line, 'not valid UTF-8')
+
+    line, first = quiz_rows[0]
+    questions = []
+    for _, question_rows in groupby(quiz_rows, key=question_key):
+        question_rows = [row for _, row in question_rows]
+        questions.append({
+            'text': question_rows[0]['question_text'],
+            'question_type': question_rows[0]['question_type'] or 'multiple_choice',
+            'reading_passage': question_rows[0]['reading_passage'] or None,
+            'choices': [
+                {'text': row['choice_text'], 'is_correct': (row['is_correct'] or '').strip().lower() in TRUE_VALUES}
+                for row in question_rows
+            ],
+        })
+    return {
+        'title': first['quiz_title'],
+        'description': first['quiz_description'],
+        'due_date': first['due_date'],
+        'background_color': first['background_color'] or None,
+        'questions': questions,
+    }
+
+
+def parse_due_date(value):
+    """Aware datetime from an ISO datetime or date (taken as end of day), or None."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = parse_datetime(value.strip())
+        if parsed is None:
+            day = parse_date(value.strip())
+            parsed = datetime.combine(day, time(23, 59)) if day else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def clean_quiz(line, data):
+    """Validate a raw quiz dict and return it normalized, or raise BundleError."""
+    if not isinstance(data, dict):
+        raise BundleError(line, 'expected a JSON object')
+
+    title = data.get('title')
+    title = title.strip() if isinstance(title, str) else ''
+    if not title or len(title) > 200:
+        raise BundleError(line, 'title is required and must be at most 200 characters')
+    description = data.get('description')
+    description = description.strip() if isinstance(description, str) else ''
+    if not description:
+        raise BundleError(line, f'"{title}": description is required')
+    due_date = parse_due_date(data.get('due_date'))
+    if due_date is None:
+        raise BundleError(line, f'"{title}": due_date must be an ISO date or datetime')
+    background_color = data.get('background_color') or '#ffffff'
+    if not COLOR_RE.match(str(background_color)):
+        raise BundleError(line, f'"{title}": background_color must look like #1a2b3c')
+
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        raise BundleError(line, f'"{title}": at least one question is required')
+    question_types = dict(Question.QUESTION_TYPES)
+    cleaned_questions = []
+    for number, question in enumerate(questions, start=1):
+        where = f'"{title}" question {number}'
+        if not isinstance(question, dict) or not isinstance(question.get('text'), str) or not question['text'].strip():
+            raise BundleError(line, f'{where}: text is required')
+        question_type = question.get('question_type') or 'multiple_choice'
+        if not isinstance(question_type, str) or question_type not in question_types:
+            raise BundleError(line, f'{where}: unknown question_type "{question_type}"')
+        reading_passage = question.get('reading_passage') or None
+        if reading_passage is not None and not isinstance(reading_passage, str):
+            raise BundleError(line, f'{where}: reading_passage must be text')
+        choices = question.get('choices')
+        if not isinstance(choices, list) or len(choices) < 2:
+            raise BundleError(line, f'{where}: at least two choices are required')
+        cleaned_choices = []
+        for choice in choices:
+            text = choice.get('text') if isinstance(choice, dict) else None
+            text = text.strip() if isinstance(text, str) else ''
+            if not text or len(text) > 200:
+                raise BundleError(line, f'{where}: choice text is required and must be at most 200 characters')
+            is_correct = choice.get('is_correct', False)
+            if not isinstance(is_correct, bool):
+                raise BundleError(line, f'{where}: is_correct must be true or false')
+            cleaned_choices.append({'text': text, 'is_correct': is_correct})
+        if not any(choice['is_correct'] for choice in cleaned_choices):
+            raise BundleError(line, f'{where}: no choice is marked correct')
+        cleaned_questions.append({
+            'text': question['text'].strip(),
+            'question_type': question_type,
+            'reading_passage': reading_passage,
+            'choices': cleaned_choices,
+        })
+
+    return {
+        'title': title,
+        'description': description,
+        'due_date': due_date,
+        'background_color': background_color,
+        'questions': cleaned_questions,
+    }
+
+
+@transaction.atomic
+def save_quizzes(quizzes):
+    """Insert validated quizzes with one bulk INSERT per model. Returns ``(questions, choices)`` written."""
+    quiz_objs = Quiz.objects.bulk_create([
+        Quiz(
+            title=data['title'],
+            description=data['description'],
+            due_date=data['due_date'],
+            background_color=data['background_color']
+        )
+        for data in quizzes
+    ])
+
+    question_objs = []
+    question_choices = []
+    for quiz, data in zip(quiz_objs, quizzes):
+        for question_data in data['questions']:
+            question = Question(
+                quiz=quiz,
+                text=question_data['text'],
+                question_type=question_data['question_type'],
+                reading_passage=question_data['reading_passage']
+            )
+            question_objs.append(question)
+            question_choices.append((question, question_data['choices']))
+    Question.objects.bulk_create(question_objs, batch_size=1000)
+
+    choice_objs = [
+        Choice(question=question, text=choice['text'], is_correct=choice['is_correct'])
+        for question, choices in question_choices
+        for choice in choices
+    ]
+    Choice.objects.bulk_create(choice_objs, batch_size=1000)
+    return len(question_objs), len(choice_objs)
+
+
+def import_bundle(lines, fmt='jsonl', chunk_size=50, dry_run=False):
+    """
+    Import a bundle read from an iterable of text lines.
+
+    Quizzes are saved ``chunk_size`` at a time, each chunk in its own
+    transaction. With ``dry_run`` the bundle is only validated. Returns a
+    dict with the number of quizzes, questions and choices imported (or
+    that would be) and the list of error messages.
+    """
+    result = {'quizzes': 0, 'questions': 0, 'choices': 0, 'errors': []}
+    reader = read_csv(lines) if fmt == 'csv' else read_jsonl(lines)
+
+    def flush(chunk):
+        if dry_run:
+            questions = sum(len(data['questions']) for data in chunk)
+            choices = sum(len(question['choices']) for data in chunk for question in data['questions'])
+        else:
+            questions, choices = save_quizzes(chunk)
+        result['quizzes'] += len(chunk)
+        result['questions'] += questions
+        result['choices'] += choices
+
+    chunk = []
+    for line, data in reader:
+        try:
+            if isinstance(data, BundleError):
+                raise data
+            chunk.append(clean_quiz(line, data))
+        except BundleError as error:
+            result['errors'].append(str(error))
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    # Bulk inserts skip the signals that keep cached catalog pages fresh
+    if result['quizzes'] and not dry_run:
+        bump_catalog_version()
+    return result
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def export_bundle(quizzes, fmt='jsonl', chunk_size=100):
+    """
+    Yield a bundle of the given quizzes as text, one quiz (JSON Lines) or row (CSV) at a time.
+
+    Quizzes are read in chunks with their questions and choices prefetched
+    per chunk, so memory use does not grow with the number of quizzes.
+    """
+    quizzes = quizzes.order_by('id').prefetch_related(
+        Prefetch('questions', queryset=Question.objects.order_by('created_at', 'id').prefetch_related(
+            Prefetch('choices', queryset=Choice.objects.order_by('id'))
+        ))
+    )
+
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(KEY_COLUMNS + CSV_COLUMNS)
+    for quiz_number, quiz in enumerate(quizzes.iterator(chunk_size=chunk_size), start=1):
+        if fmt == 'csv':
+            for question_number, question in enumerate(quiz.questions.all(), start=1):
+                for choice in question.choices.all():
+                    yield writer.writerow([
+                        quiz_number, question_number, quiz.title, quiz.description, quiz.due_date.isoformat(), quiz.background_color,
+                        question.text, question.question_type, question.reading_passage or '',
+                        choice.text, 'true' if choice.is_correct else 'false',
+                    ])
+        else:
+            yield json.dumps({
+                'title': quiz.title,
+                'description': quiz.description,
+                'due_date': quiz.due_date.isoformat(),
+                'background_color': quiz.background_color,
+                'questions': [
+                    {
+                        'text': question.text,
+                        'question_type': question.question_type,
+                        'reading_passage': question.reading_passage,
+                        'choices': [
+                            {'text': choice.text, 'is_correct': choice.is_correct}
+                            for choice in question.choices.all()
+                        ],
+                    }
+                    for question in quiz.questions.all()
+                ],
+            }) + '\n'
+
+
+def open_text(binary_file, fmt):
+    """
+    Wrap an uploaded or opened binary file for line-by-line reading.
+
+    Bytes that are not UTF-8 are kept as surrogates rather than raising, so
+    the readers can reject just the lines holding them.
+    """
+    return io.TextIOWrapper(
+        binary_file,
+        encoding='utf-8-sig',
+        errors='surrogateescape',
+        newline='' if fmt == 'csv' else None
+    )
@@ -0,0 +1,259 @@
+"""
+Caching of rendered quiz pages and fragments.
+
+Three layers, all stored in the ``default`` cache configured in settings:
+
+* Quiz card and quiz detail summary fragments, cached per quiz and fetched
+  with one ``get_many`` round trip per page. The compiled exam paper
+  (``Quizzes.paper``) lives next to them.
+* Whole responses for anonymous visitors of catalog pages (quiz list,
+  homepage), keyed by a catalog version.
+* The result bundle of a graded attempt (statistics and rendered answer
+  review), cached per attempt since an attempt never changes once graded.
+* Hit/miss counters per namespace, kept in process for monitoring.
+
+``Quizzes.signals`` calls ``invalidate_quiz`` whenever a quiz, question or
+choice is saved or deleted, which drops that quiz's cached data and bumps the
+catalog version so cached catalog pages are not served stale. Result
+bundles carry their quiz's version in their key for the same reason, so an
+edit only drops the bundles of the quiz that changed.
+
+Invalidation only reaches every process when the cache is shared (Redis,
+database or file cache, see ``CACHE_URL``). With the local memory cache each
+worker keeps its own copy and may serve stale entries for up to
+``CACHE_TIMEOUT``; ``check_shared_cache`` warns about that on deploy checks.
+"""
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core import checks
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .answer_queue import is_pending
+from .images import cover_images
+from .models import Choice, QuizAnswer
+
+CATALOG_VERSION_KEY = 'quizzes:catalog-version'
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when production caches in per-process memory, where invalidation cannot reach other workers."""
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or not backend.endswith('LocMemCache'):
+        return []
+    return [checks.Warning(
+        'The default cache is local to each process, so invalidated quiz pages stay cached in other workers.',
+        hint='Set CACHE_URL to a Redis, database (db://table) or file cache, or run a single worker.',
+        id='Quizzes.W001',
+    )]
+
+
+def get_timeout():
+    return getattr(settings, 'CACHE_TIMEOUT', 600)
+
+
+def record(namespace, hits=0, misses=0):
+    """Count cache hits and misses for a namespace."""
+    with _metrics_lock:
+        _metrics[(namespace, 'hits')] += hits
+        _metrics[(namespace, 'misses')] += misses
+
+
+def cache_metrics():
+    """Hit/miss counters of this process, as ``{namespace: {'hits': n, 'misses': n}}``."""
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    metrics = {}
+    for (namespace, kind), value in snapshot.items():
+        metrics.setdefault(namespace, {'hits': 0, 'misses': 0})[kind] = value
+    return metrics
+
+
+def quiz_card_key(quiz_id):
+    return f'quizzes:card:{quiz_id}'
+
+
+def quiz_summary_key(quiz_id):
+    return f'quizzes:summary:{quiz_id}'
+
+
+def quiz_paper_key(quiz_id):
+    return f'quizzes:paper:{quiz_id}'
+
+
+def quiz_version_key(quiz_id):
+    return f'quizzes:version:{quiz_id}'
+
+
+def attempt_result_key(attempt_id, version):
+    return f'quizzes:result:{version}:{attempt_id}'
+
+
+def quiz_keys(quiz_id):
+    """Every cache key holding data derived from a single quiz."""
+    return [quiz_card_key(quiz_id), quiz_summary_key(quiz_id), quiz_paper_key(quiz_id)]
+
+
+def render_quiz_cards(quizzes):
+    """
+    Rendered card HTML for each quiz, in order.
+
+    Cached cards come back in one ``get_many`` call; only the missing cards
+    are rendered and stored with one ``set_many``, their cover URLs resolved
+    together by ``cover_images``. Quizzes should come from
+    ``Quiz.objects.with_card_data()``.
+    """
+    keys = [quiz_card_key(quiz.id) for quiz in quizzes]
+    cached = cache.get_many(keys)
+    covers = cover_images([quiz for key, quiz in zip(keys, quizzes) if key not in cached])
+    missing = {}
+    cards = []
+    for key, quiz in zip(keys, quizzes):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string('quizzes/quiz_card.html', {'quiz': quiz, 'cover': covers[quiz.id]})
+            missing[key] = html
+        cards.append(mark_safe(html))
+
+    if missing:
+        cache.set_many(missing, get_timeout())
+    record('quiz_card', hits=len(keys) - len(missing), misses=len(missing))
+    return cards
+
+
+def render_quiz_summary(quiz):
+    """Rendered summary fragment of the quiz detail page (description, questions, due date)."""
+    key = quiz_summary_key(quiz.id)
+    html = cache.get(key)
+    if html is None:
+        record('quiz_summary', misses=1)
+        question_types = dict(quiz.questions.model.QUESTION_TYPES)
+        context = {
+            'quiz': quiz,
+            'cover': cover_images([quiz])[quiz.id],
+            'total_questions': quiz.questions.count(),
+            'question_types': sorted({
+                question_types.get(question_type, question_type)
+                for question_type in quiz.questions.values_list('question_type', flat=True)
+            }),
+        }
+        html = render_to_string('quizzes/quiz_summary.html', context)
+        cache.set(key, html, get_timeout())
+    else:
+        record('quiz_summary', hits=1)
+    return mark_safe(html)
+
+
+def get_result_bundle(attempt):
+    """
+    Statistics and rendered answer review of a graded attempt.
+
+    Built with three queries (answers with their question and selected
+    choice, then every question's choices through one prefetch) and cached
+    per attempt. The rank is left out since it moves as others take the quiz.
+    While the attempt's answers are still queued for the answer worker
+    ``pending`` is True, ``answers_html`` is None and nothing is cached.
+    """
+    key = attempt_result_key(attempt.id, get_version(quiz_version_key(attempt.quiz_id)))
+    bundle = cache.get(key)
+    if bundle is None:
+        record('attempt_result', misses=1)
+        stats = {
+            'correct_answers': attempt.score,
+            'total_questions': attempt.total_questions,
+            'percentage': attempt.percentage_score,
+            'grade': attempt.grade_letter,
+            'performance_level': attempt.performance_label,
+            'time_taken': attempt.time_taken,
+        }
+        if is_pending(attempt):
+            return {'stats': stats, 'pending': True, 'answers_html': None}
+        answers = QuizAnswer.objects.filter(attempt=attempt).select_related(
+            'question', 'selected_choice'
+        ).prefetch_related(
+            Prefetch('question__choices', queryset=Choice.objects.order_by('id'))
+        ).order_by('question__created_at', 'question_id')
+        bundle = {
+            'stats': stats,
+            'pending': False,
+            'answers_html': render_to_string('quizzes/result_answers.html', {'answers': answers}),
+        }
+        cache.set(key, bundle, get_timeout())
+    else:
+        record('attempt_result', hits=1)
+    bundle['answers_html'] = mark_safe(bundle['answers_html'])
+    return bundle
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key missing or evicted; any fresh value invalidates the old entries
+        cache.add(key, 1, None)
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def invalidate_quiz(quiz_id):
+    """Drop everything cached for a quiz, its result bundles and every catalog page."""
+    cache.delete_many(quiz_keys(quiz_id))
+    bump_version(quiz_version_key(quiz_id))
+    bump_catalog_version()
+
+
+def cache_anonymous_page(namespace):
+    """
+    Cache a catalog view's response for anonymous GET requests.
+
+    Authenticated users, other methods and requests carrying flash messages
+    always hit the view.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (request.method != 'GET' or request.user.is_authenticated
+                    or len(get_messages(request))):
+                return view_func(request, *args, **kwargs)
+
+            path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'quizzes:page:{namespace}:{get_catalog_version()}:{path_hash}'
+            cached = cache.get(key)
+            if cached is not None:
+                record(f'page:{namespace}', hits=1)
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            record(f'page:{namespace}', misses=1)
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']), get_timeout())
+            return response
+        return wrapper
+    return decorator
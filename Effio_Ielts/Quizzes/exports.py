@@ -0,0 +1,127 @@
+"""
+Streaming exports of attempts and answers for analysts.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)``, which uses a
+server-side cursor on PostgreSQL, and written out as CSV or NDJSON text one
+chunk at a time. Memory use stays flat however many rows are exported, and
+an HTTP response starts sending as soon as the first chunk is read.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import QuizAttempt, QuizAnswer
+
+FORMATS = ('csv', 'ndjson')
+
+# Output column -> ORM lookup, per export kind
+COLUMNS = {
+    'attempts': {
+        'attempt_id': 'id',
+        'user_id': 'user_id',
+        'username': 'user__username',
+        'quiz_id': 'quiz_id',
+        'quiz_title': 'quiz__title',
+        'score': 'score',
+        'total_questions': 'total_questions',
+        'percentage_score': 'percentage_score',
+        'time_taken_seconds': 'time_taken',
+        'started_at': 'started_at',
+        'completed_at': 'completed_at',
+    },
+    'answers': {
+        'answer_id': 'id',
+        'attempt_id': 'attempt_id',
+        'user_id': 'attempt__user_id',
+        'quiz_id': 'attempt__quiz_id',
+        'question_id': 'question_id',
+        'selected_choice_id': 'selected_choice_id',
+        'is_correct': 'is_correct',
+        'time_taken_seconds': 'time_taken',
+        'completed_at': 'attempt__completed_at',
+    },
+}
+
+
+def parse_bound(value, end=False):
+    """
+    Aware datetime from an ISO datetime or date, or None when empty.
+
+    A bare date means the start of that day, or its end with ``end=True``.
+    Raises ValueError for anything else.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_queryset(kind, quiz_id=None, since=None, until=None):
+    """Attempts or answers to export, filtered by quiz and completion time and ordered by id."""
+    if kind == 'attempts':
+        rows, completed_at = QuizAttempt.objects.all(), 'completed_at'
+        quiz_lookup = 'quiz_id'
+    else:
+        rows, completed_at = QuizAnswer.objects.all(), 'attempt__completed_at'
+        quiz_lookup = 'attempt__quiz_id'
+
+    if quiz_id is not None:
+        rows = rows.filter(**{quiz_lookup: quiz_id})
+    if since is not None:
+        rows = rows.filter(**{f'{completed_at}__gte': since})
+    if until is not None:
+        rows = rows.filter(**{f'{completed_at}__lt': until})
+    return rows.order_by('id').values_list(*COLUMNS[kind].values())
+
+
+def plain_value(value):
+    """JSON and CSV friendly form of a database value."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_rows(kind, fmt='csv', chunk_size=2000, **filters):
+    """
+    Yield an export of attempts or answers as text chunks of ``chunk_size`` rows.
+
+    ``filters`` are passed to ``export_queryset`` (``quiz_id``, ``since``, ``until``).
+    """
+    columns = list(COLUMNS[kind])
+    rows = export_queryset(kind, **filters).iterator(chunk_size=chunk_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+
+    count = 0
+    for row in rows:
+        values = [plain_value(value) for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,146 @@
+"""
+Grading service for quiz submissions.
+
+Scores a submission against the quiz's answer key in memory and writes the
+attempt together with all of its answers in a constant number of queries,
+however many questions the quiz has.
+"""
+import json
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from .models import Question, QuizAttempt, QuizAnswer
+from . import answer_queue, ranking, rollups, stats
+from .votes import record_votes
+
+
+def load_answer_key(quiz):
+    """
+    Load every question and choice of the quiz in a single query.
+
+    Returns an ordered mapping of ``{question_id: {choice_id: is_correct}}``
+    following the questions' display order. Questions without choices are
+    kept so that they still count towards the total.
+    """
+    answer_key = {}
+    rows = Question.objects.filter(quiz=quiz).order_by('created_at', 'id').values_list(
+        'id', 'choices__id', 'choices__is_correct'
+    )
+    for question_id, choice_id, is_correct in rows:
+        choices = answer_key.setdefault(question_id, {})
+        if choice_id is not None:
+            choices[choice_id] = is_correct
+    return answer_key
+
+
+def parse_selections(answer_key, data):
+    """
+    Read the ``question_<id>`` fields of a submission.
+
+    Only choice ids that belong to the matching question are accepted, so a
+    tampered form can neither score points nor touch another quiz's choices.
+    """
+    selections = {}
+    for question_id, choices in answer_key.items():
+        try:
+            choice_id = int(data.get(f'question_{question_id}'))
+        except (TypeError, ValueError):
+            continue
+        if choice_id in choices:
+            selections[question_id] = choice_id
+    return selections
+
+
+def parse_question_times(answer_key, data, limit=None):
+    """
+    Read the per-question dwell times sent by the exam page.
+
+    ``question_times`` holds JSON ``{question_id: seconds}``. Unknown
+    questions and invalid values are dropped, and each time is capped at
+    ``limit`` (the attempt's duration). Without a known, non-zero duration
+    the times cannot be checked and none are kept.
+    """
+    if not limit:
+        return {}
+    try:
+        times = json.loads(data.get('question_times') or '{}').items()
+    except (ValueError, AttributeError):
+        return {}
+
+    parsed = {}
+    for question_id, seconds in times:
+        try:
+            question_id, seconds = int(question_id), float(seconds)
+        except (TypeError, ValueError):
+            continue
+        if question_id not in answer_key or not math.isfinite(seconds) or seconds < 0:
+            continue
+        seconds = min(seconds, limit.total_seconds())
+        parsed[question_id] = timedelta(seconds=round(seconds, 1))
+    return parsed
+
+
+def calculate_percentage(score, total_questions):
+    """Percentage score rounded the way ``QuizAttempt.percentage_score`` stores it."""
+    if not total_questions:
+        return Decimal('0.00')
+    return (Decimal(score * 100) / total_questions).quantize(Decimal('0.01'))
+
+
+@transaction.atomic
+def grade_submission(quiz, user, data, started_at, time_taken=None, ip_address=None):
+    """
+    Grade a submitted quiz and persist the attempt with its answers.
+
+    Round-trips stay constant: one query for the answer key, one INSERT for
+    the attempt, one bulk INSERT for the answers, two statements for the
+    sharded choice vote counters, and a few single-row updates of the quiz
+    statistics, rankings and the user's dashboard rollup. With deferred
+    answer writes the answers and votes become a single queued job row.
+    Per-question dwell times sent by the exam page are stored on the
+    answers, in the same INSERT.
+    """
+    answer_key = load_answer_key(quiz)
+    selections = parse_selections(answer_key, data)
+    question_times = parse_question_times(answer_key, data, limit=time_taken)
+
+    score = sum(answer_key[question_id][choice_id] for question_id, choice_id in selections.items())
+    total_questions = len(answer_key)
+
+    attempt = QuizAttempt.objects.create(
+        user=user,
+        quiz=quiz,
+        score=score,
+        total_questions=total_questions,
+        percentage_score=calculate_percentage(score, total_questions),
+        time_taken=time_taken,
+        started_at=started_at,
+        ip_address=ip_address
+    )
+
+    answers = [
+        QuizAnswer(
+            attempt=attempt,
+            question_id=question_id,
+            selected_choice_id=selections.get(question_id),
+            is_correct=answer_key[question_id].get(selections.get(question_id), False),
+            time_taken=question_times.get(question_id)
+        )
+        for question_id in answer_key
+    ]
+    if answer_queue.deferred_writes_enabled():
+        # Answers and votes are written later by the answer worker
+        answer_queue.enqueue_answers(attempt, answers)
+    else:
+        QuizAnswer.objects.bulk_create(answers)
+        # Count votes for analytics
+        record_votes(selections.values())
+
+    # Keep the precomputed quiz statistics, rankings and user totals current
+    stats.record_attempt(attempt)
+    first_of_quiz = ranking.record_attempt(attempt)
+    rollups.record_attempt(attempt, first_of_quiz)
+
+    return attempt
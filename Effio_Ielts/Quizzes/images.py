@@ -0,0 +1,230 @@
+"""
+Responsive derivatives of uploaded images.
+
+Without Cloudinary, cover, question and choice images are stored exactly as
+uploaded. ``create_derivatives`` resizes an image to each width in
+``IMAGE_DERIVATIVE_WIDTHS`` that does not upscale it, once as WebP and once
+as JPEG (PNG for images with transparency), stores the files under
+``derivatives/<digest>/`` in the image's storage and records what it made in
+an ``ImageDerivativeSet`` row. The digest is the file's entry in the media
+manifest (see ``Quizzes.media_manifest``), so an image uploaded twice is
+resized once and a replaced image never picks up stale files.
+
+Resizing reads and decodes the whole image, so it never runs while a page
+is rendered or a quiz is saved: ``manage.py generate_image_derivatives``
+(``--loop`` as a worker) creates the missing sets. Pages look derivatives up
+by digest (``image_sources_for``, one query for any number of images;
+``cover_images`` for a page of quiz covers) and
+list them in ``srcset`` so browsers download the smallest file that fits;
+images without a set yet are only offered at their original URL. Cloudinary
+resizes its own images, so nothing is done there.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+from .media_manifest import hashed_urls, register
+from .models import DEFAULT_COVER_IMAGE_URL, ImageDerivativeSet
+
+DERIVATIVE_ROOT = 'derivatives'
+FALLBACK_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png'}
+
+# Errors of files Pillow cannot (or refuses to) decode; decompression bombs
+# are not OSErrors
+UNREADABLE_IMAGE_ERRORS = (OSError, UnidentifiedImageError, Image.DecompressionBombError)
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def derivatives_enabled():
+    return not getattr(settings, 'USE_CLOUDINARY', False)
+
+
+def derivative_widths():
+    return sorted(set(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', [160, 320, 640, 1024])))
+
+
+def target_widths(source_width):
+    """Derivative widths for an image ``source_width`` pixels wide, never upscaling."""
+    widths = derivative_widths()
+    targets = [width for width in widths if width < source_width]
+    if source_width <= widths[-1]:
+        # Small images are still re-encoded at their own size
+        targets.append(source_width)
+    return targets
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def upright_size(image):
+    """Width and height of the image once its EXIF orientation is applied."""
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def encode(image, width, fmt):
+    """Bytes of ``image`` scaled to ``width`` pixels wide and saved as ``fmt``."""
+    if width != image.width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    if fmt == 'PNG':
+        image.save(buffer, fmt, optimize=True)
+    else:
+        image.save(buffer, fmt, quality=getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80))
+    return buffer.getvalue()
+
+
+def derivative_name(digest, width, extension):
+    return f'{DERIVATIVE_ROOT}/{digest}/{width}w.{extension}'
+
+
+def resize_image(storage, name, digest):
+    """
+    Write the derivative files of a stored image, returning ``(widths, fallback extension)``.
+
+    Files already present are kept. Returns ``([], '')`` for animated images
+    and files Pillow cannot read (including decompression bombs).
+    """
+    try:
+        with storage.open(name, 'rb') as f:
+            image = Image.open(BytesIO(f.read()))
+        if getattr(image, 'is_animated', False):
+            return [], ''
+        width, _ = upright_size(image)
+    except UNREADABLE_IMAGE_ERRORS:
+        return [], ''
+
+    fallback = 'PNG' if has_alpha(image) else 'JPEG'
+    widths = target_widths(width)
+    folder = f'{DERIVATIVE_ROOT}/{digest}'
+    try:
+        _, existing = storage.listdir(folder)
+    except OSError:
+        existing = []
+    missing = [
+        (target, fmt, derivative_name(digest, target, extension))
+        for fmt, extension in (('WEBP', 'webp'), (fallback, FALLBACK_EXTENSIONS[fallback]))
+        for target in widths
+        if f'{target}w.{extension}' not in existing
+    ]
+    if missing:
+        try:
+            image = ImageOps.exif_transpose(image).convert('RGBA' if fallback == 'PNG' else 'RGB')
+            encoded = [(name, encode(image, target, fmt)) for target, fmt, name in missing]
+        except UNREADABLE_IMAGE_ERRORS:
+            return [], ''
+        for derivative, content in encoded:
+            storage.save(derivative, ContentFile(content))
+    return widths, FALLBACK_EXTENSIONS[fallback]
+
+
+def create_derivatives(field_file):
+    """
+    Resize an uploaded image unless its digest already has a derivative set.
+
+    Returns the ``ImageDerivativeSet``, or None for empty fields, Cloudinary
+    images and files that cannot be read.
+    """
+    if not field_file or not derivatives_enabled() or getattr(field_file, 'storage', None) is None:
+        return None
+    digest = register([field_file]).get(field_file.name)
+    if digest is None:
+        return None
+    derivative_set = ImageDerivativeSet.objects.filter(digest=digest).first()
+    if derivative_set is None:
+        widths, fallback = resize_image(field_file.storage, field_file.name, digest)
+        derivative_set, _ = ImageDerivativeSet.objects.get_or_create(
+            digest=digest,
+            defaults={'widths': widths, 'fallback_extension': fallback}
+        )
+    return derivative_set
+
+
+def derivatives_for(field_files, digests=None):
+    """
+    ``{name: {'webp': [(width, url), ...], 'fallback': [(width, url), ...]}}`` for uploaded images.
+
+    Reads the media manifest and the derivative sets (two queries for any
+    number of images) and never opens the images; ``digests`` (as returned by
+    ``media_manifest.register``) spares the manifest query. Empty fields,
+    Cloudinary images and images without derivatives yet are left out.
+    """
+    if not derivatives_enabled():
+        return {}
+    field_files = [field_file for field_file in field_files if field_file and getattr(field_file, 'storage', None)]
+    if digests is None:
+        digests = register(field_files)
+    sets = {
+        derivative_set.digest: derivative_set
+        for derivative_set in ImageDerivativeSet.objects.filter(digest__in=set(digests.values()))
+    }
+    derivatives = {}
+    for field_file in field_files:
+        derivative_set = sets.get(digests.get(field_file.name))
+        if derivative_set is None or not derivative_set.widths:
+            continue
+        derivatives[field_file.name] = {
+            kind: [
+                (width, field_file.storage.url(derivative_name(derivative_set.digest, width, extension)))
+                for width in derivative_set.widths
+            ]
+            for kind, extension in (('webp', 'webp'), ('fallback', derivative_set.fallback_extension))
+        }
+    return derivatives
+
+
+def image_derivatives(field_file):
+    """Derivatives of one uploaded image (see ``derivatives_for``), or None."""
+    return derivatives_for([field_file]).get(getattr(field_file, 'name', None))
+
+
+def srcset(candidates):
+    return ', '.join(f'{url} {width}w' for width, url in candidates)
+
+
+def image_sources_for(field_files, digests=None):
+    """``{name: {'webp': srcset, 'fallback': srcset}}`` for ``<picture>`` elements (see ``derivatives_for``)."""
+    return {
+        name: {kind: srcset(candidates) for kind, candidates in derivatives.items()}
+        for name, derivatives in derivatives_for(field_files, digests).items()
+    }
+
+
+def image_sources(field_file):
+    """``{'webp': srcset, 'fallback': srcset}`` for a ``<picture>`` element, or None."""
+    return image_sources_for([field_file]).get(getattr(field_file, 'name', None))
+
+
+def cover_images(quizzes):
+    """
+    ``{quiz id: {'url': ..., 'sources': ...}}`` for the covers of a page of quizzes.
+
+    Every cover is looked up in the manifest once and those digests serve
+    both the hashed URLs and the derivative sets, so a page costs two
+    queries however many cards it holds.
+    """
+    covers = [quiz.cover_image for quiz in quizzes]
+    digests = register(covers)
+    urls = hashed_urls(covers, digests)
+    sources = image_sources_for(covers, digests)
+    images = {}
+    for quiz in quizzes:
+        cover = quiz.cover_image
+        if cover and getattr(cover, 'storage', None) is None:
+            # Cloudinary resources carry a versioned URL of their own
+            url = quiz.get_cover_image_url()
+        else:
+            url = urls.get(cover.name) if cover else None
+        images[quiz.pk] = {
+            'url': url or DEFAULT_COVER_IMAGE_URL,
+            'sources': sources.get(cover.name) if cover else None,
+        }
+    return images
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+from itertools import count
+
+from asgiref.sync import ThreadSensitiveContext
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from Quizzes.benchmarking import BENCH_PREFIX, correct_submission, percentile
+from Quizzes.models import Quiz
+
+MODES = ['sync', 'async']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent quiz submissions through Django\'s request handlers in this process: '
+        'the sync handler (one thread per client) and the async handler (one coroutine per client). '
+        'No server is started, so this measures the views and the database, not gunicorn or uvicorn workers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=200, help='Submissions per mode (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Clients submitting at once (default: 20)')
+        parser.add_argument(
+            '--mode',
+            action='append',
+            dest='modes',
+            choices=MODES,
+            help='Only benchmark this handler mode (can be repeated)',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['submissions'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--submissions and --concurrency must be at least 1')
+
+        quiz = Quiz.objects.filter(title__startswith=f'[{BENCH_PREFIX}]').order_by('id').first()
+        users = list(User.objects.filter(username__startswith=f'{BENCH_PREFIX}_').order_by('id')[:options['concurrency']])
+        if quiz is None or not users:
+            raise CommandError('No benchmark data found; run "manage.py seed_benchmark" first')
+
+        if connection.vendor == 'sqlite' and options['concurrency'] > 1:
+            self.stderr.write(self.style.WARNING(
+                'SQLite allows one writer at a time, so concurrent submissions will fail with '
+                '"database is locked"; compare the handlers against PostgreSQL'
+            ))
+
+        self.url = reverse('quizzes:take_quiz', args=[quiz.id])
+        self.post_data = correct_submission(quiz)
+        self.users = users
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'server': 'none (in-process handlers)',
+                'submissions': options['submissions'],
+                'concurrency': options['concurrency'],
+                'users': len(users),
+                'quiz_id': quiz.id,
+                'questions': len(self.post_data),
+            },
+            'modes': {},
+        }
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for mode in options['modes'] or MODES:
+                run = self.run_sync if mode == 'sync' else self.run_async
+                started = time.perf_counter()
+                timings, outcomes = run(options['submissions'], options['concurrency'])
+                report['modes'][mode] = self.summarize(time.perf_counter() - started, timings, outcomes)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote benchmark report to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def run_sync(self, submissions, concurrency):
+        """Submit from ``concurrency`` threads through the sync handler, as a threaded WSGI worker would."""
+        tickets = count()
+        lock = threading.Lock()
+        timings = []
+        outcomes = Counter()
+
+        def worker(user):
+            client = Client()
+            client.force_login(user)
+            try:
+                while next(tickets) < submissions:
+                    started = time.perf_counter()
+                    try:
+                        outcome = client.post(self.url, self.post_data).status_code
+                    except Exception as error:
+                        outcome = type(error).__name__
+                    with lock:
+                        timings.append((time.perf_counter() - started) * 1000)
+                        outcomes[outcome] += 1
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(self.users[number % len(self.users)],))
+            for number in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, outcomes
+
+    def run_async(self, submissions, concurrency):
+        """Submit from ``concurrency`` coroutines on one event loop through the async handler, as an ASGI worker would."""
+        tickets = count()
+        timings = []
+        outcomes = Counter()
+
+        async def worker(user):
+            client = AsyncClient()
+            await client.aforce_login(user)
+            while next(tickets) < submissions:
+                started = time.perf_counter()
+                try:
+                    # As ASGIHandler does, so each request's sync code gets its own thread
+                    async with ThreadSensitiveContext():
+                        outcome = (await client.post(self.url, self.post_data)).status_code
+                except Exception as error:
+                    outcome = type(error).__name__
+                timings.append((time.perf_counter() - started) * 1000)
+                outcomes[outcome] += 1
+
+        async def main():
+            await asyncio.gather(*(
+                worker(self.users[number % len(self.users)]) for number in range(concurrency)
+            ))
+
+        asyncio.run(main())
+        return timings, outcomes
+
+    def summarize(self, elapsed, timings, outcomes):
+        return {
+            'wall_s': round(elapsed, 3),
+            'throughput_rps': round(len(timings) / elapsed, 2),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'max_ms': round(max(timings), 3),
+            'outcomes': {str(outcome): total for outcome, total in sorted(outcomes.items(), key=str)},
+        }
@@ -0,0 +1,126 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from Quizzes.benchmarking import BENCH_PREFIX, correct_submission, percentile
+from Quizzes.models import QuizAttempt
+
+VIEWS = ['quiz_list', 'quiz_detail', 'take_quiz_get', 'take_quiz_post', 'quiz_results', 'quiz_analytics', 'user_dashboard']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the quiz views through the test client and report latency, queries and memory as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per view (default: 20)')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per view (default: 2)')
+        parser.add_argument(
+            '--view',
+            action='append',
+            dest='views',
+            choices=VIEWS,
+            help='Only benchmark this view (can be repeated)',
+        )
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        attempt = QuizAttempt.objects.filter(
+            quiz__title__startswith=f'[{BENCH_PREFIX}]'
+        ).select_related('quiz', 'user').order_by('-completed_at').first()
+        if attempt is None:
+            raise CommandError('No benchmark data found; run "manage.py seed_benchmark" first')
+        quiz, user = attempt.quiz, attempt.user
+
+        # Answer every question correctly on submission
+        post_data = correct_submission(quiz)
+
+        client = Client()
+        client.force_login(user)
+        anonymous = Client()
+        take_url = reverse('quizzes:take_quiz', args=[quiz.id])
+        requests = {
+            'quiz_list': lambda: anonymous.get(reverse('quizzes:quiz_list')),
+            'quiz_detail': lambda: client.get(reverse('quizzes:quiz_detail', args=[quiz.id])),
+            'take_quiz_get': lambda: client.get(take_url),
+            'take_quiz_post': lambda: client.post(take_url, post_data),
+            'quiz_results': lambda: client.get(reverse('quizzes:quiz_results', args=[quiz.id, attempt.id])),
+            'quiz_analytics': lambda: client.get(reverse('quizzes:quiz_analytics', args=[quiz.id])),
+            'user_dashboard': lambda: client.get(reverse('quizzes:user_dashboard')),
+        }
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'iterations': options['iterations'],
+                'cold_cache': options['cold'],
+                'quiz_id': quiz.id,
+                'questions': len(post_data),
+                'quiz_attempts': quiz.attempts.count(),
+            },
+            'views': {},
+        }
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name in options['views'] or VIEWS:
+                report['views'][name] = self.measure(requests[name], options)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote benchmark report to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def measure(self, request, options):
+        for _ in range(options['warmup']):
+            self.send(request, options)
+
+        timings = []
+        query_counts = []
+        statuses = set()
+        for _ in range(options['iterations']):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.send(request, options)
+                timings.append((time.perf_counter() - started) * 1000)
+            query_counts.append(len(queries))
+            statuses.add(response.status_code)
+
+        # Traced separately, tracemalloc would distort the timings
+        tracemalloc.start()
+        try:
+            self.send(request, options)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'queries': round(statistics.median(query_counts)),
+            'max_queries': max(query_counts),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'status_codes': sorted(statuses),
+        }
+
+    def send(self, request, options):
+        if options['cold']:
+            cache.clear()
+        return request()
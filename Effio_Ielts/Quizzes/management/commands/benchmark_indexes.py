@@ -0,0 +1,175 @@
+import json
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from Quizzes.analytics import pending_attempts
+from Quizzes.benchmarking import BENCH_PREFIX, seed_dataset, time_call
+from Quizzes.models import (
+    ChoiceVoteShard, InProgressAttempt, LeaderboardEntry, Question, Quiz, QuizAnalyticsSnapshot, QuizAnswer,
+    QuizAttempt, QuizScoreCount, QuizStatsShard, UserQuizRollup,
+)
+from Quizzes.pagination import encode_score_cursor
+from Quizzes.ranking import _leaderboard_querysets
+
+# Indexes dropped for the "before" run, with the queries of view_queries()
+# each one serves. Unique constraints (per-user attempt history, leaderboard
+# entries, rank histogram and shard rows) are kept in both runs.
+INDEX_PLAN = [
+    (Quiz, 'quiz_created_id_idx', ['quiz_list.cards']),
+    (Question, 'question_quiz_created_idx', ['take_quiz.answer_key']),
+    (QuizAttempt, 'attempt_user_done_idx', ['user_dashboard.recent']),
+    (QuizAttempt, 'attempt_quiz_done_idx', ['refresh_analytics_snapshots.pending']),
+    (QuizAnswer, 'answer_question_correct_idx', ['quiz_analytics.questions']),
+    (QuizAnswer, 'answer_question_choice_idx', ['quiz_analytics.choices']),
+    (QuizAnswer, 'answer_question_time_idx', ['quiz_analytics.question_times']),
+    (LeaderboardEntry, 'leaderboard_rank_idx', ['quiz_leaderboard.entries', 'quiz_leaderboard.next_page']),
+    (InProgressAttempt, 'in_progress_seen_idx', ['sweep_in_progress_attempts.stale']),
+    (ChoiceVoteShard, 'vote_shard_pending_idx', ['fold_choice_votes.pending']),
+    (QuizStatsShard, 'stats_shard_pending_idx', ['fold_quiz_stats.pending']),
+]
+
+
+def view_queries(quiz, user, attempt):
+    """
+    The hot queries of each view and worker, as querysets, for a sample quiz, user and attempt.
+
+    Querysets are built the way the views build them (through the same
+    helpers where those return querysets); aggregates are written as the
+    equivalent ``values().annotate()`` so they can be explained.
+    """
+    answers = QuizAnswer.objects.filter(question__quiz=quiz).order_by()
+    histogram, entries = _leaderboard_querysets(quiz, None, 20)
+    top = LeaderboardEntry.objects.filter(quiz=quiz).order_by('-best_score', 'achieved_at', 'id').first()
+    cursor = encode_score_cursor(top.best_score, top.achieved_at, top.pk) if top else None
+    # A snapshot whose watermark is the sample attempt
+    snapshot = QuizAnalyticsSnapshot(quiz=quiz, watermark_at=attempt.completed_at, watermark_id=attempt.id)
+    return {
+        'quiz_list.cards': Quiz.objects.with_card_data().order_by('-created_at', '-id')[:13],
+        'quiz_detail.stats': Quiz.objects.with_stats().filter(pk=quiz.pk),
+        'quiz_detail.user_attempts': QuizAttempt.objects.filter(user=user, quiz=quiz).order_by('-completed_at')[:5],
+        'take_quiz.answer_key': Question.objects.filter(quiz=quiz).order_by('created_at', 'id').values_list(
+            'id', 'choices__id', 'choices__is_correct'
+        ),
+        'quiz_results.answers': QuizAnswer.objects.filter(attempt=attempt).select_related(
+            'question', 'selected_choice'
+        ).order_by('question__created_at', 'question_id'),
+        'quiz_results.history': QuizAttempt.objects.filter(user=user, quiz=quiz).order_by('-completed_at')[:10],
+        'quiz_results.previous': QuizAttempt.objects.filter(
+            user=user, quiz=quiz, completed_at__lt=attempt.completed_at
+        ).order_by('-completed_at')[:1],
+        'quiz_results.rank': QuizScoreCount.objects.filter(
+            quiz=quiz, percentage_score__gt=attempt.percentage_score
+        ).order_by().values('quiz').annotate(total=Sum('attempt_count')),
+        'quiz_leaderboard.histogram': histogram,
+        'quiz_leaderboard.entries': entries,
+        'quiz_leaderboard.next_page': _leaderboard_querysets(quiz, cursor, 20)[1],
+        'quiz_analytics.questions': answers.values('question_id').annotate(
+            total=Count('id'), correct=Count('id', filter=Q(is_correct=True))
+        ),
+        'quiz_analytics.choices': answers.filter(selected_choice__isnull=False).values(
+            'selected_choice_id'
+        ).annotate(selected=Count('id')),
+        'quiz_analytics.question_times': answers.filter(time_taken__isnull=False).order_by(
+            'question_id', 'time_taken', 'id'
+        ).values_list('question_id', 'time_taken'),
+        'refresh_analytics_snapshots.pending': pending_attempts(snapshot)[:5000],
+        'user_dashboard.recent': QuizAttempt.objects.filter(user=user).select_related('quiz').order_by('-completed_at')[:10],
+        'user_dashboard.rollup': UserQuizRollup.objects.select_related(
+            'best_attempt__quiz', 'worst_attempt__quiz'
+        ).filter(user=user),
+        'sweep_in_progress_attempts.stale': InProgressAttempt.objects.filter(
+            last_seen_at__lt=attempt.completed_at
+        ).order_by(),
+        'fold_choice_votes.pending': ChoiceVoteShard.objects.filter(count__gt=0).order_by(),
+        'fold_quiz_stats.pending': QuizStatsShard.objects.filter(attempt_count__gt=0).order_by(),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Report EXPLAIN plans and timings of the view queries with and without the query indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Seed a synthetic dataset first')
+        parser.add_argument('--users', type=int, default=2000, help='Users to seed (default: 2000)')
+        parser.add_argument('--quizzes', type=int, default=50, help='Quizzes to seed (default: 50)')
+        parser.add_argument('--questions', type=int, default=40, help='Questions per quiz (default: 40)')
+        parser.add_argument('--attempts', type=int, default=1000, help='Attempts per quiz (default: 1000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query (default: 5)')
+        parser.add_argument('--explain', action='store_true', help='Print the EXPLAIN plan of every query')
+        parser.add_argument('--analyze', action='store_true', help='Use EXPLAIN ANALYZE (PostgreSQL only)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if not connection.features.can_rollback_ddl:
+            raise CommandError('The database cannot roll back DDL, so indexes cannot be dropped temporarily')
+
+        if options['seed']:
+            created = seed_dataset(
+                users=options['users'],
+                quizzes=options['quizzes'],
+                questions=options['questions'],
+                attempts=options['attempts']
+            )
+            self.stdout.write(f'Seeded {", ".join(f"{count} {name}" for name, count in created.items())}')
+
+        attempt = QuizAttempt.objects.filter(
+            quiz__title__startswith=f'[{BENCH_PREFIX}]'
+        ).select_related('quiz', 'user').order_by('-completed_at').first()
+        if attempt is None:
+            raise CommandError('No benchmark data found; run with --seed or "manage.py seed_benchmark" first')
+        # The oldest of the sample quiz's attempts exercises the longest pending scan
+        oldest = attempt.quiz.attempts.order_by('completed_at').first()
+        queries = view_queries(attempt.quiz, attempt.user, oldest)
+
+        self.refresh_planner_statistics()
+        after = self.measure(queries, options)
+        with transaction.atomic():
+            editor = connection.schema_editor()
+            with connection.cursor() as cursor:
+                for model, name, _ in INDEX_PLAN:
+                    cursor.execute(editor.sql_delete_index % {
+                        'name': editor.quote_name(name),
+                        'table': editor.quote_name(model._meta.db_table),
+                    })
+            self.refresh_planner_statistics()
+            before = self.measure(queries, options)
+            # Put the indexes back
+            transaction.set_rollback(True)
+
+        report = {
+            name: {'before': before[name], 'after': after[name]}
+            for name in queries
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for name, result in report.items():
+            before_ms = result['before']['median_ms']
+            after_ms = result['after']['median_ms']
+            speedup = before_ms / after_ms if after_ms else float('inf')
+            self.stdout.write(f'{name}: {before_ms:.2f} ms -> {after_ms:.2f} ms ({speedup:.1f}x)')
+            if options['explain']:
+                self.stdout.write('  before:\n    ' + result['before']['plan'].replace('\n', '\n    '))
+                self.stdout.write('  after:\n    ' + result['after']['plan'].replace('\n', '\n    '))
+        self.stdout.write(self.style.SUCCESS(f'Measured {len(report)} queries'))
+
+    def measure(self, queries, options):
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        results = {}
+        for name, queryset in queries.items():
+            # Querysets cache their rows, so time a fresh clone on every run
+            timings = time_call(lambda: list(queryset.all()), options['repeat'])
+            results[name] = {
+                'median_ms': round(statistics.median(timings), 3),
+                'plan': queryset.explain(**explain_options),
+            }
+        return results
+
+    def refresh_planner_statistics(self):
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
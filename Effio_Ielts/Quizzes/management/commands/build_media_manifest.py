@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Quizzes.media_manifest import manifest_enabled, register
+from Quizzes.models import Quiz, Question, Choice
+
+
+class Command(BaseCommand):
+    help = 'Record the content digest of every uploaded cover, question image, question audio and choice image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help='Files hashed per manifest insert (default: 200)')
+
+    def handle(self, *args, **options):
+        if not manifest_enabled():
+            raise CommandError('Media is stored on Cloudinary, whose URLs are already versioned')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        sources = [
+            (Quiz, 'cover_image'),
+            (Question, 'image'),
+            (Question, 'audio_file'),
+            (Choice, 'image'),
+        ]
+        recorded = 0
+        for model, field in sources:
+            rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).only('id', field)
+            chunk = []
+            for instance in rows.iterator(chunk_size=options['chunk_size']):
+                chunk.append(getattr(instance, field))
+                if len(chunk) >= options['chunk_size']:
+                    recorded += len(register(chunk))
+                    chunk = []
+            recorded += len(register(chunk))
+
+        self.stdout.write(self.style.SUCCESS(f'Media manifest covers {recorded} files'))
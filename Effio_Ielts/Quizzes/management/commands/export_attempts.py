@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Quizzes.exports import COLUMNS, FORMATS, export_rows, parse_bound
+
+
+class Command(BaseCommand):
+    help = 'Stream quiz attempts or answers as CSV or NDJSON, filtered by quiz and completion date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(COLUMNS), default='attempts', help='What to export (default: attempts)')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Output format (default: csv)')
+        parser.add_argument('--quiz', type=int, help='Only export this quiz id')
+        parser.add_argument('--since', help='Completed on or after this ISO date or datetime')
+        parser.add_argument('--until', help='Completed before this ISO datetime, or on or before this date')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched and written per chunk (default: 2000)')
+        parser.add_argument('--output', help='Write the export to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        try:
+            since = parse_bound(options['since'])
+            until = parse_bound(options['until'], end=True)
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        chunks = export_rows(
+            options['kind'], options['format'], options['chunk_size'],
+            quiz_id=options['quiz'], since=since, until=until
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from Quizzes.bundles import FORMATS, export_bundle, guess_format
+from Quizzes.models import Quiz
+
+
+class Command(BaseCommand):
+    help = 'Export quizzes with their questions and choices as a JSON Lines or CSV bundle'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz',
+            type=int,
+            action='append',
+            dest='quiz_ids',
+            help='Only export this quiz id (can be repeated)',
+        )
+        parser.add_argument('--format', choices=FORMATS, help='Bundle format (default: from --output, else jsonl)')
+        parser.add_argument('--output', help='Write the bundle to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['output'] or '')
+        quizzes = Quiz.objects.all()
+        if options['quiz_ids']:
+            quizzes = quizzes.filter(id__in=options['quiz_ids'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(export_bundle(quizzes, fmt))
+            self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+        else:
+            for chunk in export_bundle(quizzes, fmt):
+                self.stdout.write(chunk, ending='')
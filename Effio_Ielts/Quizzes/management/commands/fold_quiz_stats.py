@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Quizzes.stats import fold_quiz_stats
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded quiz statistics into QuizStats'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep folding every --interval seconds instead of exiting',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60,
+            help='Seconds between folds when running with --loop (default: 60)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            folded = fold_quiz_stats()
+            self.stdout.write(self.style.SUCCESS(f'Folded {folded} attempts into QuizStats'))
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Quizzes.images import create_derivatives, derivatives_enabled
+from Quizzes.models import Quiz, Question, Choice, ImageDerivativeSet
+
+
+class Command(BaseCommand):
+    help = 'Create the missing resized WebP/JPEG derivatives of quiz covers, question images and choice images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Forget the recorded derivative sets first, e.g. after changing IMAGE_DERIVATIVE_WIDTHS',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep creating derivatives every --interval seconds instead of exiting',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60,
+            help='Seconds between runs when running with --loop (default: 60)',
+        )
+
+    def handle(self, *args, **options):
+        if not derivatives_enabled():
+            raise CommandError('Images are stored on Cloudinary, which resizes them itself')
+        if options['rebuild']:
+            ImageDerivativeSet.objects.all().delete()
+
+        sources = [
+            (Quiz, 'cover_image'),
+            (Question, 'image'),
+            (Choice, 'image'),
+        ]
+        while True:
+            done = skipped = 0
+            for model, field in sources:
+                rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).only('id', field)
+                for instance in rows.iterator(chunk_size=200):
+                    # Images whose digest already has a set cost one manifest check
+                    derivative_set = create_derivatives(getattr(instance, field))
+                    if derivative_set is None or not derivative_set.widths:
+                        skipped += 1
+                    else:
+                        done += 1
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Derivatives ready for {done} images ({skipped} missing, unreadable or animated)'
+            ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
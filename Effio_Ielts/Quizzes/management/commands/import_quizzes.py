@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Quizzes.bundles import FORMATS, guess_format, import_bundle, open_text
+
+
+class Command(BaseCommand):
+    help = 'Import quizzes, questions and choices from JSON Lines or CSV bundles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Bundle files to import ("-" reads stdin)')
+        parser.add_argument('--format', choices=FORMATS, help='Bundle format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=50, help='Quizzes per transaction (default: 50)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the bundles without saving anything')
+
+    def handle(self, *args, **options):
+        failed = False
+        for path in options['paths']:
+            fmt = options['format'] or guess_format(path)
+            if path == '-':
+                result = import_bundle(open_text(sys.stdin.buffer, fmt), fmt, options['chunk_size'], options['dry_run'])
+            else:
+                try:
+                    with open(path, 'rb') as f:
+                        result = import_bundle(open_text(f, fmt), fmt, options['chunk_size'], options['dry_run'])
+                except OSError as error:
+                    raise CommandError(f'Cannot read {path}: {error}')
+
+            for error in result['errors']:
+                self.stderr.write(f'{path}: {error}')
+            failed = failed or bool(result['errors'])
+            verb = 'Validated' if options['dry_run'] else 'Imported'
+            self.stdout.write(self.style.SUCCESS(
+                f"{path}: {verb} {result['quizzes']} quizzes, {result['questions']} questions, "
+                f"{result['choices']} choices ({len(result['errors'])} skipped)"
+            ))
+
+        if failed:
+            raise CommandError('Some quizzes were skipped, see the errors above')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from Quizzes.ranking import rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild quiz score histograms and leaderboards from quiz attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz',
+            type=int,
+            action='append',
+            dest='quiz_ids',
+            help='Only rebuild this quiz id (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_rankings(options['quiz_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} leaderboard entries'))
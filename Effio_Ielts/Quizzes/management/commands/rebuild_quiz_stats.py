@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from Quizzes.stats import rebuild_quiz_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed QuizStats rows from quiz attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz',
+            type=int,
+            action='append',
+            dest='quiz_ids',
+            help='Only rebuild stats for this quiz id (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_quiz_stats(options['quiz_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {written} quizzes'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from Quizzes.rollups import rebuild_user_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-user dashboard rollups from quiz attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Only rebuild this user id (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_user_rollups(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} user rollups'))
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from Quizzes.analytics import question_times_interval, refresh_snapshot
+from Quizzes.models import Quiz, QuizStatsShard
+
+
+class Command(BaseCommand):
+    help = 'Fold new quiz attempts into the materialized analytics snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz',
+            type=int,
+            action='append',
+            dest='quiz_ids',
+            help='Only refresh this quiz id (can be repeated)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Attempts folded per transaction (default: 5000)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep refreshing every --interval seconds instead of exiting',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60,
+            help='Seconds between refreshes when running with --loop (default: 60)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Only quizzes with attempts newer than their snapshot, or with
+            # answer time percentiles due for a recomputation, need work
+            # (the latest attempt is in the stats row or a shard not folded yet)
+            pending = QuizStatsShard.objects.filter(quiz=OuterRef('pk')).order_by().values('quiz').annotate(
+                latest=Max('last_attempt_at')
+            ).values('latest')
+            quizzes = Quiz.objects.annotate(pending_attempt_at=Subquery(pending)).annotate(
+                latest_attempt_at=Greatest(
+                    Coalesce('stats__last_attempt_at', 'pending_attempt_at'),
+                    Coalesce('pending_attempt_at', 'stats__last_attempt_at')
+                )
+            ).filter(latest_attempt_at__isnull=False).filter(
+                Q(analytics_snapshot__isnull=True) |
+                Q(analytics_snapshot__watermark_at__isnull=True) |
+                Q(latest_attempt_at__gt=F('analytics_snapshot__watermark_at')) |
+                (
+                    ~Q(analytics_snapshot__question_times_watermark_id=F('analytics_snapshot__watermark_id')) &
+                    (
+                        Q(analytics_snapshot__question_times_at__isnull=True) |
+                        Q(analytics_snapshot__question_times_at__lte=timezone.now() - question_times_interval())
+                    )
+                )
+            )
+            if options['quiz_ids']:
+                quizzes = quizzes.filter(id__in=options['quiz_ids'])
+
+            total = 0
+            for quiz in quizzes:
+                _, folded = refresh_snapshot(quiz, batch_size=options['batch_size'])
+                total += folded
+                if folded:
+                    self.stdout.write(f'{quiz.title}: folded {folded} attempts')
+            self.stdout.write(self.style.SUCCESS(f'Folded {total} attempts into analytics snapshots'))
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
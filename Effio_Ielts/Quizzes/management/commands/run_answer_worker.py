@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Quizzes.answer_queue import drain_answer_jobs
+
+
+class Command(BaseCommand):
+    help = 'Write queued QuizAnswer rows and choice votes of graded attempts (DEFERRED_ANSWER_WRITES)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Attempts written per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep draining the queue, polling every --interval seconds when it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Seconds between polls of an empty queue with --loop (default: 2)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        while True:
+            attempts = answers = 0
+            while True:
+                batch_attempts, batch_answers = drain_answer_jobs(options['batch_size'])
+                attempts += batch_attempts
+                answers += batch_answers
+                if batch_attempts < options['batch_size']:
+                    break
+
+            if attempts or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Wrote {answers} answers of {attempts} attempts'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
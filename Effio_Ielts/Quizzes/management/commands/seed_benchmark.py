@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from Quizzes.benchmarking import clear_dataset, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic users, quizzes, questions, choices, attempts and answers for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Users to create (default: 200)')
+        parser.add_argument('--quizzes', type=int, default=20, help='Quizzes to create (default: 20)')
+        parser.add_argument('--questions', type=int, default=20, help='Questions per quiz (default: 20)')
+        parser.add_argument('--choices', type=int, default=4, help='Choices per question (default: 4)')
+        parser.add_argument('--attempts', type=int, default=100, help='Attempts per quiz (default: 100)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk insert (default: 2000)')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data first')
+        parser.add_argument('--clear-only', action='store_true', help='Delete previously seeded data and stop')
+
+    def handle(self, *args, **options):
+        if options['clear'] or options['clear_only']:
+            deleted = clear_dataset()
+            self.stdout.write(f'Deleted {deleted} seeded rows')
+            if options['clear_only']:
+                return
+
+        created = seed_dataset(
+            users=options['users'],
+            quizzes=options['quizzes'],
+            questions=options['questions'],
+            choices=options['choices'],
+            attempts=options['attempts'],
+            batch_size=options['batch_size'],
+            seed=options['seed']
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary}'))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Quizzes.progress import sweep_in_progress
+
+
+class Command(BaseCommand):
+    help = 'Delete in-progress quiz attempts abandoned without being submitted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=float,
+            help='Delete attempts idle for this many hours (default: IN_PROGRESS_IDLE_HOURS)',
+        )
+
+    def handle(self, *args, **options):
+        if options['hours'] is not None and options['hours'] <= 0:
+            raise CommandError('--hours must be positive')
+
+        older_than = timedelta(hours=options['hours']) if options['hours'] is not None else None
+        deleted = sweep_in_progress(older_than)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} abandoned in-progress attempts'))
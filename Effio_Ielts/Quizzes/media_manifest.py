@@ -0,0 +1,164 @@
+"""
+Content-hashed URLs for uploaded media.
+
+Upload names such as ``question_audio/part1.mp3`` say nothing about the
+bytes behind them, so browsers had to revalidate media on every exam. The
+manifest (one ``MediaManifestEntry`` row per stored file) records the
+SHA-256 digest of each cover, question image, question audio and choice
+image, and pages link to ``hashed/<digest>/<name>`` instead. Those URLs are
+served by ``Effio_Ielts.media_views.serve_media`` with
+``Cache-Control: public, max-age=31536000, immutable``, so a browser that
+has seen a file never asks for it again.
+
+Nothing is copied: a hashed path is an alias of the stored file, checked
+against the manifest when served. Files are hashed when a quiz, question or
+choice is saved (see ``Quizzes.signals``) or else the first time a page
+links to them; ``manage.py build_media_manifest`` hashes earlier uploads.
+Entries also hold the file's size and modification time, and a file whose
+size or time no longer matches is hashed again: storages reuse the name of
+a deleted file for the next upload, so a name alone does not pin the bytes.
+Cloudinary URLs are already versioned and are used as they are.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .models import MediaManifestEntry
+
+HASHED_PREFIX = 'hashed'
+HASH_LENGTH = 20
+CHUNK_SIZE = 64 * 1024
+
+
+def manifest_enabled():
+    return not getattr(settings, 'USE_CLOUDINARY', False)
+
+
+def file_digest(storage, name):
+    """Shortened SHA-256 hex digest of a stored file, read in chunks."""
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_path(name, digest):
+    return f'{HASHED_PREFIX}/{digest}/{name}'
+
+
+def file_state(storage, name):
+    """``(size, modified_at)`` of a stored file, or None when it cannot be read."""
+    try:
+        return storage.size(name), storage.get_modified_time(name)
+    except (OSError, NotImplementedError):
+        return None
+
+
+def current_digests(files):
+    """
+    ``{name: digest}`` for ``{name: storage}``, (re)hashing files the manifest has no current entry for.
+
+    Costs one query for any number of files, plus one upsert when some are
+    new or changed. Files that cannot be read are left out.
+    """
+    if not files:
+        return {}
+    entries = {
+        name: (digest, (size, modified_at))
+        for name, digest, size, modified_at in MediaManifestEntry.objects.filter(
+            name__in=files
+        ).values_list('name', 'digest', 'size', 'modified_at')
+    }
+
+    digests = {}
+    changed_entries = []
+    for name, storage in files.items():
+        state = file_state(storage, name)
+        if state is None:
+            continue
+        if name in entries and entries[name][1] == state:
+            digests[name] = entries[name][0]
+            continue
+        try:
+            digests[name] = file_digest(storage, name)
+        except OSError:
+            continue
+        size, modified_at = state
+        changed_entries.append(MediaManifestEntry(name=name, digest=digests[name], size=size, modified_at=modified_at))
+    # A concurrent first use records the same digests
+    MediaManifestEntry.objects.bulk_create(
+        changed_entries,
+        update_conflicts=True,
+        unique_fields=['name'],
+        update_fields=['digest', 'size', 'modified_at']
+    )
+    return digests
+
+
+def register(field_files):
+    """
+    ``{name: digest}`` for stored files, hashing and recording those the manifest lacks.
+
+    Empty fields and Cloudinary files are left out (see ``current_digests``).
+    """
+    if not manifest_enabled():
+        return {}
+    return current_digests({
+        field_file.name: field_file.storage
+        for field_file in field_files
+        if field_file and getattr(field_file, 'storage', None) is not None
+    })
+
+
+def hashed_urls(field_files, digests=None):
+    """
+    ``{name: url}`` of file fields, content-hashed where a digest is known and plain otherwise.
+
+    ``digests`` (as returned by ``register``) spares the manifest lookup when
+    the caller already made it.
+    """
+    field_files = [field_file for field_file in field_files if field_file and getattr(field_file, 'storage', None)]
+    if digests is None:
+        digests = register(field_files)
+    urls = {}
+    for field_file in field_files:
+        try:
+            if field_file.name in digests:
+                urls[field_file.name] = field_file.storage.url(hashed_path(field_file.name, digests[field_file.name]))
+            else:
+                urls[field_file.name] = field_file.url
+        except ValueError:
+            pass
+    return urls
+
+
+def hashed_url(field_file):
+    """URL of an optional file field (see ``hashed_urls``), or None when it is empty or unresolvable."""
+    if not field_file:
+        return None
+    if getattr(field_file, 'storage', None) is None:
+        # Cloudinary resources carry a versioned URL of their own
+        try:
+            return field_file.url
+        except ValueError:
+            return None
+    return hashed_urls([field_file]).get(field_file.name)
+
+
+def resolve_hashed(path):
+    """
+    Storage name behind a ``hashed/<digest>/<name>`` media path.
+
+    Returns None unless that is the current digest of the file, rehashing
+    it if it changed since it was recorded, so an immutable response always
+    carries the bytes its URL names.
+    """
+    prefix, _, rest = path.partition('/')
+    digest, _, name = rest.partition('/')
+    if prefix != HASHED_PREFIX or not digest or not name:
+        return None
+    if current_digests({name: default_storage}).get(name) != digest:
+        return None
+    return name
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def backfill_quiz_stats(apps, schema_editor):
+    QuizAttempt = apps.get_model('Quizzes', 'QuizAttempt')
+    QuizStats = apps.get_model('Quizzes', 'QuizStats')
+    rows = QuizAttempt.objects.order_by().values('quiz_id').annotate(
+        attempt_count=Count('id'),
+        score_sum=Sum('percentage_score'),
+        last_attempt_at=Max('completed_at'),
+        excellent_count=Count('id', filter=Q(percentage_score__gte=90)),
+        good_count=Count('id', filter=Q(percentage_score__gte=80, percentage_score__lt=90)),
+        average_count=Count('id', filter=Q(percentage_score__gte=70, percentage_score__lt=80)),
+        below_average_count=Count('id', filter=Q(percentage_score__gte=60, percentage_score__lt=70)),
+        poor_count=Count('id', filter=Q(percentage_score__lt=60)),
+    )
+    QuizStats.objects.bulk_create([QuizStats(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0007_choicevoteshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempt_count', models.IntegerField(default=0)),
+                ('score_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('excellent_count', models.IntegerField(default=0)),
+                ('good_count', models.IntegerField(default=0)),
+                ('average_count', models.IntegerField(default=0)),
+                ('below_average_count', models.IntegerField(default=0)),
+                ('poor_count', models.IntegerField(default=0)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='Quizzes.quiz')),
+            ],
+            options={
+                'verbose_name_plural': 'Quiz stats',
+            },
+        ),
+        migrations.RunPython(backfill_quiz_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0008_quizstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizAnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counts', models.JSONField(default=dict)),
+                ('watermark_at', models.DateTimeField(blank=True, null=True)),
+                ('watermark_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_snapshot', to='Quizzes.quiz')),
+            ],
+        ),
+    ]
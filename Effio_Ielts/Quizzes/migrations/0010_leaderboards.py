@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_rankings(apps, schema_editor):
+    QuizAttempt = apps.get_model('Quizzes', 'QuizAttempt')
+    QuizScoreCount = apps.get_model('Quizzes', 'QuizScoreCount')
+    LeaderboardEntry = apps.get_model('Quizzes', 'LeaderboardEntry')
+
+    counts = {}
+    best = {}
+    rows = QuizAttempt.objects.order_by('quiz_id', 'user_id', '-percentage_score', 'completed_at').values_list(
+        'id', 'quiz_id', 'user_id', 'percentage_score', 'completed_at'
+    )
+    for attempt_id, quiz_id, user_id, percentage_score, completed_at in rows.iterator(chunk_size=5000):
+        count = counts.setdefault((quiz_id, percentage_score), [0, 0])
+        count[0] += 1
+        if (quiz_id, user_id) not in best:
+            best[(quiz_id, user_id)] = LeaderboardEntry(
+                quiz_id=quiz_id,
+                user_id=user_id,
+                best_attempt_id=attempt_id,
+                best_score=percentage_score,
+                achieved_at=completed_at
+            )
+            count[1] += 1
+
+    QuizScoreCount.objects.bulk_create([
+        QuizScoreCount(quiz_id=quiz_id, percentage_score=percentage_score, attempt_count=attempt_count, best_count=best_count)
+        for (quiz_id, percentage_score), (attempt_count, best_count) in counts.items()
+    ], batch_size=1000)
+    LeaderboardEntry.objects.bulk_create(best.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0009_quizanalyticssnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('best_score', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('achieved_at', models.DateTimeField()),
+                ('best_attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Quizzes.quizattempt')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard', to='Quizzes.quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Leaderboard entries',
+                'ordering': ['-best_score', 'achieved_at'],
+                'indexes': [models.Index(fields=['quiz', '-best_score', 'achieved_at'], name='leaderboard_rank_idx')],
+                'unique_together': {('quiz', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='QuizScoreCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('percentage_score', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('attempt_count', models.IntegerField(default=0)),
+                ('best_count', models.IntegerField(default=0)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_counts', to='Quizzes.quiz')),
+            ],
+            options={
+                'unique_together': {('quiz', 'percentage_score')},
+            },
+        ),
+        migrations.RunPython(backfill_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0010_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['-created_at', '-id'], name='quiz_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0011_quiz_created_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='choicevoteshard',
+            index=models.Index(condition=models.Q(('count__gt', 0)), fields=['choice'], name='vote_shard_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['quiz', 'created_at'], name='question_quiz_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizanswer',
+            index=models.Index(fields=['question', 'is_correct'], name='answer_question_correct_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizanswer',
+            index=models.Index(condition=models.Q(('selected_choice__isnull', False)), fields=['question', 'selected_choice'], name='answer_question_choice_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['user', '-completed_at'], name='attempt_user_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['quiz', '-percentage_score'], name='attempt_quiz_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['quiz', 'completed_at', 'id'], name='attempt_quiz_done_idx'),
+        ),
+    ]
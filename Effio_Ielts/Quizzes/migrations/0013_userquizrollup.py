@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    QuizAttempt = apps.get_model('Quizzes', 'QuizAttempt')
+    UserQuizRollup = apps.get_model('Quizzes', 'UserQuizRollup')
+
+    user_attempts = QuizAttempt.objects.filter(user_id=OuterRef('user_id'))
+    rows = QuizAttempt.objects.order_by().values('user_id').annotate(
+        attempt_count=Count('id'),
+        quizzes_taken=Count('quiz', distinct=True),
+        score_sum=Sum('percentage_score'),
+        best_score=Max('percentage_score'),
+        worst_score=Min('percentage_score'),
+        best_attempt_id=Subquery(user_attempts.order_by('-percentage_score', 'completed_at').values('id')[:1]),
+        worst_attempt_id=Subquery(user_attempts.order_by('percentage_score', 'completed_at').values('id')[:1]),
+    )
+    UserQuizRollup.objects.bulk_create([UserQuizRollup(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0012_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserQuizRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempt_count', models.IntegerField(default=0)),
+                ('quizzes_taken', models.IntegerField(default=0)),
+                ('score_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('best_score', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('worst_score', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('best_attempt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Quizzes.quizattempt')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_rollup', to=settings.AUTH_USER_MODEL)),
+                ('worst_attempt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Quizzes.quizattempt')),
+            ],
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0013_userquizrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerWriteJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='answer_job', to='Quizzes.quizattempt')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0015_inprogressattempt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InProgressAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='Quizzes.inprogressattempt')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Quizzes.question')),
+                ('selected_choice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Quizzes.choice')),
+            ],
+            options={
+                'unique_together': {('attempt', 'question')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0016_inprogressanswer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizanalyticssnapshot',
+            name='question_times',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddIndex(
+            model_name='quizanswer',
+            index=models.Index(condition=models.Q(('time_taken__isnull', False)), fields=['question', 'time_taken'], name='answer_question_time_idx'),
+        ),
+    ]
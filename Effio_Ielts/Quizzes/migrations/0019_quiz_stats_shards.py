@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0018_media_manifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizStatsShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('attempt_count', models.IntegerField(default=0)),
+                ('score_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('excellent_count', models.IntegerField(default=0)),
+                ('good_count', models.IntegerField(default=0)),
+                ('average_count', models.IntegerField(default=0)),
+                ('below_average_count', models.IntegerField(default=0)),
+                ('poor_count', models.IntegerField(default=0)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_shards', to='Quizzes.quiz')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('attempt_count__gt', 0)), fields=['quiz'], name='stats_shard_pending_idx')],
+                'unique_together': {('quiz', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0019_quiz_stats_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediamanifestentry',
+            name='modified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediamanifestentry',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
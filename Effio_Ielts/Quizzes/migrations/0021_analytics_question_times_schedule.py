@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0020_media_manifest_file_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizanalyticssnapshot',
+            name='question_times_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizanalyticssnapshot',
+            name='question_times_watermark_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
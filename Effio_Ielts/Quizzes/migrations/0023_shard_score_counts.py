@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0022_leaderboard_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='quizscorecount',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='quizscorecount',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='quizscorecount',
+            unique_together={('quiz', 'percentage_score', 'shard')},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0023_shard_score_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivativeSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('widths', models.JSONField(default=list)),
+                ('fallback_extension', models.CharField(blank=True, max_length=4)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Quizzes', '0024_image_derivative_sets'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='question',
+            options={'ordering': ['created_at', 'id']},
+        ),
+    ]
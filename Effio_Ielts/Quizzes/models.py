@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
@@ -11,6 +13,51 @@ try:
 except ImportError:
     CLOUDINARY_AVAILABLE = False
 
+DEFAULT_COVER_IMAGE_URL = '/static/homepage/images/default-quiz-cover.svg'
+
+
+class QuizQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Annotate attempt count, score sum and average score in the same query.
+
+        Counts are the folded ``QuizStats`` row plus the quiz's shard rows
+        not folded yet (at most ``VOTE_COUNTER_SHARDS``), so they include
+        every graded attempt whether or not ``fold_quiz_stats`` ran.
+        """
+        pending = QuizStatsShard.objects.filter(quiz=OuterRef('pk')).order_by().values('quiz')
+        decimal = models.DecimalField(max_digits=14, decimal_places=2)
+        return self.annotate(
+            attempt_count=Coalesce(F('stats__attempt_count'), 0) + Coalesce(
+                Subquery(pending.annotate(total=Sum('attempt_count')).values('total')), 0
+            ),
+            score_total=Coalesce(F('stats__score_sum'), Value(0), output_field=decimal) + Coalesce(
+                Subquery(pending.annotate(total=Sum('score_sum')).values('total')), Value(0), output_field=decimal
+            ),
+        ).annotate(
+            average_score=Case(
+                When(attempt_count__gt=0, then=F('score_total') / F('attempt_count')),
+                default=Value(0),
+                output_field=models.DecimalField(max_digits=5, decimal_places=2)
+            )
+        )
+    
+    def with_card_data(self):
+        """
+        Annotate the question count shown on quiz cards in the same query.
+
+        Attempt statistics are left out: cards are cached until the quiz is
+        edited (see ``Quizzes.caching``), so counts that change with every
+        graded attempt would be served stale.
+        """
+        question_counts = Question.objects.filter(quiz=OuterRef('pk')).order_by().values('quiz').annotate(
+            count=Count('pk')
+        ).values('count')
+        return self.annotate(
+            question_count=Coalesce(Subquery(question_counts), 0),
+        )
+
+
 class Quiz(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -43,27 +90,33 @@ class Quiz(models.Model):
     due_date = models.DateTimeField()
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = QuizQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Quizzes"
+        indexes = [
+            # Keyset pagination of the quiz list
+            models.Index(fields=['-created_at', '-id'], name='quiz_created_id_idx'),
+        ]
     
     def get_cover_image_url(self):
         """Return cover image URL with fallback for missing files."""
         if self.cover_image:
             try:
-                # For Cloudinary fields, the URL is always available
-                if hasattr(self.cover_image, 'url'):
-                    return self.cover_image.url
-                # For regular ImageField, check if file exists
-                elif hasattr(self.cover_image, 'name') and self.cover_image.name:
-                    return self.cover_image.url
-                else:
-                    # If file doesn't exist, return default image
-                    return '/static/homepage/images/default-quiz-cover.svg'
+                # Imported here since the manifest module imports these models
+                from .media_manifest import hashed_url
+                # Cloudinary values build their URL without touching storage; uploads get a hashed URL
+                return hashed_url(self.cover_image) or DEFAULT_COVER_IMAGE_URL
             except (ValueError, AttributeError):
-                # If any error occurs, return default image
-                return '/static/homepage/images/default-quiz-cover.svg'
-        return '/static/homepage/images/default-quiz-cover.svg'
+                pass
+        return DEFAULT_COVER_IMAGE_URL
+    
+    def get_cover_image_sources(self):
+        """WebP and fallback ``srcset`` values of the cover's resized derivatives, or None."""
+        # Imported here since the images module imports these models
+        from .images import image_sources
+        return image_sources(self.cover_image)
     
     def has_valid_cover_image(self):
         """Check if quiz has a valid, accessible cover image."""
@@ -86,16 +139,39 @@ class Quiz(models.Model):
     def __str__(self):
         return self.title
     
+    def get_stats(self):
+        """Get the folded statistics row, or None if no attempt was folded yet"""
+        try:
+            return self.stats
+        except QuizStats.DoesNotExist:
+            return None
+    
+    def get_attempt_totals(self):
+        """
+        ``(attempt_count, score_sum)`` of every graded attempt.
+
+        Read from the ``with_stats`` annotations when present, else from the
+        folded stats plus one aggregate over the unfolded shard rows.
+        """
+        if hasattr(self, 'score_total'):
+            return self.attempt_count, self.score_total
+        if not hasattr(self, '_attempt_totals'):
+            stats = self.get_stats()
+            pending = self.stats_shards.aggregate(attempts=Sum('attempt_count'), score=Sum('score_sum'))
+            self._attempt_totals = (
+                (stats.attempt_count if stats else 0) + (pending['attempts'] or 0),
+                (stats.score_sum if stats else 0) + (pending['score'] or 0),
+            )
+        return self._attempt_totals
+    
     def get_average_score(self):
-        """Calculate average score across all attempts"""
-        attempts = self.attempts.all()
-        if not attempts:
-            return 0
-        return sum(attempt.percentage_score for attempt in attempts) / len(attempts)
+        """Average score across all attempts, from the stats and unfolded shards"""
+        attempt_count, score_sum = self.get_attempt_totals()
+        return score_sum / attempt_count if attempt_count else 0
     
     def get_total_attempts(self):
-        """Get total number of attempts for this quiz"""
-        return self.attempts.count()
+        """Get total number of attempts for this quiz, from the stats and unfolded shards"""
+        return self.get_attempt_totals()[0]
 
 class Question(models.Model):
     QUESTION_TYPES = [
@@ -114,7 +190,11 @@ class Question(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['created_at']
+        # Imported questions are bulk inserted with the same created_at; ids keep their bundle order
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['quiz', 'created_at'], name='question_quiz_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.quiz.title} - {self.text[:50]}"
@@ -148,6 +228,22 @@ class Choice(models.Model):
             return 0
         return (self.votes / total_votes) * 100
 
+class ChoiceVoteShard(models.Model):
+    """Sharded vote counter, folded back into Choice.votes by `manage.py fold_choice_votes`"""
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='vote_shards')
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)  # Votes not yet folded into Choice.votes
+    
+    class Meta:
+        unique_together = ['choice', 'shard']
+        indexes = [
+            # Only shards with votes waiting to be folded
+            models.Index(fields=['choice'], condition=models.Q(count__gt=0), name='vote_shard_pending_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.choice.text} - shard {self.shard} - {self.count}"
+
 class QuizAttempt(models.Model):
     """Track detailed quiz attempts and results"""
     PERFORMANCE_LEVELS = [
@@ -171,6 +267,15 @@ class QuizAttempt(models.Model):
     class Meta:
         ordering = ['-completed_at']
         unique_together = ['user', 'quiz', 'completed_at']  # Allow multiple attempts
+        indexes = [
+            # Dashboard history of a user; the per-quiz history is served by
+            # the (user, quiz, completed_at) unique constraint above
+            models.Index(fields=['user', '-completed_at'], name='attempt_user_done_idx'),
+            # Score ranking within a quiz
+            models.Index(fields=['quiz', '-percentage_score'], name='attempt_quiz_score_idx'),
+            # Analytics snapshot watermark scans
+            models.Index(fields=['quiz', 'completed_at', 'id'], name='attempt_quiz_done_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.quiz.title} - {self.percentage_score}%"
@@ -209,6 +314,36 @@ class QuizAttempt(models.Model):
         else:
             return 'F'
 
+class InProgressAttempt(models.Model):
+    """A quiz a user has opened but not submitted yet"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attempts_in_progress')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='attempts_in_progress')
+    started_at = models.DateTimeField(default=timezone.now)
+    last_seen_at = models.DateTimeField(default=timezone.now)  # Last activity, for sweeping abandoned attempts
+    
+    class Meta:
+        unique_together = ['user', 'quiz']
+        indexes = [
+            # Sweeping abandoned attempts
+            models.Index(fields=['last_seen_at'], name='in_progress_seen_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.quiz.title} - started {self.started_at}"
+
+class InProgressAnswer(models.Model):
+    """Autosaved answer of an in-progress attempt"""
+    attempt = models.ForeignKey(InProgressAttempt, on_delete=models.CASCADE, related_name='answers')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    selected_choice = models.ForeignKey(Choice, on_delete=models.CASCADE, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['attempt', 'question']
+    
+    def __str__(self):
+        return f"{self.attempt} - question {self.question_id} - choice {self.selected_choice_id}"
+
 class QuizAnswer(models.Model):
     """Track individual answers for detailed analytics"""
     attempt = models.ForeignKey(QuizAttempt, on_delete=models.CASCADE, related_name='answers')
@@ -219,7 +354,202 @@ class QuizAnswer(models.Model):
     
     class Meta:
         unique_together = ['attempt', 'question']
+        indexes = [
+            # Per-question success rates
+            models.Index(fields=['question', 'is_correct'], name='answer_question_correct_idx'),
+            # Per-choice distributions; unanswered questions are left out of the index
+            models.Index(
+                fields=['question', 'selected_choice'],
+                condition=models.Q(selected_choice__isnull=False),
+                name='answer_question_choice_idx'
+            ),
+            # Per-question answer time percentiles; untimed answers are left out
+            models.Index(
+                fields=['question', 'time_taken'],
+                condition=models.Q(time_taken__isnull=False),
+                name='answer_question_time_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.attempt.user.username} - {self.question.text[:30]} - {'✓' if self.is_correct else '✗'}"
 
+
+
+class AnswerWriteJob(models.Model):
+    """Answers of a graded attempt waiting to be written by the answer worker"""
+    attempt = models.OneToOneField(QuizAttempt, on_delete=models.CASCADE, related_name='answer_job')
+    # [question_id, selected_choice_id or null, is_correct, seconds or null] per question
+    answers = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"Answers of attempt {self.attempt_id} ({len(self.answers)} questions)"
+
+
+class QuizStats(models.Model):
+    """Denormalized per-quiz statistics, updated incrementally as attempts are graded"""
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, related_name='stats')
+    attempt_count = models.IntegerField(default=0)
+    score_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Sum of percentage scores
+    # Score histogram, one bucket per QuizAttempt.PERFORMANCE_LEVELS entry
+    excellent_count = models.IntegerField(default=0)
+    good_count = models.IntegerField(default=0)
+    average_count = models.IntegerField(default=0)
+    below_average_count = models.IntegerField(default=0)
+    poor_count = models.IntegerField(default=0)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = "Quiz stats"
+    
+    def __str__(self):
+        return f"{self.quiz.title} - {self.attempt_count} attempts"
+    
+    @property
+    def average_score(self):
+        """Average percentage score across all attempts"""
+        if not self.attempt_count:
+            return 0
+        return self.score_sum / self.attempt_count
+    
+    @property
+    def score_histogram(self):
+        """Attempt counts keyed by performance level"""
+        return {
+            level: getattr(self, f'{level}_count')
+            for level, _ in QuizAttempt.PERFORMANCE_LEVELS
+        }
+
+
+class QuizStatsShard(models.Model):
+    """Sharded QuizStats increments, folded into QuizStats by `manage.py fold_quiz_stats`"""
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='stats_shards')
+    shard = models.PositiveSmallIntegerField()
+    # Attempts not yet folded into QuizStats, with the same counters
+    attempt_count = models.IntegerField(default=0)
+    score_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    excellent_count = models.IntegerField(default=0)
+    good_count = models.IntegerField(default=0)
+    average_count = models.IntegerField(default=0)
+    below_average_count = models.IntegerField(default=0)
+    poor_count = models.IntegerField(default=0)
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ['quiz', 'shard']
+        indexes = [
+            # Only shards with attempts waiting to be folded
+            models.Index(fields=['quiz'], condition=models.Q(attempt_count__gt=0), name='stats_shard_pending_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.quiz.title} - shard {self.shard} - {self.attempt_count}"
+
+
+class QuizAnalyticsSnapshot(models.Model):
+    """Materialized analytics counters for a quiz, refreshed from new attempts only"""
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, related_name='analytics_snapshot')
+    counts = models.JSONField(default=dict)  # Additive counters, see Quizzes.analytics.collect_counts
+    # Median and p90 answer seconds per question id, see Quizzes.analytics.question_time_percentiles
+    question_times = models.JSONField(default=dict)
+    # When the percentiles were computed, and the watermark id they cover
+    question_times_at = models.DateTimeField(null=True, blank=True)
+    question_times_watermark_id = models.BigIntegerField(default=0)
+    # Last attempt folded into the counts, as a (completed_at, id) watermark
+    watermark_at = models.DateTimeField(null=True, blank=True)
+    watermark_id = models.BigIntegerField(default=0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.quiz.title} - analytics as of {self.watermark_at}"
+
+
+class QuizScoreCount(models.Model):
+    """Per-quiz score histogram backing bounded-time rank lookups, sharded per score"""
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='score_counts')
+    percentage_score = models.DecimalField(max_digits=5, decimal_places=2)
+    # Grading adds to a random shard; counts of a score are summed over its shards
+    shard = models.PositiveSmallIntegerField(default=0)
+    attempt_count = models.IntegerField(default=0)  # Attempts with exactly this score
+    best_count = models.IntegerField(default=0)  # Users whose best attempt has this score
+    
+    class Meta:
+        unique_together = ['quiz', 'percentage_score', 'shard']
+    
+    def __str__(self):
+        return f"{self.quiz.title} - {self.percentage_score}% - shard {self.shard} - {self.attempt_count} attempts"
+
+
+class LeaderboardEntry(models.Model):
+    """Best attempt of a user on a quiz"""
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='leaderboard')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    best_attempt = models.ForeignKey(QuizAttempt, on_delete=models.CASCADE, related_name='+')
+    best_score = models.DecimalField(max_digits=5, decimal_places=2)
+    achieved_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-best_score', 'achieved_at']
+        unique_together = ['quiz', 'user']
+        indexes = [
+            # Covers the keyset order of leaderboard pages, id breaking ties
+            models.Index(fields=['quiz', '-best_score', 'achieved_at', 'id'], name='leaderboard_rank_idx'),
+        ]
+        verbose_name_plural = "Leaderboard entries"
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.quiz.title} - {self.best_score}%"
+
+
+class UserQuizRollup(models.Model):
+    """Per-user dashboard totals, updated as the user's attempts are graded"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='quiz_rollup')
+    attempt_count = models.IntegerField(default=0)
+    quizzes_taken = models.IntegerField(default=0)  # Distinct quizzes attempted
+    score_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Sum of percentage scores
+    best_attempt = models.ForeignKey(QuizAttempt, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    best_score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    worst_attempt = models.ForeignKey(QuizAttempt, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    worst_score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.attempt_count} attempts"
+    
+    @property
+    def average_score(self):
+        """Average percentage score across all of the user's attempts"""
+        if not self.attempt_count:
+            return 0
+        return self.score_sum / self.attempt_count
+
+
+class MediaManifestEntry(models.Model):
+    """Content digest of an uploaded media file, for its hashed, immutable URL"""
+    name = models.CharField(max_length=255, unique=True)  # Storage name, as held by the file field
+    digest = models.CharField(max_length=64)  # Shortened SHA-256 hex digest of the file
+    # File state when hashed; a file whose size or time differs is hashed again
+    size = models.BigIntegerField(default=0)
+    modified_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name_plural = "Media manifest entries"
+    
+    def __str__(self):
+        return f"{self.name} ({self.digest})"
+
+
+class ImageDerivativeSet(models.Model):
+    """Resized derivatives created for an image, by the digest of its bytes (see Quizzes.images)"""
+    digest = models.CharField(max_length=64, unique=True)  # As in MediaManifestEntry.digest
+    widths = models.JSONField(default=list)  # Empty when the image cannot be resized
+    fallback_extension = models.CharField(max_length=4, blank=True)  # 'jpg' or 'png', next to the WebP files
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.digest} ({len(self.widths)} widths)"
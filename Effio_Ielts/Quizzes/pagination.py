@@ -0,0 +1,99 @@
+"""
+Pagination helpers for large listings.
+
+Keyset pagination walks a listing ordered by ``(-created_at, -id)`` from an
+opaque cursor instead of an OFFSET, so fetching page 500 costs the same index
+range scan as fetching page 1. Leaderboards walk ``(-best_score,
+achieved_at, id)`` the same way with score cursors. ``EstimatedCountPaginator`` spares admin
+changelists of huge tables the full COUNT(*).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(created_at, pk):
+    """Opaque, URL-safe cursor pointing just after the given row."""
+    return f'{(created_at - EPOCH) // timedelta(microseconds=1)}-{pk}'
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, pk)`` for a cursor, or None when it is missing or malformed."""
+    try:
+        microseconds, pk = cursor.split('-')
+        return EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def encode_score_cursor(score, achieved_at, pk):
+    """Opaque, URL-safe cursor pointing just after the given leaderboard row."""
+    return f'{score}_{encode_cursor(achieved_at, pk)}'
+
+
+def decode_score_cursor(cursor):
+    """Return ``(score, achieved_at, pk)`` for a score cursor, or None when it is missing or malformed."""
+    try:
+        score, position = cursor.split('_')
+        score = Decimal(score)
+    except (AttributeError, ValueError, InvalidOperation):
+        return None
+    position = decode_cursor(position)
+    if position is None or not score.is_finite():
+        return None
+    return (score, *position)
+
+
+def keyset_page(queryset, cursor=None, per_page=12):
+    """
+    One page of ``queryset`` in ``(-created_at, -id)`` order.
+
+    Returns ``(items, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # Fetch one extra row to know whether another page follows
+    items = list(queryset[:per_page + 1])
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    return items, encode_cursor(items[-1].created_at, items[-1].pk)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that trusts the planner's row estimate for huge, unfiltered tables.
+
+    On PostgreSQL an unfiltered COUNT(*) scans the whole table, so above
+    ``estimate_threshold`` rows the estimate kept in ``pg_class.reltuples``
+    (refreshed by autovacuum/ANALYZE) is used instead. Filtered querysets and
+    other databases get the exact count.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        connection = connections[queryset.db]
+        if query is not None and not query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Quoted, since the app label makes table names mixed case
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [connection.ops.quote_name(queryset.model._meta.db_table)]
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.estimate_threshold:
+                return row[0]
+        return super().count
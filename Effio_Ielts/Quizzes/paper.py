@@ -0,0 +1,82 @@
+"""
+Compiled quiz "papers" for the exam page.
+
+The question and choice structure of a quiz is serialized once into plain
+dicts and cached until the quiz, one of its questions or one of its choices
+changes (see ``Quizzes.signals``). Rendering the exam page then costs no
+database queries for its structure. Images and audio are linked through
+content-hashed URLs (see ``Quizzes.media_manifest``) that browsers cache for
+good. Choice order is shuffled per student with a seeded RNG, so reloading
+the page shows the same order.
+"""
+import random
+
+from django.core.cache import cache
+
+from .caching import get_timeout, quiz_paper_key, record
+from .images import image_sources_for
+from .media_manifest import hashed_urls, register
+
+
+def build_paper(quiz):
+    """Serialize the quiz's questions and choices (two queries, plus two for media URLs)."""
+    questions = list(quiz.questions.prefetch_related('choices'))
+    images = [question.image for question in questions] + [
+        choice.image for question in questions for choice in question.choices.all()
+    ]
+    media = images + [question.audio_file for question in questions]
+    digests = register(media)
+    urls = hashed_urls(media, digests)
+    sources = image_sources_for(images, digests)
+
+    def url(field_file):
+        return urls.get(field_file.name) if field_file else None
+
+    def image_sources(field_file):
+        return sources.get(field_file.name) if field_file else None
+
+    return [
+        {
+            'id': question.id,
+            'text': question.text,
+            'question_type': question.question_type,
+            'image_url': url(question.image),
+            'image_sources': image_sources(question.image),
+            'audio_url': url(question.audio_file),
+            'reading_passage': question.reading_passage,
+            'choices': [
+                {
+                    'id': choice.id,
+                    'text': choice.text,
+                    'image_url': url(choice.image),
+                    'image_sources': image_sources(choice.image),
+                }
+                for choice in question.choices.all()
+            ],
+        }
+        for question in questions
+    ]
+
+
+def get_paper(quiz):
+    """The quiz's compiled paper, from the cache when possible."""
+    key = quiz_paper_key(quiz.id)
+    paper = cache.get(key)
+    if paper is None:
+        record('quiz_paper', misses=1)
+        paper = build_paper(quiz)
+        cache.set(key, paper, get_timeout())
+    else:
+        record('quiz_paper', hits=1)
+    return paper
+
+
+def shuffled_paper(paper, seed):
+    """Copy of ``paper`` with every question's choices shuffled deterministically by ``seed``."""
+    rng = random.Random(seed)
+    shuffled = []
+    for question in paper:
+        choices = list(question['choices'])
+        rng.shuffle(choices)
+        shuffled.append(dict(question, choices=choices))
+    return shuffled
@@ -0,0 +1,133 @@
+"""
+Server-side state of quizzes being taken.
+
+Opening a quiz creates one ``InProgressAttempt`` row per (user, quiz) holding
+the start time, so timing is correct per quiz and nothing is written to the
+session on the exam path. Reopening the quiz finds the same row, which keeps
+the shuffled paper stable across reloads, unless it was idle for longer than
+``IN_PROGRESS_IDLE_HOURS``: such an attempt is abandoned and starts over, so
+its time is not counted from a start hours or days ago. While the quiz is open the exam
+page autosaves debounced batches of answer changes into ``InProgressAnswer``
+rows with one upsert per batch, so a dropped connection loses nothing.
+Submitting grades the attempt and deletes the row (and its saved answers) in
+one transaction. Rows of abandoned quizzes are removed
+in bulk by ``manage.py sweep_in_progress_attempts``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .grading import grade_submission
+from .models import InProgressAnswer, InProgressAttempt
+
+# Autosaves refresh last_seen_at at most this often (seconds), sparing a write per batch
+SEEN_RESOLUTION = 60
+
+
+def idle_limit():
+    """How long an in-progress attempt may go unseen before it counts as abandoned."""
+    return timedelta(hours=getattr(settings, 'IN_PROGRESS_IDLE_HOURS', 24))
+
+
+async def astart_attempt(user, quiz):
+    """
+    The user's in-progress attempt of the quiz, created on first use.
+
+    An abandoned attempt (see ``idle_limit``) is restarted with a new start
+    time and without its saved answers. ``saved_answers`` on the returned
+    attempt maps question ids to the autosaved choice ids (or None for a
+    cleared answer).
+    """
+    in_progress, created = await InProgressAttempt.objects.aget_or_create(user=user, quiz=quiz)
+    now = timezone.now()
+    if not created and now - in_progress.last_seen_at > idle_limit():
+        await in_progress.answers.all().adelete()
+        in_progress.started_at = in_progress.last_seen_at = now
+        await in_progress.asave(update_fields=['started_at', 'last_seen_at'])
+        created = True
+    elif not created and now - in_progress.last_seen_at > timedelta(seconds=SEEN_RESOLUTION):
+        # Reopening the quiz is activity too
+        in_progress.last_seen_at = now
+        await in_progress.asave(update_fields=['last_seen_at'])
+    in_progress.saved_answers = {} if created else {
+        question_id: choice_id
+        async for question_id, choice_id in in_progress.answers.values_list('question_id', 'selected_choice_id')
+    }
+    return in_progress
+
+
+async def asave_answers(user, quiz, paper, answers):
+    """
+    Upsert a batch of autosaved answers, ``{question_id: choice_id or None}``.
+
+    Answers are checked against the quiz's compiled ``paper``; unknown
+    questions or choices are ignored. Costs one lookup of the in-progress
+    attempt and a single ``INSERT ... ON CONFLICT DO UPDATE`` however many
+    answers the batch holds. Returns the number of answers saved and ignored,
+    or None when the user is not taking the quiz: an autosave arriving after
+    the submission must not bring the attempt back.
+    """
+    choices = {question['id']: {choice['id'] for choice in question['choices']} for question in paper}
+    rows = {
+        question_id: choice_id
+        for question_id, choice_id in answers.items()
+        if question_id in choices and (choice_id is None or choice_id in choices[question_id])
+    }
+
+    in_progress = await InProgressAttempt.objects.filter(user=user, quiz=quiz).afirst()
+    if in_progress is None:
+        return None
+    if rows:
+        try:
+            await InProgressAnswer.objects.abulk_create(
+                [
+                    InProgressAnswer(attempt=in_progress, question_id=question_id, selected_choice_id=choice_id)
+                    for question_id, choice_id in rows.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['attempt', 'question'],
+                update_fields=['selected_choice', 'updated_at']
+            )
+        except IntegrityError:
+            # The attempt was submitted (and deleted) since the lookup
+            return None
+
+    now = timezone.now()
+    if now - in_progress.last_seen_at > timedelta(seconds=SEEN_RESOLUTION):
+        await InProgressAttempt.objects.filter(pk=in_progress.pk).aupdate(last_seen_at=now)
+    return len(rows), len(answers) - len(rows)
+
+
+@transaction.atomic
+def finish_attempt(quiz, user, data, ip_address=None):
+    """
+    Grade a submission, timed from the user's in-progress attempt, and close that attempt.
+
+    A submission without an in-progress attempt (e.g. submitted twice) has
+    no known duration, so it is graded without one and its per-question
+    times are dropped.
+    """
+    in_progress = InProgressAttempt.objects.select_for_update().filter(user=user, quiz=quiz).first()
+    now = timezone.now()
+
+    attempt = grade_submission(
+        quiz,
+        user,
+        data,
+        started_at=in_progress.started_at if in_progress is not None else now,
+        time_taken=now - in_progress.started_at if in_progress is not None else None,
+        ip_address=ip_address
+    )
+    if in_progress is not None:
+        in_progress.delete()
+    return attempt
+
+
+def sweep_in_progress(older_than=None):
+    """Delete in-progress attempts not seen for ``older_than`` (``idle_limit()`` by default). Returns the number deleted."""
+    if older_than is None:
+        older_than = idle_limit()
+    _, deleted = InProgressAttempt.objects.filter(last_seen_at__lt=timezone.now() - older_than).delete()
+    return deleted.get(InProgressAttempt._meta.label, 0)
@@ -0,0 +1,226 @@
+"""
+Quiz rankings and leaderboards.
+
+Every quiz keeps a score histogram (``QuizScoreCount``): one row per distinct
+percentage score with the number of attempts and the number of users whose
+best attempt landed on it. A percentage has at most 10,001 distinct values,
+so a rank is a sum over a bounded number of index rows however many attempts
+the quiz has. ``LeaderboardEntry`` holds each user's best attempt for the
+"best attempt per user" ranking and the top-N leaderboard.
+
+Everyone scoring the same on a quiz would queue on that score's histogram
+row until their grading transaction commits, so, like choice votes (see
+``Quizzes.votes``), each attempt adds its deltas to one of
+``VOTE_COUNTER_SHARDS`` rows of the score picked at random. Readers already
+sum over score ranges, so shards need no folding; a score has at most
+``VOTE_COUNTER_SHARDS`` rows. The only row grading locks is the user's own
+leaderboard entry.
+"""
+import random
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from .models import LeaderboardEntry, QuizAttempt, QuizScoreCount
+from .pagination import decode_score_cursor, encode_score_cursor
+from .votes import get_shard_count
+
+
+def _adjust_score_counts(quiz_id, deltas):
+    """
+    Add ``{(percentage_score, field): delta}`` to one random histogram shard of each score.
+
+    Costs an ``INSERT ... ON CONFLICT DO NOTHING`` making sure the shard rows
+    exist and one UPDATE per score.
+    """
+    shard = random.randrange(get_shard_count())
+    # Sorted so concurrent submissions acquire row locks in the same order
+    scores = sorted({percentage_score for percentage_score, _ in deltas})
+    QuizScoreCount.objects.bulk_create(
+        [QuizScoreCount(quiz_id=quiz_id, percentage_score=percentage_score, shard=shard) for percentage_score in scores],
+        ignore_conflicts=True
+    )
+    for percentage_score in scores:
+        QuizScoreCount.objects.filter(quiz_id=quiz_id, percentage_score=percentage_score, shard=shard).update(**{
+            field: F(field) + delta
+            for (score, field), delta in deltas.items()
+            if score == percentage_score
+        })
+
+
+def record_attempt(attempt):
+    """
+    Fold a freshly graded attempt into the histogram and the leaderboard.
+
+    Returns True when this is the user's first attempt of the quiz.
+    """
+    deltas = Counter({(attempt.percentage_score, 'attempt_count'): 1})
+
+    entry, created = LeaderboardEntry.objects.select_for_update().get_or_create(
+        quiz_id=attempt.quiz_id,
+        user_id=attempt.user_id,
+        defaults={
+            'best_attempt': attempt,
+            'best_score': attempt.percentage_score,
+            'achieved_at': attempt.completed_at,
+        }
+    )
+    if created:
+        deltas[(attempt.percentage_score, 'best_count')] += 1
+    elif attempt.percentage_score > entry.best_score:
+        deltas[(entry.best_score, 'best_count')] -= 1
+        deltas[(attempt.percentage_score, 'best_count')] += 1
+        entry.best_attempt = attempt
+        entry.best_score = attempt.percentage_score
+        entry.achieved_at = attempt.completed_at
+        entry.save(update_fields=['best_attempt', 'best_score', 'achieved_at'])
+    _adjust_score_counts(attempt.quiz_id, deltas)
+    return created
+
+
+def _count_above(quiz_id, percentage_score, field):
+    return QuizScoreCount.objects.filter(
+        quiz_id=quiz_id,
+        percentage_score__gt=percentage_score
+    ).aggregate(total=Sum(field))['total'] or 0
+
+
+async def _acount_above(quiz_id, percentage_score, field):
+    totals = await QuizScoreCount.objects.filter(
+        quiz_id=quiz_id,
+        percentage_score__gt=percentage_score
+    ).aaggregate(total=Sum(field))
+    return totals['total'] or 0
+
+
+def attempt_rank(attempt):
+    """Rank of an attempt among all attempts of its quiz (1 = best)."""
+    return _count_above(attempt.quiz_id, attempt.percentage_score, 'attempt_count') + 1
+
+
+async def aattempt_rank(attempt):
+    """Async version of ``attempt_rank``."""
+    return await _acount_above(attempt.quiz_id, attempt.percentage_score, 'attempt_count') + 1
+
+
+def user_rank(quiz, user):
+    """Rank of the user's best attempt among all users' best attempts, or None."""
+    entry = LeaderboardEntry.objects.filter(quiz=quiz, user=user).only('best_score').first()
+    if entry is None:
+        return None
+    return _count_above(quiz.id, entry.best_score, 'best_count') + 1
+
+
+async def auser_rank(quiz, user):
+    """Async version of ``user_rank``."""
+    entry = await LeaderboardEntry.objects.filter(quiz=quiz, user=user).only('best_score').afirst()
+    if entry is None:
+        return None
+    return await _acount_above(quiz.id, entry.best_score, 'best_count') + 1
+
+
+def _leaderboard_querysets(quiz, cursor, per_page):
+    histogram = (
+        QuizScoreCount.objects.filter(quiz=quiz)
+        .values('percentage_score')
+        .annotate(users=Sum('best_count'))
+        .filter(users__gt=0)
+        .order_by('-percentage_score')
+        .values_list('percentage_score', 'users')
+    )
+    entries = LeaderboardEntry.objects.filter(quiz=quiz).select_related('user').order_by(
+        '-best_score', 'achieved_at', 'id'
+    )
+    position = decode_score_cursor(cursor)
+    if position is not None:
+        best_score, achieved_at, pk = position
+        entries = entries.filter(
+            Q(best_score__lt=best_score) |
+            Q(best_score=best_score, achieved_at__gt=achieved_at) |
+            Q(best_score=best_score, achieved_at=achieved_at, id__gt=pk)
+        )
+    # Fetch one extra row to know whether another page follows
+    return histogram, entries[:per_page + 1]
+
+
+def _rank_entries(histogram, entries, per_page):
+    ranks = {}
+    users_above = 0
+    for percentage_score, best_count in histogram:
+        ranks[percentage_score] = users_above + 1
+        users_above += best_count
+
+    next_cursor = None
+    if len(entries) > per_page:
+        entries = entries[:per_page]
+        last = entries[-1]
+        next_cursor = encode_score_cursor(last.best_score, last.achieved_at, last.pk)
+    for entry in entries:
+        entry.rank = ranks.get(entry.best_score)
+    return entries, users_above, next_cursor
+
+
+def leaderboard_page(quiz, cursor=None, per_page=20):
+    """
+    One page of the best-attempt-per-user leaderboard.
+
+    Pages follow a ``(best_score, achieved_at, id)`` cursor rather than an
+    OFFSET, so a deep page costs the same index range scan as the first.
+    Returns ``(entries, total_users, next_cursor)`` where entries carry a
+    competition rank (tied scores share a rank) and ``next_cursor`` is None
+    on the last page. Ranks come from the score histogram, so they cost one
+    bounded query regardless of the page requested.
+    """
+    histogram, entries = _leaderboard_querysets(quiz, cursor, per_page)
+    return _rank_entries(list(histogram), list(entries), per_page)
+
+
+async def aleaderboard_page(quiz, cursor=None, per_page=20):
+    """Async version of ``leaderboard_page``."""
+    histogram, entries = _leaderboard_querysets(quiz, cursor, per_page)
+    return _rank_entries([row async for row in histogram], [entry async for entry in entries], per_page)
+
+
+@transaction.atomic
+def rebuild_rankings(quiz_ids=None):
+    """
+    Recompute histograms and leaderboard entries from ``QuizAttempt``.
+
+    Returns the number of leaderboard entries written.
+    """
+    attempts = QuizAttempt.objects.all()
+    histograms = QuizScoreCount.objects.all()
+    entries = LeaderboardEntry.objects.all()
+    if quiz_ids is not None:
+        attempts = attempts.filter(quiz_id__in=quiz_ids)
+        histograms = histograms.filter(quiz_id__in=quiz_ids)
+        entries = entries.filter(quiz_id__in=quiz_ids)
+    histograms.delete()
+    entries.delete()
+
+    counts = {}
+    best = {}
+    rows = attempts.order_by('quiz_id', 'user_id', '-percentage_score', 'completed_at').values_list(
+        'id', 'quiz_id', 'user_id', 'percentage_score', 'completed_at'
+    )
+    for attempt_id, quiz_id, user_id, percentage_score, completed_at in rows.iterator(chunk_size=5000):
+        count = counts.setdefault((quiz_id, percentage_score), [0, 0])
+        count[0] += 1
+        if (quiz_id, user_id) not in best:
+            # Rows are ordered best-first per user
+            best[(quiz_id, user_id)] = LeaderboardEntry(
+                quiz_id=quiz_id,
+                user_id=user_id,
+                best_attempt_id=attempt_id,
+                best_score=percentage_score,
+                achieved_at=completed_at
+            )
+            count[1] += 1
+
+    QuizScoreCount.objects.bulk_create([
+        QuizScoreCount(quiz_id=quiz_id, percentage_score=percentage_score, attempt_count=attempt_count, best_count=best_count)
+        for (quiz_id, percentage_score), (attempt_count, best_count) in counts.items()
+    ], batch_size=1000)
+    LeaderboardEntry.objects.bulk_create(best.values(), batch_size=1000)
+    return len(best)
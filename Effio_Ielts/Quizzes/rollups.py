@@ -0,0 +1,131 @@
+"""
+Per-user dashboard totals.
+
+The dashboard needs a user's attempt count, distinct quizzes taken, average
+score and best and worst attempts. ``aggregate_user_stats`` computes them in
+one grouped query; with ``USER_QUIZ_ROLLUPS`` enabled (the default) grading
+also keeps them in a ``UserQuizRollup`` row, so the dashboard reads a single
+row however many attempts the user has.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, OuterRef, Q, Subquery, Sum, Value, When
+
+from .models import QuizAttempt, UserQuizRollup
+
+
+def rollups_enabled():
+    return getattr(settings, 'USER_QUIZ_ROLLUPS', True)
+
+
+def aggregate_user_stats(attempts):
+    """
+    Compute rollup field values per user id for the given attempts in one grouped query.
+
+    Best and worst attempts are picked among all of each user's attempts,
+    the earliest one winning ties.
+    """
+    user_attempts = QuizAttempt.objects.filter(user_id=OuterRef('user_id'))
+    rows = attempts.order_by().values('user_id').annotate(
+        attempt_count=Count('id'),
+        quizzes_taken=Count('quiz', distinct=True),
+        score_sum=Sum('percentage_score'),
+        best_score=Max('percentage_score'),
+        worst_score=Min('percentage_score'),
+        best_attempt_id=Subquery(user_attempts.order_by('-percentage_score', 'completed_at').values('id')[:1]),
+        worst_attempt_id=Subquery(user_attempts.order_by('percentage_score', 'completed_at').values('id')[:1]),
+    )
+    return {row.pop('user_id'): row for row in rows}
+
+
+def replace_if(condition, field, value):
+    """Expression setting ``field`` to ``value`` in rows matching ``condition`` and keeping it elsewhere."""
+    return Case(
+        When(condition, then=Value(value)),
+        default=F(field),
+        output_field=UserQuizRollup._meta.get_field(field)
+    )
+
+
+def record_attempt(attempt, first_of_quiz):
+    """
+    Fold a freshly graded attempt into its user's rollup row.
+
+    ``first_of_quiz`` tells whether this is the user's first attempt of the
+    quiz (as returned by ``ranking.record_attempt``). As with the vote
+    shards, the row is created with ``INSERT ... ON CONFLICT DO NOTHING``
+    and the attempt added with one UPDATE of F() expressions, so concurrent
+    first attempts of a user cannot overwrite each other's totals.
+    """
+    if not rollups_enabled():
+        return
+
+    if not UserQuizRollup.objects.filter(user_id=attempt.user_id).exists():
+        # No row yet: start it from the user's earlier history, this attempt
+        # excluded; a concurrent first attempt may insert it first
+        values = aggregate_user_stats(
+            QuizAttempt.objects.filter(user_id=attempt.user_id).exclude(pk=attempt.pk)
+        ).get(attempt.user_id, {})
+        UserQuizRollup.objects.bulk_create([UserQuizRollup(user_id=attempt.user_id, **values)], ignore_conflicts=True)
+
+    score = attempt.percentage_score
+    beats_best = Q(best_score__isnull=True) | Q(best_score__lt=score)
+    beats_worst = Q(worst_score__isnull=True) | Q(worst_score__gt=score)
+    # Attempts before scores, for databases applying SET clauses in order
+    UserQuizRollup.objects.filter(user_id=attempt.user_id).update(
+        attempt_count=F('attempt_count') + 1,
+        quizzes_taken=F('quizzes_taken') + int(first_of_quiz),
+        score_sum=F('score_sum') + score,
+        best_attempt=replace_if(beats_best, 'best_attempt', attempt.pk),
+        best_score=replace_if(beats_best, 'best_score', score),
+        worst_attempt=replace_if(beats_worst, 'worst_attempt', attempt.pk),
+        worst_score=replace_if(beats_worst, 'worst_score', score),
+    )
+
+
+def get_user_rollup(user):
+    """
+    Dashboard totals of a user as a ``UserQuizRollup``, with best and worst attempts and their quizzes loaded.
+
+    Reads the stored row when rollups are enabled and falls back to one
+    aggregate query plus one query for the best and worst attempts. The
+    fallback instance is not saved.
+    """
+    if rollups_enabled():
+        rollup = UserQuizRollup.objects.select_related(
+            'best_attempt__quiz', 'worst_attempt__quiz'
+        ).filter(user=user).first()
+        if rollup is not None:
+            return rollup
+
+    values = aggregate_user_stats(QuizAttempt.objects.filter(user=user)).get(user.pk)
+    if values is None:
+        return UserQuizRollup(user=user)
+
+    rollup = UserQuizRollup(user=user, **values)
+    attempts = QuizAttempt.objects.select_related('quiz').in_bulk([rollup.best_attempt_id, rollup.worst_attempt_id])
+    rollup.best_attempt = attempts.get(rollup.best_attempt_id)
+    rollup.worst_attempt = attempts.get(rollup.worst_attempt_id)
+    return rollup
+
+
+@transaction.atomic
+def rebuild_user_rollups(user_ids=None):
+    """
+    Recompute rollup rows from ``QuizAttempt``, for all users or the given ids.
+
+    Returns the number of rollup rows written.
+    """
+    attempts = QuizAttempt.objects.all()
+    rollups = UserQuizRollup.objects.all()
+    if user_ids is not None:
+        attempts = attempts.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    rollups.delete()
+    rows = [
+        UserQuizRollup(user_id=user_id, **values)
+        for user_id, values in aggregate_user_stats(attempts).items()
+    ]
+    UserQuizRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
@@ -0,0 +1,52 @@
+"""
+Cache invalidation for quiz content.
+
+Editing a quiz, one of its questions or one of its choices drops exactly the
+cached data derived from that quiz (see ``Quizzes.caching.invalidate_quiz``).
+Saving one with an image or audio file also records the file in the media
+manifest (see ``Quizzes.media_manifest``), so pages never have to hash it.
+Resized image derivatives are left to ``manage.py generate_image_derivatives``
+(see ``Quizzes.images``), since decoding an image is too slow for a save.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_quiz
+from .media_manifest import register
+from .models import Quiz, Question, Choice
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    invalidate_quiz(instance.pk)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate_quiz(instance.quiz_id)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    quiz_id = Question.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    # A choice deleted along with its question is covered by the question's signal
+    if quiz_id is not None:
+        invalidate_quiz(quiz_id)
+
+
+@receiver(post_save, sender=Quiz)
+def quiz_media_saved(sender, instance, **kwargs):
+    register([instance.cover_image])
+
+
+@receiver(post_save, sender=Question)
+def question_media_saved(sender, instance, **kwargs):
+    register([instance.image, instance.audio_file])
+
+
+@receiver(post_save, sender=Choice)
+def choice_media_saved(sender, instance, **kwargs):
+    register([instance.image])
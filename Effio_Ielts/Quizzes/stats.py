@@ -0,0 +1,140 @@
+"""
+Maintenance of the denormalized ``QuizStats`` rows.
+
+Quiz pages read attempt counts, averages and the score histogram from one
+stats row per quiz in O(1). Grading does not update that row, which every
+submitter of the quiz would otherwise queue on until their transaction
+commits: like choice votes (see ``Quizzes.votes``), each attempt is added to
+one of ``VOTE_COUNTER_SHARDS`` shard rows picked at random, and
+``fold_quiz_stats`` (run by ``manage.py fold_quiz_stats``) periodically
+moves the shard totals into ``QuizStats``. Readers add the quiz's unfolded
+shard rows to its stats row (``Quiz.objects.with_stats()``), so counts are
+current whether or not the fold has run. ``rebuild_quiz_stats``
+recomputes the rows from ``QuizAttempt`` (``manage.py rebuild_quiz_stats``)
+after imports or manual data fixes.
+"""
+import random
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import QuizAttempt, QuizStats, QuizStatsShard
+from .votes import get_shard_count
+
+# Score ranges of QuizAttempt.performance_level, as queryset filters
+PERFORMANCE_FILTERS = {
+    'excellent': Q(percentage_score__gte=90),
+    'good': Q(percentage_score__gte=80, percentage_score__lt=90),
+    'average': Q(percentage_score__gte=70, percentage_score__lt=80),
+    'below_average': Q(percentage_score__gte=60, percentage_score__lt=70),
+    'poor': Q(percentage_score__lt=60),
+}
+
+# Additive counters shared by QuizStats and QuizStatsShard
+COUNTER_FIELDS = ['attempt_count', 'score_sum', *[f'{level}_count' for level in PERFORMANCE_FILTERS]]
+
+
+def latest(field, value):
+    """Expression for the later of a nullable datetime column and ``value``."""
+    return Greatest(Coalesce(F(field), Value(value)), Value(value))
+
+
+def record_attempt(attempt):
+    """
+    Add a freshly graded attempt to a random stats shard of its quiz.
+
+    Costs an ``INSERT ... ON CONFLICT DO NOTHING`` making sure the shard
+    row exists and one UPDATE incrementing it.
+    """
+    shard = random.randrange(get_shard_count())
+    QuizStatsShard.objects.bulk_create(
+        [QuizStatsShard(quiz_id=attempt.quiz_id, shard=shard)],
+        ignore_conflicts=True
+    )
+    QuizStatsShard.objects.filter(quiz_id=attempt.quiz_id, shard=shard).update(
+        attempt_count=F('attempt_count') + 1,
+        score_sum=F('score_sum') + attempt.percentage_score,
+        last_attempt_at=latest('last_attempt_at', attempt.completed_at),
+        **{f'{attempt.performance_level}_count': F(f'{attempt.performance_level}_count') + 1}
+    )
+
+
+@transaction.atomic
+def fold_quiz_stats():
+    """
+    Move pending shard totals into ``QuizStats``, with one UPDATE per quiz.
+
+    Shard rows are locked while they are folded, so attempts recorded
+    concurrently either land before the fold (and are folded) or wait for it
+    to commit (and are folded next time). Returns the number of attempts folded.
+    """
+    shards = list(
+        QuizStatsShard.objects.select_for_update()
+        .filter(attempt_count__gt=0)
+        .values_list('pk', 'quiz_id', 'last_attempt_at', *COUNTER_FIELDS)
+    )
+    if not shards:
+        return 0
+
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    last_attempts = {}
+    for _, quiz_id, last_attempt_at, *counters in shards:
+        for field, value in zip(COUNTER_FIELDS, counters):
+            totals[quiz_id][field] += value
+        if last_attempt_at is not None:
+            last_attempts[quiz_id] = max(last_attempts.get(quiz_id, last_attempt_at), last_attempt_at)
+
+    QuizStats.objects.bulk_create([QuizStats(quiz_id=quiz_id) for quiz_id in sorted(totals)], ignore_conflicts=True)
+    for quiz_id in sorted(totals):
+        updates = {field: F(field) + value for field, value in totals[quiz_id].items()}
+        if quiz_id in last_attempts:
+            updates['last_attempt_at'] = latest('last_attempt_at', last_attempts[quiz_id])
+        QuizStats.objects.filter(quiz_id=quiz_id).update(**updates)
+
+    QuizStatsShard.objects.filter(pk__in=[pk for pk, *_ in shards]).update(
+        last_attempt_at=None,
+        **dict.fromkeys(COUNTER_FIELDS, 0)
+    )
+    return sum(total['attempt_count'] for total in totals.values())
+
+
+def aggregate_quiz_stats(attempts):
+    """Compute stats field values per quiz id for the given attempts in one grouped query."""
+    rows = attempts.order_by().values('quiz_id').annotate(
+        attempt_count=Count('id'),
+        score_sum=Sum('percentage_score'),
+        last_attempt_at=Max('completed_at'),
+        **{
+            f'{level}_count': Count('id', filter=condition)
+            for level, condition in PERFORMANCE_FILTERS.items()
+        }
+    )
+    return {row.pop('quiz_id'): row for row in rows}
+
+
+@transaction.atomic
+def rebuild_quiz_stats(quiz_ids=None):
+    """
+    Recompute stats rows from scratch, for all quizzes or the given ids.
+
+    Returns the number of stats rows written.
+    """
+    attempts = QuizAttempt.objects.all()
+    stats = QuizStats.objects.all()
+    shards = QuizStatsShard.objects.all()
+    if quiz_ids is not None:
+        attempts = attempts.filter(quiz_id__in=quiz_ids)
+        stats = stats.filter(quiz_id__in=quiz_ids)
+        shards = shards.filter(quiz_id__in=quiz_ids)
+
+    # Pending shard totals are covered by the recomputed rows
+    shards.delete()
+    stats.delete()
+    rows = [
+        QuizStats(quiz_id=quiz_id, **values)
+        for quiz_id, values in aggregate_quiz_stats(attempts).items()
+    ]
+    QuizStats.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
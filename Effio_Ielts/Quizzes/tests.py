@@ -1,3 +1,1416 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO, TextIOWrapper
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from Effio_Ielts.instrumentation import histogram
+from Effio_Ielts.media_views import serve_media
+
+from .analytics import refresh_snapshot
+from .benchmarking import seed_dataset
+from .bundles import export_bundle, import_bundle, open_text
+from .caching import cache_metrics, check_shared_cache, render_quiz_cards
+from .grading import grade_submission
+from .images import image_derivatives
+from .management.commands.benchmark_indexes import INDEX_PLAN
+from .models import AnswerWriteJob, ChoiceVoteShard, ImageDerivativeSet, InProgressAnswer, InProgressAttempt, LeaderboardEntry, MediaManifestEntry, Quiz, QuizAnalyticsSnapshot, QuizStats, QuizStatsShard, Question, Choice, QuizAnswer, QuizAttempt, QuizScoreCount, UserQuizRollup
+from .paper import build_paper
+from .ranking import attempt_rank, leaderboard_page, rebuild_rankings
+from .rollups import rebuild_user_rollups
+from .stats import fold_quiz_stats, rebuild_quiz_stats
+from .votes import fold_votes, record_votes
+from .views import get_user_rank
+
+
+def make_quiz(question_count, choice_count=4):
+    """Create a quiz whose first choice is always the correct one."""
+    quiz = Quiz.objects.create(
+        title=f'Quiz with {question_count} questions',
+        description='Test quiz',
+        due_date=timezone.now() + timedelta(days=7)
+    )
+    for number in range(question_count):
+        question = Question.objects.create(quiz=quiz, text=f'Question {number}')
+        Choice.objects.bulk_create([
+            Choice(question=question, text=f'Choice {index}', is_correct=index == 0)
+            for index in range(choice_count)
+        ])
+    return quiz
+
+
+def submit(quiz, user, pick):
+    """Grade a submission choosing ``pick(choices)`` for every question."""
+    data = {}
+    for question in quiz.questions.prefetch_related('choices'):
+        data[f'question_{question.id}'] = str(pick(list(question.choices.all())).id)
+    return grade_submission(quiz, user, data, started_at=timezone.now())
+
+
+class GradingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student')
+
+    def count_grading_queries(self, quiz):
+        with CaptureQueriesContext(connection) as queries:
+            attempt = grade_submission(quiz, self.user, self.data[quiz.id], started_at=timezone.now())
+        self.assertEqual(attempt.score, attempt.total_questions)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_quiz_size(self):
+        small_quiz = make_quiz(2)
+        large_quiz = make_quiz(40)
+        self.data = {}
+        for quiz in (small_quiz, large_quiz):
+            # The first attempt creates the leaderboard and rollup rows
+            submit(quiz, self.user, lambda choices: choices[0])
+            self.data[quiz.id] = {
+                f'question_{question_id}': str(choice_id)
+                for question_id, choice_id in Choice.objects.filter(
+                    question__quiz=quiz, is_correct=True
+                ).values_list('question_id', 'id')
+            }
+
+        self.assertEqual(self.count_grading_queries(small_quiz), self.count_grading_queries(large_quiz))
+        self.assertEqual(QuizAnswer.objects.filter(attempt__quiz=large_quiz).count(), 80)
+
+
+class QuizAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='password')
+        self.client.force_login(self.user)
+
+    def count_analytics_queries(self, quiz):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quizzes:quiz_analytics', args=[quiz.id]), {'fresh': '1'})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_quiz_size(self):
+        self.user.is_staff = True
+        self.user.save()
+        small_quiz = make_quiz(2)
+        large_quiz = make_quiz(40)
+        for quiz in (small_quiz, large_quiz):
+            submit(quiz, self.user, lambda choices: choices[0])
+            submit(quiz, self.user, lambda choices: choices[1])
+
+        # Warm up the session so both requests do the same bookkeeping
+        self.count_analytics_queries(small_quiz)
+
+        self.assertEqual(
+            self.count_analytics_queries(small_quiz),
+            self.count_analytics_queries(large_quiz)
+        )
+        self.assertLessEqual(self.count_analytics_queries(large_quiz), 10)
+
+    @override_settings(ANALYTICS_SNAPSHOT_SETTLE_SECONDS=0)
+    def test_counts(self):
+        quiz = make_quiz(2)
+        submit(quiz, self.user, lambda choices: choices[0])
+        submit(quiz, self.user, lambda choices: choices[1])
+        submit(quiz, self.user, lambda choices: choices[0])
+
+        response = self.client.get(reverse('quizzes:quiz_analytics', args=[quiz.id]))
+
+        self.assertEqual(response.context['total_attempts'], 3)
+        self.assertEqual(response.context['avg_score'], 66.7)
+        self.assertEqual(response.context['performance_distribution']['excellent'], 2)
+        self.assertEqual(response.context['performance_distribution']['poor'], 1)
+        question_data = response.context['questions_data'][0]
+        self.assertEqual(question_data['total_answers'], 3)
+        self.assertEqual(question_data['success_rate'], 66.7)
+        self.assertEqual(
+            [choice['count'] for choice in question_data['choices']],
+            [2, 1, 0, 0]
+        )
+
+    @override_settings(ANALYTICS_SNAPSHOT_SETTLE_SECONDS=0)
+    def test_snapshot_folds_only_new_attempts(self):
+        quiz = make_quiz(2)
+        submit(quiz, self.user, lambda choices: choices[0])
+        snapshot, folded = refresh_snapshot(quiz)
+        self.assertEqual(folded, 1)
+
+        submit(quiz, self.user, lambda choices: choices[1])
+        snapshot, folded = refresh_snapshot(quiz)
+        self.assertEqual(folded, 1)
+        _, folded = refresh_snapshot(quiz)
+        self.assertEqual(folded, 0)
+
+        response = self.client.get(reverse('quizzes:quiz_analytics', args=[quiz.id]))
+        self.assertEqual(response.context['total_attempts'], 2)
+        self.assertEqual(response.context['questions_data'][0]['success_rate'], 50.0)
+
+    @override_settings(ANALYTICS_SNAPSHOT_SETTLE_SECONDS=0)
+    def test_question_time_percentiles(self):
+        quiz = make_quiz(2)
+        first, second = quiz.questions.order_by('created_at', 'id')
+        for seconds in range(1, 11):
+            data = {f'question_{first.id}': '', 'question_times': json.dumps({first.id: seconds, second.id: 'junk'})}
+            grade_submission(quiz, self.user, data, started_at=timezone.now(), time_taken=timedelta(seconds=8))
+
+        # Times are capped at the attempt's duration
+        self.assertEqual(
+            sorted(QuizAnswer.objects.filter(question=first).values_list('time_taken', flat=True))[-3:],
+            [timedelta(seconds=8)] * 3
+        )
+        self.assertFalse(QuizAnswer.objects.filter(question=second, time_taken__isnull=False).exists())
+
+        response = self.client.get(reverse('quizzes:quiz_analytics', args=[quiz.id]))
+        first_data, second_data = response.context['questions_data']
+        self.assertEqual((first_data['median_time'], first_data['p90_time']), (timedelta(seconds=5), timedelta(seconds=8)))
+        self.assertIsNone(second_data['median_time'])
+        self.assertContains(response, 'Median answer time 5s')
+
+    @override_settings(ANALYTICS_SNAPSHOT_SETTLE_SECONDS=0)
+    def test_question_times_are_recomputed_on_their_own_schedule(self):
+        quiz = make_quiz(1)
+        question = quiz.questions.get()
+
+        def answer(seconds):
+            data = {'question_times': json.dumps({question.id: seconds})}
+            grade_submission(quiz, self.user, data, started_at=timezone.now(), time_taken=timedelta(minutes=1))
+
+        answer(10)
+        snapshot, _ = refresh_snapshot(quiz)
+        self.assertEqual(snapshot.question_times, {str(question.id): [10.0, 10.0]})
+
+        answer(30)
+        answer(30)
+        snapshot, folded = refresh_snapshot(quiz)
+        self.assertEqual(folded, 2)
+        self.assertEqual(snapshot.question_times, {str(question.id): [10.0, 10.0]})
+
+        QuizAnalyticsSnapshot.objects.update(question_times_at=timezone.now() - timedelta(hours=2))
+        call_command('refresh_analytics_snapshots', stdout=StringIO())
+        self.assertEqual(QuizAnalyticsSnapshot.objects.get().question_times, {str(question.id): [30.0, 30.0]})
+
+    def test_submission_without_a_duration_keeps_no_question_times(self):
+        quiz = make_quiz(1)
+        question = quiz.questions.get()
+        data = {'question_times': json.dumps({question.id: 12})}
+
+        self.client.post(reverse('quizzes:take_quiz', args=[quiz.id]), data)
+
+        attempt = quiz.attempts.get()
+        self.assertIsNone(attempt.time_taken)
+        self.assertIsNone(attempt.answers.get().time_taken)
+
+
+class QuizStatsTests(TestCase):
+    def setUp(self):
+        self.quiz = make_quiz(2)
+        self.users = [User.objects.create_user(username=f'student{number}') for number in range(6)]
+
+    def grade_all(self):
+        # Three perfect attempts, three with half the answers right
+        for number, user in enumerate(self.users):
+            if number < 3:
+                submit(self.quiz, user, lambda choices: choices[0])
+            else:
+                answers = iter([0, 1])
+                submit(self.quiz, user, lambda choices: choices[next(answers)])
+
+    def assert_stats(self, stats):
+        self.assertEqual(stats.attempt_count, 6)
+        self.assertEqual(stats.score_sum, Decimal('450'))
+        self.assertEqual(stats.average_score, 75)
+        self.assertEqual((stats.excellent_count, stats.poor_count), (3, 3))
+        self.assertEqual(stats.last_attempt_at, QuizAttempt.objects.latest('completed_at').completed_at)
+
+    @override_settings(VOTE_COUNTER_SHARDS=4)
+    def test_record_attempt_spreads_over_shards_and_folds(self):
+        with patch('Quizzes.stats.random') as shard_random:
+            shard_random.randrange.side_effect = [0, 1, 2, 3, 0, 1]
+            self.grade_all()
+
+        self.assertEqual(QuizStatsShard.objects.filter(quiz=self.quiz).count(), 4)
+        self.assertFalse(QuizStats.objects.filter(quiz=self.quiz).exists())
+
+        self.assertEqual(fold_quiz_stats(), 6)
+        self.assert_stats(QuizStats.objects.get(quiz=self.quiz))
+        self.assertFalse(QuizStatsShard.objects.filter(attempt_count__gt=0).exists())
+        self.assertEqual(fold_quiz_stats(), 0)
+
+        submit(self.quiz, self.users[0], lambda choices: choices[0])
+        fold_quiz_stats()
+        self.assertEqual(QuizStats.objects.get(quiz=self.quiz).attempt_count, 7)
+
+    def test_counts_include_unfolded_shards(self):
+        self.grade_all()
+        fold_quiz_stats()
+        submit(self.quiz, self.users[0], lambda choices: choices[1])  # 0%, not folded
+
+        quiz = Quiz.objects.get(pk=self.quiz.pk)
+        self.assertEqual((quiz.get_total_attempts(), quiz.get_average_score()), (7, Decimal('450') / 7))
+        annotated = Quiz.objects.with_stats().get(pk=self.quiz.pk)
+        self.assertEqual(annotated.attempt_count, 7)
+        self.assertEqual(round(annotated.get_average_score(), 1), Decimal('64.3'))
+
+        response = self.client.get(reverse('quizzes:quiz_detail', args=[self.quiz.id]))
+        self.assertEqual(response.context['stats']['total_attempts'], 7)
+
+        self.client.force_login(User.objects.create_superuser(username='admin', email='admin@example.com', password='password'))
+        self.assertContains(self.client.get(reverse('admin:Quizzes_quiz_changelist')), '64.3%')
+
+    def test_rebuild_matches_folded_stats(self):
+        self.grade_all()
+        fold_quiz_stats()
+        QuizStats.objects.filter(quiz=self.quiz).update(attempt_count=0, score_sum=0)
+        # Attempts still in shards are counted once, by the rebuild
+        submit(self.quiz, self.users[0], lambda choices: choices[0])
+        QuizAttempt.objects.order_by('-id').first().delete()
+
+        self.assertEqual(rebuild_quiz_stats([self.quiz.id]), 1)
+        self.assert_stats(QuizStats.objects.get(quiz=self.quiz))
+        self.assertFalse(QuizStatsShard.objects.filter(quiz=self.quiz).exists())
+        self.assertEqual(fold_quiz_stats(), 0)
+
+
+class ChoiceVoteTests(TestCase):
+    def setUp(self):
+        self.first, self.second = Choice.objects.filter(question__quiz=make_quiz(1, choice_count=2)).order_by('id')
+
+    @override_settings(VOTE_COUNTER_SHARDS=3)
+    def test_record_votes_creates_missing_shards_and_fold_adds_them_up(self):
+        with patch('Quizzes.votes.random') as shard_random:
+            shard_random.randrange.side_effect = [0, 1, 2, 1]
+            record_votes([self.first.id, self.first.id, self.second.id])
+            record_votes([self.first.id])
+            record_votes([self.second.id])
+            record_votes([self.first.id, self.second.id])
+
+        self.assertEqual(
+            sorted(ChoiceVoteShard.objects.values_list('choice_id', 'shard', 'count')),
+            [(self.first.id, 0, 2), (self.first.id, 1, 2), (self.second.id, 0, 1), (self.second.id, 1, 1), (self.second.id, 2, 1)]
+        )
+        self.assertFalse(Choice.objects.filter(votes__gt=0).exists())
+
+        self.assertEqual(fold_votes(), 7)
+        self.assertEqual(list(Choice.objects.order_by('id').values_list('votes', flat=True)), [4, 3])
+        self.assertFalse(ChoiceVoteShard.objects.filter(count__gt=0).exists())
+        self.assertEqual(fold_votes(), 0)
+
+        # Folded shard rows are reused rather than recreated
+        record_votes([self.second.id])
+        self.assertEqual(ChoiceVoteShard.objects.count(), 5)
+        fold_votes()
+        self.assertEqual(Choice.objects.get(pk=self.second.pk).votes, 4)
+
+
+class RankingTests(TestCase):
+    @override_settings(VOTE_COUNTER_SHARDS=4)
+    def test_equal_scores_update_separate_histogram_rows(self):
+        quiz = make_quiz(2)
+        users = [User.objects.create_user(username=f'student{number}') for number in range(3)]
+        with patch('Quizzes.ranking.random') as shard_random:
+            shard_random.randrange.side_effect = [0, 1, 2]
+            attempts = [submit(quiz, user, lambda choices: choices[0]) for user in users]
+
+        rows = QuizScoreCount.objects.filter(quiz=quiz, percentage_score=100)
+        self.assertEqual(sorted(rows.values_list('shard', 'attempt_count', 'best_count')), [(0, 1, 1), (1, 1, 1), (2, 1, 1)])
+        self.assertEqual([attempt_rank(attempt) for attempt in attempts], [1, 1, 1])
+        entries, total_users, _ = leaderboard_page(quiz)
+        self.assertEqual(total_users, 3)
+        self.assertEqual([entry.rank for entry in entries], [1, 1, 1])
+
+        # A worse second attempt only adds to its own score's shard
+        with patch('Quizzes.ranking.random') as shard_random:
+            shard_random.randrange.return_value = 3
+            submit(quiz, users[0], lambda choices: choices[1])
+        self.assertEqual(rows.aggregate(total=Sum('attempt_count'))['total'], 3)
+        self.assertEqual(rebuild_rankings([quiz.id]), 3)
+        self.assertEqual(rows.get().best_count, 3)
+
+    def test_ranks_and_leaderboard(self):
+        quiz = make_quiz(4)
+        alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        carol = User.objects.create_user(username='carol')
+
+        alice_first = submit(quiz, alice, lambda choices: choices[1])  # 0%
+        submit(quiz, bob, lambda choices: choices[0])  # 100%
+        submit(quiz, carol, lambda choices: choices[0])  # 100%
+        alice_second = submit(quiz, alice, lambda choices: choices[0])  # 100%
+
+        self.assertEqual(get_user_rank(alice_first), 4)
+        self.assertEqual(get_user_rank(alice_second), 1)
+
+        self.client.force_login(alice)
+        response = self.client.get(reverse('quizzes:quiz_leaderboard', args=[quiz.id]), {'per_page': 2})
+        data = response.json()
+
+        self.assertEqual(data['total_users'], 3)
+        self.assertEqual(data['your_rank'], 1)
+        self.assertTrue(data['has_next'])
+        self.assertEqual([entry['username'] for entry in data['entries']], ['bob', 'carol'])
+        self.assertEqual([entry['rank'] for entry in data['entries']], [1, 1])
+
+        data = self.client.get(
+            reverse('quizzes:quiz_leaderboard', args=[quiz.id]), {'per_page': 2, 'after': data['next_cursor']}
+        ).json()
+        self.assertFalse(data['has_next'])
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual([(entry['username'], entry['rank']) for entry in data['entries']], [('alice', 1)])
+
+    def test_leaderboard_pages_follow_ties_without_offsets(self):
+        quiz = make_quiz(2)
+        users = [User.objects.create_user(username=f'student{number}') for number in range(5)]
+        for user in users:
+            submit(quiz, user, lambda choices: choices[0])
+        # Every entry shares its score and completion time, so only the id orders them
+        LeaderboardEntry.objects.filter(quiz=quiz).update(achieved_at=timezone.now())
+
+        seen, cursor = [], None
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                entries, total_users, cursor = leaderboard_page(quiz, cursor=cursor, per_page=2)
+            self.assertFalse(any(' offset ' in query['sql'].lower() for query in queries))
+            seen += [entry.user.username for entry in entries]
+            if cursor is None:
+                break
+        self.assertEqual(total_users, 5)
+        self.assertEqual(seen, [user.username for user in users])
+
+        # A malformed cursor starts from the top
+        self.assertEqual(len(leaderboard_page(quiz, cursor='NaN_1-1', per_page=10)[0]), 5)
+
+
+class QuizListTests(TestCase):
+    def test_card_data_in_one_query(self):
+        for count in (1, 2, 3):
+            make_quiz(count)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quizzes:quiz_list'))
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([quiz.question_count for quiz in response.context['quizzes']], [3, 2, 1])
+
+    @patch('Quizzes.views.QUIZZES_PER_PAGE', 2)
+    def test_keyset_pages(self):
+        quizzes = [make_quiz(count) for count in (1, 2, 3)]
+
+        first = self.client.get(reverse('quizzes:quiz_list'))
+        second = self.client.get(reverse('quizzes:quiz_list'), {'after': first.context['next_cursor']})
+
+        self.assertEqual([quiz.id for quiz in first.context['quizzes']], [quizzes[2].id, quizzes[1].id])
+        self.assertEqual([quiz.id for quiz in second.context['quizzes']], [quizzes[0].id])
+        self.assertIsNone(second.context['next_cursor'])
+
+
+class CachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_quiz_list_is_cached_until_quiz_changes(self):
+        quiz = make_quiz(2)
+        self.client.get(reverse('quizzes:quiz_list'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quizzes:quiz_list'))
+        self.assertEqual(len(queries), 0)
+        self.assertContains(response, '2 Questions')
+
+        Question.objects.create(quiz=quiz, text='Another question')
+        response = self.client.get(reverse('quizzes:quiz_list'))
+        self.assertContains(response, '3 Questions')
+
+    def test_cached_cards_hold_no_attempt_stats(self):
+        quiz = make_quiz(2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('quizzes:quiz_list'))
+        # Grading does not invalidate cards, so they must not depend on attempts
+        self.assertFalse(any('quizzes_quizstats' in query['sql'].lower() for query in queries))
+
+        submit(quiz, User.objects.create_user(username='student'), lambda choices: choices[0])
+        cached = render_quiz_cards(Quiz.objects.with_card_data())
+        cache.clear()
+        self.assertEqual(cached, render_quiz_cards(Quiz.objects.with_card_data()))
+
+    def test_quiz_detail_summary_fragment(self):
+        quiz = make_quiz(2)
+        self.client.get(reverse('quizzes:quiz_detail', args=[quiz.id]))
+        self.assertGreaterEqual(cache_metrics()['quiz_summary']['misses'], 1)
+
+        hits = cache_metrics()['quiz_summary']['hits']
+        response = self.client.get(reverse('quizzes:quiz_detail', args=[quiz.id]))
+        self.assertContains(response, '2 Questions')
+        self.assertEqual(cache_metrics()['quiz_summary']['hits'], hits + 1)
+
+        quiz.title = 'Renamed quiz'
+        quiz.save()
+        self.assertContains(self.client.get(reverse('quizzes:quiz_detail', args=[quiz.id])), 'Renamed quiz')
+
+    def test_deploy_check_warns_about_per_process_cache(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'effio_cache'}}
+        with override_settings(DEBUG=False, CACHES=local):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['Quizzes.W001'])
+        with override_settings(DEBUG=False, CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+def image_upload(name, width, height, mode='RGB', fmt='JPEG'):
+    buffer = BytesIO()
+    Image.new(mode, (width, height), (200, 40, 40, 128) if mode == 'RGBA' else (200, 40, 40)).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, USE_CLOUDINARY=False)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def generate(self):
+        out = StringIO()
+        call_command('generate_image_derivatives', stdout=out)
+        return out.getvalue()
+
+    def test_cover_derivatives_are_created_by_the_command_without_upscaling(self):
+        quiz = make_quiz(1)
+        quiz.cover_image = image_upload('cover.jpg', 800, 400)
+        quiz.save()
+        # Saving and rendering never resize
+        self.assertIsNone(image_derivatives(quiz.cover_image))
+        self.assertNotContains(self.client.get(reverse('quizzes:quiz_list')), 'type="image/webp"')
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'derivatives')))
+
+        self.assertIn('Derivatives ready for 1 images', self.generate())
+        cache.clear()
+        derivatives = image_derivatives(quiz.cover_image)
+        self.assertEqual([width for width, _ in derivatives['webp']], [160, 320, 640, 800])
+        self.assertEqual([width for width, _ in derivatives['fallback']], [160, 320, 640, 800])
+        self.assertTrue(derivatives['webp'][0][1].endswith('/160w.webp'))
+        self.assertTrue(derivatives['fallback'][0][1].endswith('/160w.jpg'))
+
+        folder = os.path.join(self.media_root, 'derivatives')
+        [digest] = os.listdir(folder)
+        with Image.open(os.path.join(folder, digest, '320w.webp')) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 160)))
+
+        response = self.client.get(reverse('quizzes:quiz_list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'/derivatives/{digest}/640w.jpg 640w')
+
+    def test_card_covers_are_resolved_together(self):
+        for count in (1, 2, 3, 4):
+            quiz = make_quiz(count)
+            quiz.cover_image = image_upload('cover.jpg', 400, 200)
+            quiz.save()
+        self.generate()
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quizzes:quiz_list'))
+        # The quiz page, then the manifest and the derivative sets for every card at once
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(response.content.decode().count('src="/media/hashed/'), 4)
+        self.assertEqual(response.content.decode().count('type="image/webp"'), 4)
+
+    def test_question_and_choice_images_share_derivatives_by_content(self):
+        quiz = make_quiz(1, choice_count=2)
+        question = quiz.questions.get()
+        question.image = image_upload('diagram.jpg', 2000, 1000)
+        question.save()
+        for choice in question.choices.all():
+            choice.image = image_upload('icon.png', 120, 120, mode='RGBA', fmt='PNG')
+            choice.save()
+        self.generate()
+
+        [paper_question] = build_paper(quiz)
+        self.assertIn('1024w.webp 1024w', paper_question['image_sources']['webp'])
+        self.assertNotIn('2000w', paper_question['image_sources']['webp'])
+        choice_sources = [choice['image_sources'] for choice in paper_question['choices']]
+        # Transparent images fall back to PNG, and identical uploads are resized once
+        self.assertTrue(choice_sources[0]['fallback'].endswith('/120w.png 120w'))
+        self.assertEqual(choice_sources[0], choice_sources[1])
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'derivatives'))), 2)
+        self.assertEqual(ImageDerivativeSet.objects.count(), 2)
+
+    def test_recorded_derivatives_are_not_read_again(self):
+        quiz = make_quiz(1)
+        quiz.cover_image = image_upload('cover.jpg', 400, 200)
+        quiz.save()
+        self.generate()
+
+        with patch('Quizzes.images.Image.open') as image_open:
+            self.generate()
+            self.assertIsNotNone(image_derivatives(quiz.cover_image))
+        image_open.assert_not_called()
+
+    def test_unreadable_or_disabled_images_have_no_derivatives(self):
+        quiz = make_quiz(1)
+        question = quiz.questions.get()
+        question.image = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        question.save()
+        self.assertIn('(1 missing, unreadable or animated)', self.generate())
+        self.assertIsNone(image_derivatives(question.image))
+        self.assertIsNone(build_paper(quiz)[0]['image_sources'])
+
+        question.image = image_upload('photo.jpg', 400, 300)
+        question.save()
+        self.generate()
+        with override_settings(USE_CLOUDINARY=True):
+            self.assertIsNone(image_derivatives(question.image))
+
+    def test_decompression_bombs_have_no_derivatives(self):
+        quiz = make_quiz(1)
+        question = quiz.questions.get()
+        with patch('PIL.Image.MAX_IMAGE_PIXELS', 1000):
+            question.image = image_upload('huge.png', 100, 100, fmt='PNG')
+            question.save()
+            self.generate()
+            self.assertIsNone(image_derivatives(question.image))
+            self.assertIsNone(build_paper(quiz)[0]['image_sources'])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'derivatives')))
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'question_audio'))
+        with open(os.path.join(self.media_root, 'question_audio', 'track.mp3'), 'wb') as f:
+            f.write(bytes(range(100)))
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def serve(self, **headers):
+        return serve_media(self.factory.get('/', headers=headers), 'question_audio/track.mp3')
+
+    def test_single_range(self):
+        response = self.serve(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.serve(range='bytes=-5')
+        self.assertEqual(response['Content-Range'], 'bytes 95-99/100')
+
+    def test_unsatisfiable_range(self):
+        response = self.serve(range='bytes=200-300')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_conditional_requests(self):
+        full = self.serve()
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(full['Accept-Ranges'], 'bytes')
+
+        self.assertEqual(self.serve(if_none_match=full['ETag']).status_code, 304)
+        self.assertEqual(self.serve(if_none_match='"other"').status_code, 200)
+        self.assertEqual(self.serve(if_modified_since=full['Last-Modified']).status_code, 304)
+        self.assertEqual(self.serve(if_modified_since='Thu, 01 Jan 1970 00:00:00 GMT').status_code, 200)
+
+    def test_if_range_with_stale_etag_returns_whole_file(self):
+        etag = self.serve()['ETag']
+        self.assertEqual(self.serve(range='bytes=0-9', if_range=etag).status_code, 206)
+
+        response = self.serve(range='bytes=0-9', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+
+    def test_sendfile_modes(self):
+        with override_settings(MEDIA_SENDFILE_MODE='x-sendfile'):
+            response = self.serve()
+        self.assertEqual(response['X-Sendfile'], os.path.join(os.path.abspath(self.media_root), 'question_audio', 'track.mp3'))
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+
+        with override_settings(MEDIA_SENDFILE_MODE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/internal-media/'):
+            response = self.serve()
+        self.assertEqual(response['X-Accel-Redirect'], '/internal-media/question_audio/track.mp3')
+        self.assertIn('ETag', response)
+
+
+class MediaManifestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, USE_CLOUDINARY=False)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_hashed_audio_url_is_served_as_immutable(self):
+        quiz = make_quiz(1)
+        question = quiz.questions.get()
+        question.audio_file = SimpleUploadedFile('part1.mp3', b'ID3 audio bytes', content_type='audio/mpeg')
+        question.save()
+        entry = MediaManifestEntry.objects.get(name=question.audio_file.name)
+
+        audio_url = build_paper(quiz)[0]['audio_url']
+        self.assertEqual(audio_url, f'/media/hashed/{entry.digest}/{question.audio_file.name}')
+
+        response = self.client.get(audio_url)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(b''.join(response.streaming_content), b'ID3 audio bytes')
+
+        stale_url = audio_url.replace(entry.digest, '0' * len(entry.digest))
+        self.assertEqual(self.client.get(stale_url).status_code, 404)
+
+    def test_reuploaded_file_gets_a_new_digest(self):
+        quiz = make_quiz(1)
+        question = quiz.questions.get()
+        question.audio_file = SimpleUploadedFile('part1.mp3', b'first recording', content_type='audio/mpeg')
+        question.save()
+        old_url = build_paper(quiz)[0]['audio_url']
+
+        # Deleting the file frees its name, and the next upload reuses it
+        name = question.audio_file.name
+        question.audio_file.delete(save=False)
+        question.audio_file = SimpleUploadedFile('part1.mp3', b'second, longer recording', content_type='audio/mpeg')
+        question.save()
+        self.assertEqual(question.audio_file.name, name)
+
+        cache.clear()
+        new_url = build_paper(quiz)[0]['audio_url']
+        self.assertNotEqual(new_url, old_url)
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+        self.assertEqual(b''.join(self.client.get(new_url).streaming_content), b'second, longer recording')
+        self.assertEqual(MediaManifestEntry.objects.filter(name=name).count(), 1)
+
+    def test_paper_media_urls_cost_two_queries(self):
+        quiz = make_quiz(3, choice_count=2)
+        for question in quiz.questions.all():
+            question.image = image_upload('diagram.jpg', 100, 50)
+            question.audio_file = SimpleUploadedFile('track.mp3', b'audio', content_type='audio/mpeg')
+            question.save()
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            paper = build_paper(quiz)
+        # Questions, choices, the manifest and the derivative sets
+        self.assertEqual(len(queries), 4)
+        self.assertTrue(all(question['image_url'].startswith('/media/hashed/') for question in paper))
+
+    def test_plain_and_derivative_media_cache_headers(self):
+        quiz = make_quiz(1)
+        quiz.cover_image = image_upload('cover.jpg', 400, 200)
+        quiz.save()
+        self.assertIn('/media/hashed/', quiz.get_cover_image_url())
+        call_command('generate_image_derivatives', stdout=StringIO())
+        request = RequestFactory().get('/')
+
+        response = serve_media(request, quiz.cover_image.name)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+
+        derivative = image_derivatives(quiz.cover_image)['webp'][0][1].removeprefix('/media/')
+        response = serve_media(request, derivative)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+
+class TakeQuizTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='student')
+        self.client.force_login(self.user)
+
+    def choice_order(self, response):
+        return [[choice['id'] for choice in question['choices']] for question in response.context['questions']]
+
+    def test_paper_is_cached_and_shuffle_is_stable(self):
+        quiz = make_quiz(5)
+        url = reverse('quizzes:take_quiz', args=[quiz.id])
+        first = self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        # Session, user and quiz lookups only; the paper comes from the cache
+        self.assertFalse(any('quizzes_question' in query['sql'].lower() for query in queries))
+        self.assertEqual(self.choice_order(first), self.choice_order(second))
+
+    def test_editing_a_choice_invalidates_the_paper(self):
+        quiz = make_quiz(1)
+        url = reverse('quizzes:take_quiz', args=[quiz.id])
+        self.client.get(url)
+
+        choice = Choice.objects.filter(question__quiz=quiz).first()
+        choice.text = 'Edited choice'
+        choice.save()
+
+        self.assertContains(self.client.get(url), 'Edited choice')
+
+    def test_submission_is_graded(self):
+        quiz = make_quiz(2)
+        url = reverse('quizzes:take_quiz', args=[quiz.id])
+        self.client.get(url)
+        data = {
+            f'question_{question.id}': question.choices.get(is_correct=True).id
+            for question in quiz.questions.all()
+        }
+
+        response = self.client.post(url, data)
+
+        attempt = quiz.attempts.get()
+        self.assertRedirects(response, reverse('quizzes:quiz_results', args=[quiz.id, attempt.id]), fetch_redirect_response=False)
+        self.assertEqual(attempt.score, 2)
+        self.assertEqual(attempt.answers.count(), 2)
+
+    def test_start_time_is_kept_per_quiz(self):
+        first, second = make_quiz(1), make_quiz(1)
+        self.client.get(reverse('quizzes:take_quiz', args=[first.id]))
+        InProgressAttempt.objects.filter(quiz=first).update(started_at=timezone.now() - timedelta(minutes=30))
+        self.client.get(reverse('quizzes:take_quiz', args=[second.id]))
+        self.client.get(reverse('quizzes:take_quiz', args=[first.id]))
+        self.assertNotIn('quiz_start_time', self.client.session)
+
+        self.client.post(reverse('quizzes:take_quiz', args=[first.id]), {})
+
+        attempt = first.attempts.get()
+        self.assertGreaterEqual(attempt.time_taken, timedelta(minutes=30))
+        self.assertEqual(list(InProgressAttempt.objects.values_list('quiz', flat=True)), [second.id])
+
+    def test_reopening_an_abandoned_attempt_starts_over(self):
+        quiz = make_quiz(2)
+        url = reverse('quizzes:take_quiz', args=[quiz.id])
+        self.client.get(url)
+        question = quiz.questions.first()
+        InProgressAnswer.objects.create(
+            attempt=InProgressAttempt.objects.get(), question=question, selected_choice=question.choices.first()
+        )
+        # Resumed within the idle limit: same start, saved answers kept
+        InProgressAttempt.objects.update(
+            started_at=timezone.now() - timedelta(hours=2), last_seen_at=timezone.now() - timedelta(hours=1)
+        )
+        self.client.get(url)
+        in_progress = InProgressAttempt.objects.get()
+        self.assertLess(in_progress.started_at, timezone.now() - timedelta(hours=1))
+        self.assertGreater(in_progress.last_seen_at, timezone.now() - timedelta(minutes=1))
+        self.assertTrue(InProgressAnswer.objects.exists())
+
+        InProgressAttempt.objects.update(
+            started_at=timezone.now() - timedelta(hours=30), last_seen_at=timezone.now() - timedelta(hours=25)
+        )
+        self.client.get(url)
+        self.assertGreater(InProgressAttempt.objects.get().started_at, timezone.now() - timedelta(minutes=1))
+        self.assertFalse(InProgressAnswer.objects.exists())
+
+        self.client.post(url, {})
+        self.assertLess(quiz.attempts.get().time_taken, timedelta(minutes=1))
+
+    def test_abandoned_attempts_are_swept(self):
+        quiz = make_quiz(1)
+        self.client.get(reverse('quizzes:take_quiz', args=[quiz.id]))
+        out = StringIO()
+        call_command('sweep_in_progress_attempts', stdout=out)
+        self.assertIn('Deleted 0', out.getvalue())
+
+        InProgressAttempt.objects.update(last_seen_at=timezone.now() - timedelta(days=2))
+        call_command('sweep_in_progress_attempts', stdout=out)
+        self.assertIn('Deleted 1', out.getvalue())
+        self.assertFalse(InProgressAttempt.objects.exists())
+
+
+class AutosaveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.quiz = make_quiz(3)
+        self.user = User.objects.create_user(username='student')
+        self.client.force_login(self.user)
+        self.url = reverse('quizzes:autosave_answers', args=[self.quiz.id])
+        self.questions = list(self.quiz.questions.prefetch_related('choices'))
+        self.client.get(reverse('quizzes:take_quiz', args=[self.quiz.id]))
+
+    def autosave(self, answers):
+        return self.client.post(self.url, json.dumps({'answers': answers}), content_type='application/json')
+
+    def test_batches_are_upserted(self):
+        first, second = self.questions[0], self.questions[1]
+        response = self.autosave({first.id: first.choices.all()[1].id, second.id: second.choices.all()[2].id, 999999: 1})
+        self.assertEqual(response.json(), {'saved': 2, 'ignored': 1})
+
+        # Changing and clearing answers: session, user, in-progress lookup and one upsert
+        with CaptureQueriesContext(connection) as queries:
+            response = self.autosave({first.id: first.choices.all()[0].id, second.id: None})
+        self.assertEqual(response.json(), {'saved': 2, 'ignored': 0})
+        self.assertEqual(sum('quizzes_inprogressanswer' in query['sql'].lower() for query in queries), 1)
+
+        saved = dict(InProgressAnswer.objects.values_list('question_id', 'selected_choice_id'))
+        self.assertEqual(saved, {first.id: first.choices.all()[0].id, second.id: None})
+
+    def test_saved_answers_are_restored_and_cleared_on_submit(self):
+        question = self.questions[0]
+        choice = question.choices.all()[2]
+        self.autosave({question.id: choice.id})
+
+        response = self.client.get(reverse('quizzes:take_quiz', args=[self.quiz.id]))
+        self.assertContains(response, f'value="{choice.id}" required checked')
+
+        self.client.post(reverse('quizzes:take_quiz', args=[self.quiz.id]), {f'question_{question.id}': choice.id})
+        self.assertFalse(InProgressAnswer.objects.exists())
+
+    def test_beacon_form_post(self):
+        question = self.questions[0]
+        response = self.client.post(self.url, {'answers': json.dumps({question.id: question.choices.all()[1].id})})
+        self.assertEqual(response.json(), {'saved': 1, 'ignored': 0})
+
+    def test_autosave_after_submit_does_not_restore_the_attempt(self):
+        question = self.questions[0]
+        self.autosave({question.id: question.choices.all()[2].id})
+        self.client.post(reverse('quizzes:take_quiz', args=[self.quiz.id]), {f'question_{question.id}': question.choices.all()[0].id})
+
+        response = self.autosave({question.id: question.choices.all()[3].id})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(InProgressAttempt.objects.exists())
+        self.assertFalse(InProgressAnswer.objects.exists())
+
+        other_quiz = make_quiz(1)
+        other_question = other_quiz.questions.get()
+        response = self.client.post(
+            reverse('quizzes:autosave_answers', args=[other_quiz.id]),
+            json.dumps({'answers': {other_question.id: other_question.choices.all()[0].id}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(InProgressAttempt.objects.filter(quiz=other_quiz).exists())
+
+    def test_invalid_payload(self):
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+class BenchmarkTests(TestCase):
+    def test_seeded_data_is_consistent(self):
+        created = seed_dataset(users=5, quizzes=2, questions=3, choices=4, attempts=6, seed=1)
+
+        self.assertEqual(created['attempts'], 12)
+        self.assertEqual(QuizAnswer.objects.count(), 36)
+        for attempt in QuizAttempt.objects.all():
+            self.assertEqual(attempt.answers.filter(is_correct=True).count(), attempt.score)
+            self.assertEqual(attempt.completed_at, attempt.started_at + attempt.time_taken)
+        quiz = Quiz.objects.first()
+        self.assertEqual(quiz.get_total_attempts(), 6)
+
+    def test_bench_views_reports_every_view(self):
+        seed_dataset(users=3, quizzes=1, questions=2, attempts=3, seed=1)
+        out = StringIO()
+
+        call_command('bench_views', iterations=1, warmup=0, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(len(report['views']), 7)
+        for result in report['views'].values():
+            self.assertLess(result['status_codes'][0], 400)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+
+    def test_benchmark_indexes_measures_with_and_without_indexes(self):
+        seed_dataset(users=4, quizzes=2, questions=3, attempts=4, seed=1)
+        out = StringIO()
+
+        call_command('benchmark_indexes', json=True, repeat=1, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertIn('user_dashboard.recent', report)
+        for result in report.values():
+            self.assertEqual(set(result), {'before', 'after'})
+        if connection.vendor == 'sqlite':
+            self.assertIn('attempt_user_done_idx', report['user_dashboard.recent']['after']['plan'])
+            self.assertNotIn('attempt_user_done_idx', report['user_dashboard.recent']['before']['plan'])
+        # Every dropped index serves a measured query, and is restored
+        with connection.cursor() as cursor:
+            for model, name, query_names in INDEX_PLAN:
+                self.assertTrue(set(query_names) <= set(report), name)
+                self.assertIn(name, connection.introspection.get_constraints(cursor, model._meta.db_table))
+                if connection.vendor == 'sqlite':
+                    self.assertTrue(any(name in report[query]['after']['plan'] for query in query_names), name)
+
+
+class AsyncViewTests(TestCase):
+    """The async views served through the ASGI handler."""
+
+    def setUp(self):
+        cache.clear()
+        histogram.clear()
+        self.quiz = make_quiz(3)
+        self.user = User.objects.create_user(username='student')
+
+    async def test_submission_and_results(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        url = reverse('quizzes:take_quiz', args=[self.quiz.id])
+        self.assertEqual((await client.get(url)).status_code, 200)
+        data = {
+            f'question_{question_id}': choice_id
+            async for question_id, choice_id in Choice.objects.filter(
+                question__quiz=self.quiz, is_correct=True
+            ).values_list('question_id', 'id')
+        }
+
+        response = await client.post(url, data)
+
+        attempt = await self.quiz.attempts.aget()
+        results_url = reverse('quizzes:quiz_results', args=[self.quiz.id, attempt.id])
+        self.assertRedirects(response, results_url, fetch_redirect_response=False)
+        self.assertEqual(attempt.score, 3)
+        response = await client.get(results_url)
+        self.assertContains(response, 'Correct Answer')
+        self.assertEqual(response.context['stats']['rank'], 1)
+        # Queries made from sync_to_async threads are still counted
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    async def test_leaderboard(self):
+        await sync_to_async(submit)(self.quiz, self.user, lambda choices: choices[0])
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+
+        payload = (await client.get(reverse('quizzes:quiz_leaderboard', args=[self.quiz.id]))).json()
+
+        self.assertEqual(payload['your_rank'], 1)
+        self.assertEqual([entry['username'] for entry in payload['entries']], ['student'])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        histogram.clear()
+
+    def test_server_timing_and_metrics_endpoint(self):
+        quiz = make_quiz(2)
+        response = self.client.get(reverse('quizzes:quiz_detail', args=[quiz.id]))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+        self.assertEqual(self.client.get(reverse('request_metrics')).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        views = self.client.get(reverse('request_metrics')).json()['views']
+        self.assertEqual(views['quizzes:quiz_detail']['count'], 1)
+        self.assertGreater(views['quizzes:quiz_detail']['mean_queries'], 0)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('Effio_Ielts.requests', 'WARNING') as logs:
+            self.client.get(reverse('quizzes:quiz_list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'quizzes:quiz_list')
+        self.assertEqual(record['status'], 200)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student')
+        self.client.force_login(self.user)
+        first_quiz, second_quiz = make_quiz(4), make_quiz(2)
+        self.worst = submit(first_quiz, self.user, lambda choices: choices[1])  # 0%
+        submit(first_quiz, self.user, lambda choices: choices[0])  # 100%, best
+        submit(second_quiz, self.user, lambda choices: choices[0])  # 100%
+        self.best = first_quiz.attempts.get(percentage_score=100)
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quizzes:user_dashboard'))
+        dashboard_queries = [query for query in queries if 'quizzes_quizattempt' in query['sql'].lower()
+                             or 'quizzes_userquizrollup' in query['sql'].lower()]
+        return response, len(dashboard_queries)
+
+    def assert_dashboard(self, response):
+        self.assertEqual(response.context['stats']['total_attempts'], 3)
+        self.assertEqual(response.context['stats']['total_quizzes_taken'], 2)
+        self.assertEqual(response.context['stats']['avg_score'], Decimal('66.7'))
+        self.assertEqual(response.context['best_attempt'], self.best)
+        self.assertEqual(response.context['worst_attempt'], self.worst)
+        self.assertEqual(len(response.context['stats']['performance_trend']), 3)
+
+    def test_dashboard_reads_rollup(self):
+        response, query_count = self.get_dashboard()
+        self.assert_dashboard(response)
+        self.assertEqual(query_count, 2)
+
+    @override_settings(USER_QUIZ_ROLLUPS=False)
+    def test_dashboard_without_rollup(self):
+        response, query_count = self.get_dashboard()
+        self.assert_dashboard(response)
+        self.assertEqual(query_count, 3)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        rollup = UserQuizRollup.objects.get(user=self.user)
+        rebuild_user_rollups([self.user.id])
+        rebuilt = UserQuizRollup.objects.get(user=self.user)
+        for field in ('attempt_count', 'quizzes_taken', 'score_sum', 'best_attempt_id', 'worst_attempt_id'):
+            self.assertEqual(getattr(rollup, field), getattr(rebuilt, field))
+
+    def test_missing_rollup_starts_from_earlier_attempts(self):
+        UserQuizRollup.objects.filter(user=self.user).delete()
+        worse = submit(self.best.quiz, self.user, lambda choices: choices[2])  # 0%, later than the worst
+
+        rollup = UserQuizRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.attempt_count, rollup.quizzes_taken, rollup.score_sum), (4, 2, Decimal('200')))
+        self.assertEqual((rollup.best_attempt_id, rollup.worst_attempt_id), (self.best.id, self.worst.id))
+        self.assertNotEqual(worse.id, rollup.worst_attempt_id)
+
+    def test_concurrently_created_rollup_is_added_to(self):
+        # Another submission created the row between the existence check and
+        # the insert: its totals must be kept, not replaced by a recount
+        UserQuizRollup.objects.filter(user=self.user).update(attempt_count=10)
+        with patch('django.db.models.query.QuerySet.exists', return_value=False):
+            submit(self.best.quiz, self.user, lambda choices: choices[0])
+
+        rollup = UserQuizRollup.objects.get(user=self.user)
+        self.assertEqual(rollup.attempt_count, 11)
+        self.assertEqual(rollup.best_attempt_id, self.best.id)
+
+
+class QuizResultsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='student')
+        self.client.force_login(self.user)
+
+    def get_results(self, attempt):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quizzes:quiz_results', args=[attempt.quiz_id, attempt.id]))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_queries_do_not_grow_with_answers(self):
+        small_attempt = submit(make_quiz(2), self.user, lambda choices: choices[0])
+        large_attempt = submit(make_quiz(30), self.user, lambda choices: choices[0])
+        self.get_results(small_attempt)
+
+        _, small_queries = self.get_results(submit(small_attempt.quiz, self.user, lambda choices: choices[1]))
+        _, large_queries = self.get_results(submit(large_attempt.quiz, self.user, lambda choices: choices[1]))
+        self.assertEqual(small_queries, large_queries)
+
+    def test_revisit_is_served_from_cache(self):
+        quiz = make_quiz(3)
+        first = submit(quiz, self.user, lambda choices: choices[1])  # 0%
+        second = submit(quiz, self.user, lambda choices: choices[0])  # 100%
+
+        response, miss_queries = self.get_results(second)
+        self.assertContains(response, 'Choice 3')
+        self.assertEqual(response.context['improvement_data']['improvement'], 100)
+
+        hits = cache_metrics()['attempt_result']['hits']
+        response, hit_queries = self.get_results(second)
+        self.assertLess(hit_queries, miss_queries)
+        self.assertContains(response, 'Correct Answer')
+        self.assertEqual(cache_metrics()['attempt_result']['hits'], hits + 1)
+
+        response, _ = self.get_results(first)
+        self.assertIsNone(response.context['improvement_data'])
+
+    def test_attempt_without_answers_is_not_shown_as_pending(self):
+        quiz = make_quiz(2)
+        attempt = QuizAttempt.objects.create(
+            user=self.user, quiz=quiz, score=0, total_questions=2,
+            percentage_score=0, started_at=timezone.now()
+        )
+        response, _ = self.get_results(attempt)
+        self.assertFalse(response.context['answers_pending'])
+        self.assertNotContains(response, 'being saved')
+        self.assertContains(response, 'No answers were recorded')
+
+    def test_editing_a_quiz_only_drops_its_own_results(self):
+        attempt = submit(make_quiz(2), self.user, lambda choices: choices[0])
+        other = submit(make_quiz(2), self.user, lambda choices: choices[0])
+        self.get_results(attempt)
+        self.get_results(other)
+
+        other.quiz.title = 'Renamed quiz'
+        other.quiz.save()
+        hits = cache_metrics()['attempt_result']['hits']
+        misses = cache_metrics()['attempt_result']['misses']
+        self.get_results(attempt)
+        self.get_results(other)
+        self.assertEqual(cache_metrics()['attempt_result']['hits'], hits + 1)
+        self.assertEqual(cache_metrics()['attempt_result']['misses'], misses + 1)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(self.admin)
+
+    def count_changelist_queries(self, model_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:Quizzes_{model_name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_load_in_constant_queries(self):
+        quiz = make_quiz(2)
+        submit(quiz, self.admin, lambda choices: choices[0])
+        counts = {
+            model_name: self.count_changelist_queries(model_name)
+            for model_name in ('quiz', 'question', 'choice', 'quizattempt', 'quizanswer')
+        }
+
+        quiz = make_quiz(15)
+        for pick in (0, 1, 2):
+            submit(quiz, User.objects.create_user(username=f'student{pick}'), lambda choices: choices[pick])
+        for model_name, count in counts.items():
+            self.assertEqual(self.count_changelist_queries(model_name), count, model_name)
+
+    def test_question_success_rate(self):
+        quiz = make_quiz(1)
+        submit(quiz, self.admin, lambda choices: choices[0])
+        submit(quiz, self.admin, lambda choices: choices[1])
+
+        response = self.client.get(reverse('admin:Quizzes_question_changelist'))
+        self.assertContains(response, '50.0%')
+
+
+class BundleTests(TestCase):
+    def export(self, fmt):
+        return ''.join(export_bundle(Quiz.objects.all(), fmt))
+
+    def test_round_trip(self):
+        make_quiz(3)
+        bundles = {fmt: self.export(fmt) for fmt in ('jsonl', 'csv')}
+        for fmt, bundle in bundles.items():
+            result = import_bundle(StringIO(bundle), fmt)
+            self.assertEqual((result['quizzes'], result['questions'], result['choices']), (1, 3, 12), fmt)
+            self.assertEqual(result['errors'], [])
+
+        imported = Quiz.objects.order_by('-id')[0]
+        self.assertEqual(imported.questions.count(), 3)
+        self.assertEqual(Choice.objects.filter(question__quiz=imported, is_correct=True).count(), 3)
+        self.assertEqual(self.export('jsonl').count('\n'), 3)
+
+    def test_csv_keeps_neighbours_with_the_same_title_and_text_apart(self):
+        quiz = make_quiz(2)
+        Question.objects.filter(quiz=quiz).update(text='Same question')
+        Quiz.objects.create(title=quiz.title, description='Second', due_date=quiz.due_date)
+        second = Quiz.objects.order_by('-id')[0]
+        for number in range(2):
+            question = Question.objects.create(quiz=second, text='Same question')
+            Choice.objects.create(question=question, text=f'Right {number}', is_correct=True)
+            Choice.objects.create(question=question, text='Wrong', is_correct=False)
+
+        result = import_bundle(StringIO(self.export('csv')), 'csv')
+        self.assertEqual((result['quizzes'], result['questions'], result['choices']), (2, 4, 12))
+        self.assertEqual(result['errors'], [])
+
+    def test_imported_questions_keep_bundle_order(self):
+        make_quiz(5)
+        bundle = self.export('jsonl')
+        # Bulk inserts may give every question the same created_at
+        with patch('django.utils.timezone.now', return_value=timezone.now()):
+            import_bundle(StringIO(bundle), 'jsonl')
+
+        imported = Quiz.objects.order_by('-id')[0]
+        self.assertEqual(len({question.created_at for question in imported.questions.all()}), 1)
+        self.assertEqual(
+            [question['text'] for question in build_paper(imported)],
+            [f'Question {number}' for number in range(5)]
+        )
+
+    def test_invalid_quizzes_are_skipped(self):
+        good = {
+            'title': 'Reading test',
+            'description': 'Academic reading',
+            'due_date': '2026-12-31',
+            'questions': [{'text': 'Q1', 'choices': [{'text': 'A', 'is_correct': True}, {'text': 'B'}]}],
+        }
+        no_correct = dict(good, questions=[{'text': 'Q1', 'choices': [{'text': 'A'}, {'text': 'B'}]}])
+        lines = [json.dumps(good), 'not json', json.dumps(no_correct), json.dumps(dict(good, due_date='soon'))]
+
+        result = import_bundle(StringIO('\n'.join(lines)), 'jsonl')
+
+        self.assertEqual(result['quizzes'], 1)
+        self.assertEqual(len(result['errors']), 3)
+        self.assertTrue(result['errors'][0].startswith('Line 2:'))
+        self.assertIn('no choice is marked correct', result['errors'][1])
+
+    def test_wrongly_typed_fields_are_rejected(self):
+        good = {
+            'title': 'Reading test',
+            'description': 'Academic reading',
+            'due_date': '2026-12-31',
+            'questions': [{'text': 'Q1', 'choices': [{'text': 'A', 'is_correct': True}, {'text': 'B'}]}],
+        }
+        question = good['questions'][0]
+        bad = [
+            dict(good, questions=[dict(question, question_type=['listening'])]),
+            dict(good, questions=[dict(question, reading_passage={'text': 'Passage'})]),
+            dict(good, questions=[dict(question, text=42)]),
+            dict(good, questions=[dict(question, choices=[{'text': 'A', 'is_correct': 'false'}, {'text': 'B', 'is_correct': True}])]),
+            dict(good, title=['Reading test']),
+        ]
+
+        result = import_bundle(StringIO('\n'.join(json.dumps(quiz) for quiz in [good, *bad])), 'jsonl')
+
+        self.assertEqual(result['quizzes'], 1)
+        self.assertEqual(len(result['errors']), 5)
+        self.assertIn('unknown question_type', result['errors'][0])
+        self.assertIn('reading_passage must be text', result['errors'][1])
+        self.assertIn('text is required', result['errors'][2])
+        self.assertIn('is_correct must be true or false', result['errors'][3])
+        self.assertEqual(Choice.objects.filter(is_correct=True).count(), 1)
+
+    def test_undecodable_and_invalid_csv_lines_are_skipped(self):
+        make_quiz(1)
+        make_quiz(2)
+        jsonl = self.export('jsonl').encode().split(b'\n')
+        jsonl[0] = jsonl[0].replace(b'Test quiz', b'Test \xff quiz')
+        result = import_bundle(open_text(BytesIO(b'\n'.join(jsonl)), 'jsonl'), 'jsonl')
+        self.assertEqual(result['quizzes'], 1)
+        self.assertEqual(result['errors'], ['Line 1: not valid UTF-8'])
+
+        csv_lines = self.export('csv').encode().split(b'\r\n')
+        csv_lines[1] = csv_lines[1].replace(b'Choice 0', b'Choice \xff')
+        result = import_bundle(open_text(BytesIO(b'\r\n'.join(csv_lines)), 'csv'), 'csv')
+        # The second quiz and its copy imported above share a title but stay separate quizzes
+        self.assertEqual((result['quizzes'], result['errors']), (2, ['Line 2: not valid UTF-8']))
+
+        # A field over the csv module's size limit is a csv.Error
+        csv_lines[1] = csv_lines[1].replace(b'Choice \xff', b'x' * 200000)
+        result = import_bundle(open_text(BytesIO(b'\r\n'.join(csv_lines)), 'csv'), 'csv')
+        self.assertEqual(result['quizzes'], 2)
+        self.assertTrue(result['errors'][0].startswith('Line 2: invalid CSV'))
+        self.assertEqual(result['errors'][1], 'Line 3: quiz skipped because line 2 is invalid CSV')
+
+        result = import_bundle(TextIOWrapper(BytesIO(b'\xff\xfe{}\n'), encoding='utf-8'), 'jsonl')
+        self.assertIn('not valid UTF-8', result['errors'][0])
+
+    def test_admin_import_view(self):
+        make_quiz(2)
+        bundle = self.export('csv')
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(admin)
+
+        upload = SimpleUploadedFile('quizzes.csv', bundle.encode(), content_type='text/csv')
+        response = self.client.post(reverse('admin:Quizzes_quiz_import'), {'bundle': upload})
+
+        self.assertRedirects(response, reverse('admin:Quizzes_quiz_changelist'), fetch_redirect_response=False)
+        self.assertEqual(Quiz.objects.count(), 2)
+
+        upload = SimpleUploadedFile('quizzes.csv', bundle.encode().replace(b'Choice 0', b'Choice \xff'))
+        response = self.client.post(reverse('admin:Quizzes_quiz_import'), {'bundle': upload})
+        self.assertEqual(response.status_code, 302)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.quiz = make_quiz(3)
+        self.user = User.objects.create_user(username='student', password='password')
+        submit(self.quiz, self.user, lambda choices: choices[0])
+        submit(self.quiz, self.user, lambda choices: choices[1])
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('quizzes:export_data', args=['attempts']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_streams_csv_and_ndjson(self):
+        staff = User.objects.create_user(username='analyst', password='password', is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse('quizzes:export_data', args=['attempts']), {'quiz': self.quiz.id})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['attempt_id', 'user_id', 'username'])
+        self.assertEqual(len(lines), 3)
+
+        response = self.client.get(reverse('quizzes:export_data', args=['answers']), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(sum(row['is_correct'] for row in rows), 3)
+
+        response = self.client.get(reverse('quizzes:export_data', args=['answers']), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_filters_by_date(self):
+        out = StringIO()
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        call_command('export_attempts', '--kind', 'answers', '--since', tomorrow, '--chunk-size', '1', stdout=out)
+        self.assertEqual(out.getvalue().count('\n'), 1)
+
+        out = StringIO()
+        call_command('export_attempts', '--format', 'ndjson', '--chunk-size', '1', stdout=out)
+        self.assertEqual(out.getvalue().count('\n'), 2)
+
+
+@override_settings(DEFERRED_ANSWER_WRITES=True)
+class DeferredAnswerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.quiz = make_quiz(3)
+        self.user = User.objects.create_user(username='student')
+
+    def test_answers_are_written_by_the_worker(self):
+        attempt = submit(self.quiz, self.user, lambda choices: choices[0])
+        self.assertEqual(attempt.score, 3)
+        self.assertFalse(QuizAnswer.objects.exists())
+
+        self.client.force_login(self.user)
+        results_url = reverse('quizzes:quiz_results', args=[self.quiz.id, attempt.id])
+        response = self.client.get(results_url)
+        self.assertTrue(response.context['answers_pending'])
+        self.assertContains(response, 'being saved')
+        self.assertContains(response, '100')
+
+        out = StringIO()
+        call_command('run_answer_worker', stdout=out)
+        self.assertIn('Wrote 3 answers of 1 attempts', out.getvalue())
+        self.assertFalse(AnswerWriteJob.objects.exists())
+        self.assertEqual(attempt.answers.filter(is_correct=True).count(), 3)
+        self.assertContains(self.client.get(results_url), 'Correct Answer')
+
+        call_command('fold_choice_votes', stdout=StringIO())
+        self.assertEqual(Choice.objects.filter(votes=1).count(), 3)
+
+    def test_answer_times_are_queued(self):
+        question = self.quiz.questions.first()
+        data = {'question_times': json.dumps({question.id: 12.34})}
+        grade_submission(self.quiz, self.user, data, started_at=timezone.now(), time_taken=timedelta(minutes=1))
+
+        call_command('run_answer_worker', stdout=StringIO())
+
+        self.assertEqual(QuizAnswer.objects.get(question=question).time_taken, timedelta(seconds=12.3))
+
+    @override_settings(ANALYTICS_SNAPSHOT_SETTLE_SECONDS=0)
+    def test_snapshot_waits_for_queued_answers(self):
+        first = submit(self.quiz, self.user, lambda choices: choices[0])
+        call_command('run_answer_worker', stdout=StringIO())
+        submit(self.quiz, self.user, lambda choices: choices[1])
+        QuizAttempt.objects.filter(pk=first.pk).update(completed_at=timezone.now() - timedelta(minutes=1))
+
+        snapshot, folded = refresh_snapshot(self.quiz)
+        self.assertEqual(folded, 1)
+
+        call_command('run_answer_worker', stdout=StringIO())
+        snapshot, folded = refresh_snapshot(self.quiz)
+        self.assertEqual(folded, 1)
+        self.assertEqual(snapshot.counts['attempt_count'], 2)
+        self.assertEqual(sum(total for total, _ in snapshot.counts['questions'].values()), 6)
+
+    def test_deleted_questions_are_skipped(self):
+        submit(self.quiz, self.user, lambda choices: choices[0])
+        self.quiz.questions.first().delete()
+
+        call_command('run_answer_worker', stdout=StringIO())
+
+        self.assertEqual(QuizAnswer.objects.count(), 2)
+        self.assertFalse(AnswerWriteJob.objects.exists())
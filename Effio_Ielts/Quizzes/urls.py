@@ -7,7 +7,11 @@ urlpatterns = [
     path('', views.quiz_list, name='quiz_list'),                                        # /quizzes/
     path('<int:quiz_id>/', views.quiz_detail, name='quiz_detail'),                      # /quizzes/1/
     path('<int:quiz_id>/take/', views.take_quiz, name='take_quiz'),                     # /quizzes/1/take/
+    path('<int:quiz_id>/autosave/', views.autosave_answers, name='autosave_answers'),   # /quizzes/1/autosave/ (JSON POST)
     path('<int:quiz_id>/results/<int:attempt_id>/', views.quiz_results, name='quiz_results'),  # /quizzes/1/results/123/
     path('<int:quiz_id>/analytics/', views.quiz_analytics, name='quiz_analytics'),     # /quizzes/1/analytics/
+    path('<int:quiz_id>/leaderboard/', views.quiz_leaderboard, name='quiz_leaderboard'),  # /quizzes/1/leaderboard/?after=<next_cursor>
     path('dashboard/', views.user_dashboard, name='user_dashboard'),                   # /quizzes/dashboard/
+    path('cache-stats/', views.cache_stats, name='cache_stats'),                       # /quizzes/cache-stats/
+    path('export/<str:kind>/', views.export_data, name='export_data'),                 # /quizzes/export/answers/?format=ndjson
 ]
\ No newline at end of file
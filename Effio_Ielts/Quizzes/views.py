@@ -1,21 +1,47 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import json
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_POST
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.contrib import messages
-from django.db.models import Avg, Count, Q
-from .models import Quiz, Question, Choice, QuizAttempt, QuizAnswer
-import random
-from datetime import timedelta, datetime
+from .models import Quiz, QuizAttempt, QuizAnswer
+from .analytics import build_analytics, collect_quiz_counts, get_snapshot, question_time_percentiles
+from .ranking import aattempt_rank, aleaderboard_page, attempt_rank, auser_rank
+from .rollups import get_user_rollup
+from .pagination import keyset_page
+from .caching import cache_anonymous_page, cache_metrics, get_result_bundle, render_quiz_cards, render_quiz_summary
+from .paper import get_paper, shuffled_paper
+from .progress import asave_answers, astart_attempt, finish_attempt
+from . import exports
+
+QUIZZES_PER_PAGE = 12
 
 # Public view - anyone can see the list
+@cache_anonymous_page('quiz_list')
 def quiz_list(request):
-    quizzes = Quiz.objects.all()  # Get all quizzes from database
-    return render(request, 'quizzes/quiz_list.html', {'quizzes': quizzes})
+    # Card data is annotated in the same query; pages follow a (created_at, id) cursor
+    quizzes, next_cursor = keyset_page(
+        Quiz.objects.with_card_data(),
+        cursor=request.GET.get('after'),
+        per_page=QUIZZES_PER_PAGE
+    )
+    
+    context = {
+        'quizzes': quizzes,
+        'cards': render_quiz_cards(quizzes),
+        'next_cursor': next_cursor,
+        'is_first_page': 'after' not in request.GET
+    }
+    
+    return render(request, 'quizzes/quiz_list.html', context)
 
 # Public view - anyone can see details
 def quiz_detail(request, quiz_id):
-    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    quiz = get_object_or_404(Quiz.objects.with_stats(), pk=quiz_id)
     
     # Get user's previous attempts if logged in
     user_attempts = []
@@ -28,12 +54,12 @@ def quiz_detail(request, quiz_id):
     # Get quiz statistics
     stats = {
         'total_attempts': quiz.get_total_attempts(),
-        'average_score': round(quiz.get_average_score(), 1),
-        'total_questions': quiz.questions.count()
+        'average_score': round(quiz.get_average_score(), 1)
     }
     
     context = {
         'quiz': quiz,
+        'summary': render_quiz_summary(quiz),  # Cached, includes the question count
         'user_attempts': user_attempts,
         'stats': stats
     }
@@ -41,93 +67,39 @@ def quiz_detail(request, quiz_id):
     return render(request, 'quizzes/quiz_detail.html', context)
 
 # Protected view - login required
+# Async: the ORM work runs through the async ORM or sync_to_async, so under
+# ASGI a submission waiting on the database does not hold a worker thread
 @login_required
-def take_quiz(request, quiz_id):
-    quiz = get_object_or_404(Quiz, pk=quiz_id)
-    
-    # Store start time in session if not already set
-    if 'quiz_start_time' not in request.session:
-        request.session['quiz_start_time'] = timezone.now().isoformat()
+async def take_quiz(request, quiz_id):
+    quiz = await aget_object_or_404(Quiz, pk=quiz_id)
+    user = await request.auser()
     
     if request.method == 'POST':
-        # Calculate time taken
-        start_time_str = request.session.get('quiz_start_time')
-        if start_time_str:
-            start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-            if timezone.is_naive(start_time):
-                start_time = timezone.make_aware(start_time)
-            time_taken = timezone.now() - start_time
-        else:
-            start_time = timezone.now()
-            time_taken = timedelta(0)
-        
-        # Create quiz attempt
-        attempt = QuizAttempt.objects.create(
-            user=request.user,
-            quiz=quiz,
-            score=0,  # Will be updated below
-            total_questions=quiz.questions.count(),
-            percentage_score=0,  # Will be updated below
-            time_taken=time_taken,
-            started_at=start_time,
+        # Grade the submission, timed from the in-progress attempt, and close
+        # that attempt (one transaction, which the async ORM cannot open yet)
+        attempt = await sync_to_async(finish_attempt)(
+            quiz,
+            user,
+            request.POST,
             ip_address=get_client_ip(request)
         )
         
-        # Process each question and create detailed answers
-        score = 0
-        total_questions = quiz.questions.count()
-        
-        for question in quiz.questions.all():
-            selected_choice_id = request.POST.get(f'question_{question.id}')
-            selected_choice = None
-            is_correct = False
-            
-            if selected_choice_id:
-                try:
-                    selected_choice = Choice.objects.get(id=selected_choice_id)
-                    # Increment vote count for analytics
-                    selected_choice.votes += 1
-                    selected_choice.save()
-                    
-                    # Check if answer is correct
-                    is_correct = selected_choice.is_correct
-                    if is_correct:
-                        score += 1
-                        
-                except Choice.DoesNotExist:
-                    pass
-            
-            # Create detailed answer record
-            QuizAnswer.objects.create(
-                attempt=attempt,
-                question=question,
-                selected_choice=selected_choice,
-                is_correct=is_correct
-            )
-        
-        # Update attempt with final scores
-        percentage_score = (score / total_questions * 100) if total_questions > 0 else 0
-        attempt.score = score
-        attempt.percentage_score = percentage_score
-        attempt.save()
-        
-        # Clear start time from session
-        if 'quiz_start_time' in request.session:
-            del request.session['quiz_start_time']
-        
         # Add success message
-        messages.success(request, f'Quiz completed! You scored {score}/{total_questions} ({percentage_score:.1f}%)')
+        messages.success(request, f'Quiz completed! You scored {attempt.score}/{attempt.total_questions} ({attempt.percentage_score:.1f}%)')
         
         return redirect('quizzes:quiz_results', quiz_id=quiz.id, attempt_id=attempt.id)
     
-    # GET request - show quiz form
-    questions = quiz.questions.all()
+    # GET request - start (or resume) the attempt; its start time lives in
+    # the database, per quiz, instead of the session
+    in_progress = await astart_attempt(user, quiz)
     
-    # Randomize choices for each question
+    # Show quiz form from the cached, compiled paper
+    # Choices are shuffled per student and attempt, stable across reloads
+    seed = f"{user.id}:{quiz.id}:{in_progress.started_at.isoformat()}"
+    questions = shuffled_paper(await sync_to_async(get_paper)(quiz), seed)
+    # Answers autosaved before a reload or dropped connection
     for question in questions:
-        choices = list(question.choices.all())
-        random.shuffle(choices)  # This is where you randomize!
-        question.shuffled_choices = choices
+        question['saved_choice_id'] = in_progress.saved_answers.get(question['id'])
     
     context = {
         'quiz': quiz,
@@ -135,40 +107,69 @@ def take_quiz(request, quiz_id):
         'total_questions': len(questions)
     }
     
-    return render(request, 'quizzes/take_quiz.html', context)
+    return await sync_to_async(render)(request, 'quizzes/take_quiz.html', context)
 
-# Protected view - login required  
+# Autosave of answer changes sent by the exam page in debounced batches, as
+# JSON: {"answers": {"<question_id>": <choice_id or null>, ...}}, or as a
+# beacon form post whose "answers" field holds the inner JSON object
 @login_required
-def quiz_results(request, quiz_id, attempt_id):
-    quiz = get_object_or_404(Quiz, pk=quiz_id)
-    attempt = get_object_or_404(QuizAttempt, pk=attempt_id, user=request.user, quiz=quiz)
+@require_POST
+async def autosave_answers(request, quiz_id):
+    quiz = await aget_object_or_404(Quiz, pk=quiz_id)
     
-    # Get detailed answers for review
-    answers = QuizAnswer.objects.filter(attempt=attempt).select_related(
-        'question', 'selected_choice'
-    ).order_by('question__created_at')
+    try:
+        if request.content_type == 'application/json':
+            answers = json.loads(request.body)['answers']
+        else:
+            answers = json.loads(request.POST['answers'])
+        answers = {
+            int(question_id): None if choice_id is None else int(choice_id)
+            for question_id, choice_id in answers.items()
+        }
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'error': 'Expected {"answers": {"<question_id>": <choice_id or null>}}'}, status=400)
     
-    # Calculate detailed statistics
-    stats = {
-        'correct_answers': attempt.score,
-        'total_questions': attempt.total_questions,
-        'percentage': attempt.percentage_score,
-        'grade': attempt.grade_letter,
-        'performance_level': attempt.performance_label,
-        'time_taken': attempt.time_taken,
-        'rank': get_user_rank(attempt)
-    }
+    paper = await sync_to_async(get_paper)(quiz)
+    result = await asave_answers(await request.auser(), quiz, paper, answers)
+    if result is None:
+        # Submitted already (or never opened): nothing to save into
+        return JsonResponse({'error': 'This quiz is not in progress', 'saved': 0}, status=409)
     
-    # Get user's attempt history for this quiz
-    user_attempts = QuizAttempt.objects.filter(
-        user=request.user,
-        quiz=quiz
-    ).order_by('-completed_at')
+    saved, ignored = result
+    return JsonResponse({'saved': saved, 'ignored': ignored})
+
+# Protected view - login required  
+@login_required
+async def quiz_results(request, quiz_id, attempt_id):
+    user = await request.auser()
+    attempt = await aget_object_or_404(
+        QuizAttempt.objects.select_related('quiz'),
+        pk=attempt_id,
+        user=user,
+        quiz_id=quiz_id
+    )
+    quiz = attempt.quiz
     
-    # Improvement analysis
+    # Statistics and the rendered answer review are cached per attempt
+    bundle = await sync_to_async(get_result_bundle)(attempt)
+    stats = dict(bundle['stats'], rank=await aattempt_rank(attempt))
+    
+    # Get user's recent attempts at this quiz (newest first)
+    user_attempts = [
+        item async for item in QuizAttempt.objects.filter(
+            user=user,
+            quiz=quiz
+        ).order_by('-completed_at')[:10]
+    ]
+    
+    # Improvement analysis against the attempt taken just before this one
     improvement_data = None
-    if user_attempts.count() > 1:
-        previous_attempt = user_attempts[1]  # Second most recent
+    previous_attempt = await QuizAttempt.objects.filter(
+        user=user,
+        quiz=quiz,
+        completed_at__lt=attempt.completed_at
+    ).order_by('-completed_at').afirst()
+    if previous_attempt is not None:
         improvement_data = {
             'previous_score': previous_attempt.percentage_score,
             'current_score': attempt.percentage_score,
@@ -178,111 +179,131 @@ def quiz_results(request, quiz_id, attempt_id):
     context = {
         'quiz': quiz,
         'attempt': attempt,
-        'answers': answers,
+        'answers_pending': bundle['pending'],
+        'answers_html': bundle['answers_html'],
         'stats': stats,
         'user_attempts': user_attempts,
         'improvement_data': improvement_data
     }
     
-    return render(request, 'quizzes/results.html', context)
+    # Templates may still touch lazy objects (request.user), so render off the event loop
+    return await sync_to_async(render)(request, 'quizzes/results.html', context)
 
 # Analytics view for performance analysis
 @login_required
 def quiz_analytics(request, quiz_id):
-    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    quiz = get_object_or_404(Quiz.objects.select_related('analytics_snapshot'), pk=quiz_id)
     
-    # Overall quiz statistics
-    total_attempts = QuizAttempt.objects.filter(quiz=quiz).count()
-    avg_score = QuizAttempt.objects.filter(quiz=quiz).aggregate(
-        avg_score=Avg('percentage_score')
-    )['avg_score'] or 0
+    # Served from the materialized snapshot; staff can ask for live numbers with ?fresh=1
+    if request.GET.get('fresh') == '1' and request.user.is_staff:
+        counts = collect_quiz_counts(quiz)
+        question_times = question_time_percentiles(QuizAnswer.objects.filter(question__quiz=quiz))
+        snapshot_at = None
+    else:
+        snapshot = get_snapshot(quiz)
+        counts = snapshot.counts
+        question_times = snapshot.question_times
+        snapshot_at = snapshot.refreshed_at
     
-    # Question-level analytics
-    questions_data = []
-    for question in quiz.questions.all():
-        # Get success rate for this question
-        total_answers = QuizAnswer.objects.filter(question=question).count()
-        correct_answers = QuizAnswer.objects.filter(question=question, is_correct=True).count()
-        success_rate = (correct_answers / total_answers * 100) if total_answers > 0 else 0
-        
-        # Get choice distribution
-        choices_data = []
-        for choice in question.choices.all():
-            choice_count = QuizAnswer.objects.filter(
-                question=question, 
-                selected_choice=choice
-            ).count()
-            percentage = (choice_count / total_answers * 100) if total_answers > 0 else 0
-            
-            choices_data.append({
-                'text': choice.text,
-                'count': choice_count,
-                'percentage': round(percentage, 1),
-                'is_correct': choice.is_correct
-            })
-        
-        questions_data.append({
-            'question': question,
-            'success_rate': round(success_rate, 1),
-            'total_answers': total_answers,
-            'choices': choices_data
-        })
+    context = build_analytics(quiz, counts, question_times)
+    context['snapshot_at'] = snapshot_at
     
-    # Performance distribution
-    performance_distribution = {
-        'excellent': QuizAttempt.objects.filter(quiz=quiz, percentage_score__gte=90).count(),
-        'good': QuizAttempt.objects.filter(quiz=quiz, percentage_score__gte=80, percentage_score__lt=90).count(),
-        'average': QuizAttempt.objects.filter(quiz=quiz, percentage_score__gte=70, percentage_score__lt=80).count(),
-        'below_average': QuizAttempt.objects.filter(quiz=quiz, percentage_score__gte=60, percentage_score__lt=70).count(),
-        'poor': QuizAttempt.objects.filter(quiz=quiz, percentage_score__lt=60).count(),
-    }
+    return render(request, 'quizzes/analytics.html', context)
+
+# Leaderboard of each user's best attempt, as JSON
+@login_required
+async def quiz_leaderboard(request, quiz_id):
+    quiz = await aget_object_or_404(Quiz, pk=quiz_id)
     
-    context = {
-        'quiz': quiz,
-        'total_attempts': total_attempts,
-        'avg_score': round(avg_score, 1),
-        'questions_data': questions_data,
-        'performance_distribution': performance_distribution
-    }
+    try:
+        per_page = min(100, max(1, int(request.GET.get('per_page', 20))))
+    except ValueError:
+        per_page = 20
     
-    return render(request, 'quizzes/analytics.html', context)
+    # Pages follow a (best_score, achieved_at, id) cursor
+    entries, total_users, next_cursor = await aleaderboard_page(
+        quiz,
+        cursor=request.GET.get('after'),
+        per_page=per_page
+    )
+    
+    return JsonResponse({
+        'quiz': quiz.id,
+        'per_page': per_page,
+        'total_users': total_users,
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor,
+        'your_rank': await auser_rank(quiz, await request.auser()),
+        'entries': [
+            {
+                'rank': entry.rank,
+                'username': entry.user.username,
+                'best_score': float(entry.best_score),
+                'achieved_at': entry.achieved_at.isoformat(),
+            }
+            for entry in entries
+        ]
+    })
 
 # User dashboard showing quiz history
 @login_required
 def user_dashboard(request):
     # Get user's quiz attempts
-    recent_attempts = QuizAttempt.objects.filter(
+    recent_attempts = list(QuizAttempt.objects.filter(
         user=request.user
-    ).select_related('quiz').order_by('-completed_at')[:10]
+    ).select_related('quiz').order_by('-completed_at')[:10])
     
-    # Calculate user statistics
-    total_quizzes_taken = QuizAttempt.objects.filter(user=request.user).values('quiz').distinct().count()
-    total_attempts = QuizAttempt.objects.filter(user=request.user).count()
-    avg_score = QuizAttempt.objects.filter(user=request.user).aggregate(
-        avg_score=Avg('percentage_score')
-    )['avg_score'] or 0
+    # User statistics, best and worst attempts from the rollup row (one query)
+    rollup = get_user_rollup(request.user)
     
     # Get performance trend (last 10 attempts)
-    performance_trend = list(recent_attempts.values_list('percentage_score', flat=True))
-    
-    # Best and worst performances
-    best_attempt = QuizAttempt.objects.filter(user=request.user).order_by('-percentage_score').first()
-    worst_attempt = QuizAttempt.objects.filter(user=request.user).order_by('percentage_score').first()
+    performance_trend = [attempt.percentage_score for attempt in recent_attempts]
     
     context = {
         'recent_attempts': recent_attempts,
         'stats': {
-            'total_quizzes_taken': total_quizzes_taken,
-            'total_attempts': total_attempts,
-            'avg_score': round(avg_score, 1),
+            'total_quizzes_taken': rollup.quizzes_taken,
+            'total_attempts': rollup.attempt_count,
+            'avg_score': round(rollup.average_score, 1),
             'performance_trend': performance_trend
         },
-        'best_attempt': best_attempt,
-        'worst_attempt': worst_attempt
+        'best_attempt': rollup.best_attempt,
+        'worst_attempt': rollup.worst_attempt
     }
     
     return render(request, 'quizzes/user_dashboard.html', context)
 
+# Cache hit/miss counters of this worker process, for monitoring
+@staff_member_required
+async def cache_stats(request):
+    return JsonResponse({'caches': cache_metrics()})
+
+# Streaming attempt/answer export for analysts, e.g.
+# /quizzes/export/answers/?format=ndjson&quiz=3&since=2025-01-01&until=2025-03-31
+@staff_member_required
+def export_data(request, kind):
+    if kind not in exports.COLUMNS:
+        return HttpResponseBadRequest('Unknown export')
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest('Unknown format')
+    try:
+        filters = {
+            'quiz_id': int(request.GET['quiz']) if request.GET.get('quiz') else None,
+            'since': exports.parse_bound(request.GET.get('since')),
+            'until': exports.parse_bound(request.GET.get('until'), end=True),
+        }
+    except ValueError:
+        return HttpResponseBadRequest('Invalid quiz or date')
+    
+    response = StreamingHttpResponse(
+        exports.export_rows(kind, fmt, **filters),
+        content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    )
+    filename = f"{kind}-{timezone.now():%Y%m%d-%H%M}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 # Helper functions
 def get_client_ip(request):
     """Get the client's IP address"""
@@ -295,8 +316,4 @@ def get_client_ip(request):
 
 def get_user_rank(attempt):
     """Get user's rank compared to other users for this quiz"""
-    better_attempts = QuizAttempt.objects.filter(
-        quiz=attempt.quiz,
-        percentage_score__gt=attempt.percentage_score
-    ).count()
-    return better_attempts + 1
+    return attempt_rank(attempt)
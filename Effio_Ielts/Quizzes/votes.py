@@ -0,0 +1,84 @@
+"""
+Contention-free vote counting for choices.
+
+Submissions never touch ``Choice`` rows directly. Each submission picks one
+of ``VOTE_COUNTER_SHARDS`` counter shards at random and increments it with a
+single atomic UPDATE, so concurrent submitters of the same quiz spread their
+row locks over several rows instead of queueing on the popular choices.
+``fold_votes`` (run by ``manage.py fold_choice_votes``) periodically moves
+the shard totals into ``Choice.votes``.
+"""
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Choice, ChoiceVoteShard
+
+
+def get_shard_count():
+    """Number of counter shards per choice."""
+    return max(1, getattr(settings, 'VOTE_COUNTER_SHARDS', 8))
+
+
+def _increments(column, amounts):
+    """Build ``CASE`` expression adding ``amounts[pk]`` to each row, grouped by amount."""
+    groups = defaultdict(list)
+    for pk, amount in amounts.items():
+        groups[amount].append(pk)
+    return Case(
+        *[When(**{f'{column}__in': pks}, then=Value(amount)) for amount, pks in groups.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def record_votes(choice_ids):
+    """
+    Count one vote for every choice id given (repeated ids count repeatedly).
+
+    Costs two statements regardless of how many choices are voted for: an
+    ``INSERT ... ON CONFLICT DO NOTHING`` making sure the shard rows exist and
+    one UPDATE incrementing them.
+    """
+    amounts = Counter(choice_ids)
+    if not amounts:
+        return
+
+    shard = random.randrange(get_shard_count())
+    # Sorted so concurrent submissions acquire row locks in the same order
+    ChoiceVoteShard.objects.bulk_create(
+        [ChoiceVoteShard(choice_id=choice_id, shard=shard) for choice_id in sorted(amounts)],
+        ignore_conflicts=True
+    )
+    ChoiceVoteShard.objects.filter(choice_id__in=amounts, shard=shard).update(
+        count=F('count') + _increments('choice_id', amounts)
+    )
+
+
+@transaction.atomic
+def fold_votes():
+    """
+    Move pending shard counts into ``Choice.votes``.
+
+    Shard rows are locked while they are folded, so votes recorded
+    concurrently either land before the fold (and are folded) or wait for it
+    to commit (and are folded next time). Returns the number of votes folded.
+    """
+    shards = list(
+        ChoiceVoteShard.objects.select_for_update()
+        .filter(count__gt=0)
+        .values_list('pk', 'choice_id', 'count')
+    )
+    if not shards:
+        return 0
+
+    totals = Counter()
+    for _, choice_id, count in shards:
+        totals[choice_id] += count
+
+    Choice.objects.filter(pk__in=totals).update(votes=F('votes') + _increments('pk', totals))
+    ChoiceVoteShard.objects.filter(pk__in=[pk for pk, _, _ in shards]).update(count=0)
+    return sum(totals.values())
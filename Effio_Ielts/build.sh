@@ -12,6 +12,9 @@ python manage.py collectstatic --no-input --verbosity=2
 echo "==> Running migrations..."
 python manage.py migrate
 
+echo "==> Creating cache table (if CACHE_URL is db://...)..."
+python manage.py createcachetable
+
 echo "==> Creating superuser (if needed)..."
 python manage.py create_superuser
 